@@ -9,9 +9,10 @@ from PyQt5.Qt import Qt, QTimer
 from PyQt5.QtCore import QDateTime, QSettings, QDate
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import QWidget, QLabel, QDialogButtonBox, \
-    QSizePolicy, QToolButton, QToolBar
+    QSizePolicy, QToolButton, QToolBar, QProgressBar
 
 from LeafNote.Utils import DialogBuilder
+from LeafNote.Utils.Debouncer import Debouncer
 from LeafNote.Widgets import CalendarWidget
 
 
@@ -40,6 +41,11 @@ class BarBottom(QToolBar):
         self.label_wc = None
         self.label_cc = None
         self.label_pc = None
+        self.progress_load = None
+        self.action_progress_load = None
+        self.action_cancel_load = None
+        # counts the words and paragraphs of large documents once the user stopped typing
+        self.count_debouncer = Debouncer(self.updateTextCounts, app.doc_props.count_delay)
 
         # set up the layout
         self.initUI()
@@ -80,6 +86,22 @@ class BarBottom(QToolBar):
 
         self.addSpacer()
 
+        # Create the progress of loading a large file and the button to cancel it
+        self.progress_load = QProgressBar()
+        self.progress_load.setRange(0, 100)
+        self.progress_load.setMaximumWidth(150)
+        self.progress_load.setFormat("Loading %p%")
+        self.action_progress_load = self.addWidget(self.progress_load)
+        self.action_progress_load.setVisible(False)
+        cancel_load = QToolButton()
+        cancel_load.setText(html.unescape("&times;"))
+        cancel_load.setToolTip("Stop loading the file")
+        cancel_load.clicked.connect(self.document.cancelLoading)
+        self.action_cancel_load = self.addWidget(cancel_load)
+        self.action_cancel_load.setVisible(False)
+        self.document.loading_progress.connect(self.updateLoadingProgress)
+        self.document.loading_finished.connect(self.onLoadingFinished)
+
         # Create Word Counter
         self.label_wc = createBottomBarLabel('0 Words', font_default)
         self.addWidget(self.label_wc)
@@ -93,9 +115,7 @@ class BarBottom(QToolBar):
         self.addWidget(self.label_pc)
 
         # functionality of word and character count
-        self.document.textChanged.connect(self.updateWordCount)
-        self.document.textChanged.connect(self.updateCharCount)
-        self.document.textChanged.connect(self.updateParagraphCount)
+        self.document.textChanged.connect(self.onTextChanged)
 
     def addSpacer(self):
         """
@@ -105,11 +125,56 @@ class BarBottom(QToolBar):
         spacer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.addWidget(spacer)
 
+    def updateLoadingProgress(self, loaded: int, total: int):
+        """
+        Shows how much of the file being loaded is in the document
+        :param loaded: the number of characters loaded
+        :param total: the number of characters of the file
+        :return: returns nothing
+        """
+        self.progress_load.setValue(loaded * 100 // max(total, 1))
+        self.action_progress_load.setVisible(True)
+        self.action_cancel_load.setVisible(True)
+
+    def onLoadingFinished(self):
+        """
+        Hides the loading progress and counts the loaded document
+        :return: returns nothing
+        """
+        self.action_progress_load.setVisible(False)
+        self.action_cancel_load.setVisible(False)
+        self.updateCharCount()
+        self.updateTextCounts()
+
+    def onTextChanged(self):
+        """
+        Updates the counts, words and paragraphs have to be counted from the whole text so
+        they are counted once the user stopped typing in large documents
+        :return: returns nothing
+        """
+        self.updateCharCount()
+        if self.document.document().characterCount() > self.app.doc_props.count_delay_size:
+            self.count_debouncer.trigger()
+        else:
+            self.count_debouncer.cancel()
+            self.updateTextCounts()
+
+    def updateTextCounts(self):
+        """
+        Counts the words and paragraphs
+        :return: returns nothing
+        """
+        self.updateWordCount()
+        self.updateParagraphCount()
+
     def updateWordCount(self):
         """
         Counts number of words and updates number on bottom bar
         :return: returns nothing
         """
+        # the counts are updated once the document is loaded
+        if self.document.isLoading():
+            return
         word_count = 0
         if self.document.toPlainText() != '':
             word_count = len(self.document.toPlainText().split())
@@ -121,7 +186,10 @@ class BarBottom(QToolBar):
         Counts number of characters and updates number on bottom bar
         :return: returns nothing
         """
-        char_count = len(self.document.toPlainText())
+        if self.document.isLoading():
+            return
+        # the document counts its characters plus the paragraph separator at its end
+        char_count = self.document.document().characterCount() - 1
         self.label_cc.setText(str(char_count) + " Characters")
 
     def updateParagraphCount(self):
@@ -129,6 +197,8 @@ class BarBottom(QToolBar):
         Updates the number of paragraphs
         :return: returns nothing
         """
+        if self.document.isLoading():
+            return
         text: str = self.document.toPlainText()
         par_count = len(list(filter(None, text.strip().split('\n'))))
         self.label_pc.setText(str(par_count) + " Paragraphs")
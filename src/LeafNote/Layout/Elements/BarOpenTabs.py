@@ -7,6 +7,7 @@ top bar
 import logging
 
 from PyQt5.QtCore import QFileInfo
+from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import QTabBar, QFileIconProvider
 
 
@@ -29,6 +30,8 @@ class BarOpenTabs(QTabBar):
         self.file_manager = file_manager
 
         self.open_tabs = {}
+        # hibernated_tabs - set of the paths of the open tabs whose documents are not in memory
+        self.hibernated_tabs = set()
         self.setDocumentMode(True)
         self.setTabsClosable(True)
         self.currentChanged.connect(self.openTab)
@@ -83,6 +86,7 @@ class BarOpenTabs(QTabBar):
         if path in self.open_tabs:
             # pop the closed tab from the open tab dic
             self.open_tabs.pop(path)
+        self.hibernated_tabs.discard(path)
 
     def forceCloseTab(self, path: str):
         """
@@ -91,8 +95,35 @@ class BarOpenTabs(QTabBar):
         :return: returns nothing
         """
         logging.info(path)
-        self.removeTab(self.open_tabs[path])
+        self.removeTab(self.getTabIndex(path))
         self.file_manager.closeDocument(self.document, path)
         if path in self.open_tabs:
             # pop the closed tab from the open tab dic
             self.open_tabs.pop(path)
+        self.hibernated_tabs.discard(path)
+
+    def setTabResident(self, path: str, resident: bool):
+        """
+        Greys out the tabs of hibernated documents
+        :param path: path of the tab
+        :param resident: whether or not the document of the tab is in memory
+        :return: returns nothing
+        """
+        if resident:
+            self.hibernated_tabs.discard(path)
+        else:
+            self.hibernated_tabs.add(path)
+        index = self.getTabIndex(path)
+        if index != -1:
+            self.setTabTextColor(index, QColor() if resident else QColor("gray"))
+
+    def getTabIndex(self, path: str) -> int:
+        """
+        Finds the tab of a path, the indices kept in open_tabs shift when tabs are closed
+        :param path: path of the tab
+        :return: returns the current index of the tab or -1 if it is not open
+        """
+        for index in range(self.count()):
+            if self.tabData(index) == path:
+                return index
+        return -1
@@ -9,19 +9,58 @@ import webbrowser
 import validators
 
 from PyQt5 import QtGui, QtCore
+from PyQt5.QtCore import pyqtSignal, QTimer
 from PyQt5.QtGui import QFont, QColor, QPalette, QTextCharFormat, QTextDocument, QTextListFormat
-from PyQt5.QtWidgets import QColorDialog, QTextEdit
+from PyQt5.QtWidgets import QColorDialog, QTextEdit, QPlainTextEdit, QPlainTextDocumentLayout
 from spellchecker import SpellChecker
 
 from LeafNote.Props import DocProps
 from LeafNote.Utils import SyntaxHighlighter, Summarizer
 
 
+class PlainDocument(QPlainTextEdit):
+    """
+    Edits the plain text files shown by the document, its line based layout keeps typing and
+    scrolling fast in large files
+    """
+
+    def __init__(self, document):
+        """
+        Creates the hidden plain text editor
+        :param document: reference to the document the editor belongs to
+        """
+        super().__init__()
+        logging.debug("Creating Plain Document")
+        self.document_editor = document
+        # blank_document - shown while the document shows a formatted document
+        self.blank_document = QTextDocument(self)
+        self.blank_document.setDocumentLayout(QPlainTextDocumentLayout(self.blank_document))
+        self.setDocument(self.blank_document)
+        self.hide()
+
+    def mouseDoubleClickEvent(self, e: QtGui.QMouseEvent) -> None:
+        """
+        if the double clicked word is a link open it
+        :return: returns nothing
+        """
+        if not self.document_editor.openLinkAt(self.cursorForPosition(e.pos()).position()):
+            super().mouseDoubleClickEvent(e)
+
+
 class Document(QTextEdit):
     """
     Creates the widget in the middle of the text editor
-    where the text is input and displayed
+    where the text is input and displayed.
+    Plain text documents are shown by a PlainDocument in place of the rich text editor, the
+    methods used by the rest of the application act on whichever editor is shown.
     """
+    # emitted after the editor started showing a different QTextDocument
+    text_document_changed = pyqtSignal()
+    # emitted with the number of characters loaded and the length of the file while a large
+    # file is loaded
+    loading_progress = pyqtSignal(int, int)
+    # emitted after a large file was loaded or its loading was cancelled
+    loading_finished = pyqtSignal()
 
     def __init__(self, app, doc_props):
         """
@@ -33,7 +72,16 @@ class Document(QTextEdit):
         self.app = app
         self.doc_props: DocProps = doc_props
 
-        self.highlighter = SyntaxHighlighter(self)
+        # plain_mode - whether or not the shown document is a plain text document
+        self.plain_mode = False
+        # editor_visible - false while the mapped viewer is shown in place of the editors
+        self.editor_visible = True
+        self.plain_editor = PlainDocument(self)
+        self.plain_editor.textChanged.connect(self.textChanged)
+        self.plain_editor.selectionChanged.connect(self.selectionChanged)
+        self.plain_editor.cursorPositionChanged.connect(self.cursorPositionChanged)
+        # blank_document - shown by the rich text editor while a plain text document is shown
+        self.blank_document = QTextDocument(self)
 
         # Spellchecker and set of misspelled_words
         self.spell_checker = SpellChecker()
@@ -42,6 +90,23 @@ class Document(QTextEdit):
         self.spellcheck_enabled = self.doc_props.def_enable_spellcheck
         self.autocorrect_enabled = self.doc_props.def_enable_autocorrect
 
+        # large files are shown after their first chunk and the rest is appended by the timer
+        self.load_timer = QTimer(self)
+        self.load_timer.setInterval(0)
+        self.load_timer.timeout.connect(self.loadNextChunk)
+        # loads - dict of (QTextDocument : [text, position]) of the documents being loaded,
+        # every document opened while another one loads keeps loading
+        self.loads = {}
+        # partial_documents - set of QTextDocuments whose loading was cancelled, they only
+        # hold the start of their file and can not be edited or saved
+        self.partial_documents = set()
+
+        # highlighters - dict of (QTextDocument : SyntaxHighlighter) for every document
+        # shown by the editor, each document keeps its own highlighting
+        self.highlighters = {}
+        self.setDocument(self.createTextDocument())
+        self.highlighter = self.highlighters[self.document()]
+
         # If the dictionaries have been downloaded previously, check persistent settings
         self.summarizer = None
         if app.settings.contains("dictionaryPath"):
@@ -53,17 +118,24 @@ class Document(QTextEdit):
         self.onTextColorChanged(list(self.doc_props.dict_colors.keys())
                                 .index(self.doc_props.def_text_color_key))
         self.setPlaceholderText(self.doc_props.def_placeholder_text)
+        self.plain_editor.setPlaceholderText(self.doc_props.def_placeholder_text)
 
     def mouseDoubleClickEvent(self, e: QtGui.QMouseEvent) -> None:
         """
         if the double clicked word is a link open it
         :return: returns nothing
         """
-        logging.debug("User double-clicked in document")
         # get the cursor where the user double clicked
-        cursor = self.cursorForPosition(e.pos())
-        pos = cursor.position()
+        if not self.openLinkAt(self.cursorForPosition(e.pos()).position()):
+            super().mouseDoubleClickEvent(e)
 
+    def openLinkAt(self, pos: int) -> bool:
+        """
+        Opens the word at the position if it is a link
+        :param pos: the position in the document
+        :return: returns whether or not a link was opened
+        """
+        logging.debug("User double-clicked in document")
         # get the selected words position and full word
         _, _, url = self._getWordFromPos(pos)
 
@@ -74,31 +146,31 @@ class Document(QTextEdit):
         if valid:
             webbrowser.open(url)
             logging.info("User opened link - %s", url)
-            return
-
-        super().mouseDoubleClickEvent(e)
+            return True
+        return False
 
     def _getWordFromPos(self, pos):
         """
-        this get the word at the selected position
+        this get the word at the selected position, words never span paragraphs so only the
+        paragraph holding the position is searched instead of the whole document
         :param pos: the position in the document
         :return: returns a tuple of the start and end position as well as the word
         """
-        # get the start and end index of the current selection
-        start = self.toPlainText().rfind(" ", 0, pos) + 1
-        new_line = self.toPlainText().rfind("\n", 0, pos) + 1
-        start = start if start > new_line else new_line
+        block = self.document().findBlock(max(pos, 0))
+        text = block.text()
+        offset = block.position()
+        pos = min(max(pos - offset, 0), len(text))
 
-        end = self.toPlainText().find(" ", pos)
-        new_line = self.toPlainText().find("\n", pos)
-        end = end if end > new_line else new_line
+        # get the start and end index of the current selection within the paragraph
+        start = text.rfind(" ", 0, pos) + 1
+        end = text.find(" ", pos)
 
         # fix the indices if they are equal to -1
-        end = len(self.toPlainText()) if end == -1 else end
+        end = len(text) if end == -1 else end
 
         # get the selected word
-        word = self.toPlainText()[start:end]
-        return start, end, word
+        word = text[start:end]
+        return offset + start, offset + end, word
 
     def onFontItalChanged(self, is_italic: bool):
         """
@@ -199,6 +271,7 @@ class Document(QTextEdit):
         palette.setColor(QPalette.Inactive, QPalette.Base, QColor(color_str))
 
         self.setPalette(palette)
+        self.plain_editor.setPalette(palette)
 
     def fontBold(self) -> bool:
         """
@@ -426,15 +499,380 @@ class Document(QTextEdit):
         listFormat.setStyle(style)
         cursor.createList(listFormat)
 
+    def createTextDocument(self, plain: bool = False) -> QTextDocument:
+        """
+        Creates an empty document that can be shown by the editor
+        :param plain: whether or not the document is edited by the plain text editor
+        :return: returns the new document
+        """
+        text_document = QTextDocument()
+        if plain:
+            text_document.setDocumentLayout(QPlainTextDocumentLayout(text_document))
+        text_document.setDefaultFont(self.document().defaultFont())
+        self.highlighters[text_document] = SyntaxHighlighter(self, text_document)
+        return text_document
+
+    def setTextDocument(self, text_document: QTextDocument, view_state: tuple = None):
+        """
+        Shows the given document in the editor without copying or re-parsing its contents,
+        so it keeps its own undo history
+        :param text_document: a document created by createTextDocument
+        :param view_state: the cursor and scroll positions returned by getViewState
+        :return: returns nothing
+        """
+        if text_document is self.document():
+            return
+        logging.debug("Switching text document")
+        # the editor that is not shown holds a blank document, so no editor keeps a document
+        # that may be released
+        self.plain_mode = self.isPlainTextDocument(text_document)
+        if self.plain_mode:
+            self.setDocument(self.blank_document)
+            self.plain_editor.setDocument(text_document)
+        else:
+            self.plain_editor.setDocument(self.plain_editor.blank_document)
+            self.setDocument(text_document)
+        self.highlighter = self.highlighters[text_document]
+        self.updateEditorVisibility()
+        if view_state is not None:
+            self.setViewState(view_state)
+        self.updateReadOnly()
+        if self.isLoading():
+            text, position = self.loads[text_document]
+            self.loading_progress.emit(position, len(text))
+        self.text_document_changed.emit()
+
+    @staticmethod
+    def isPlainTextDocument(text_document: QTextDocument) -> bool:
+        """
+        :return: returns whether or not the document was created for the plain text editor
+        """
+        return isinstance(text_document.documentLayout(), QPlainTextDocumentLayout)
+
+    def setEditorVisible(self, visible: bool):
+        """
+        Shows or hides the editor of the shown document
+        :param visible: false while another widget is shown in place of the editors
+        :return: returns nothing
+        """
+        self.editor_visible = visible
+        self.updateEditorVisibility()
+
+    def updateEditorVisibility(self):
+        """
+        Shows the editor of the shown document and hides the other one
+        :return: returns nothing
+        """
+        has_focus = self.hasFocus() or self.plain_editor.hasFocus()
+        self.setVisible(self.editor_visible and not self.plain_mode)
+        self.plain_editor.setVisible(self.editor_visible and self.plain_mode)
+        if has_focus:
+            self.getEditor().setFocus()
+
+    def getEditor(self):
+        """
+        :return: returns the widget editing the shown document
+        """
+        return self.plain_editor if self.plain_mode else self
+
+    def document(self) -> QTextDocument:
+        """
+        :return: returns the shown document
+        """
+        if self.plain_mode:
+            return self.plain_editor.document()
+        return super().document()
+
+    def textCursor(self) -> QtGui.QTextCursor:
+        """
+        :return: returns a copy of the cursor of the shown document
+        """
+        if self.plain_mode:
+            return self.plain_editor.textCursor()
+        return super().textCursor()
+
+    def setTextCursor(self, cursor: QtGui.QTextCursor):
+        """
+        Moves the cursor of the shown document
+        :param cursor: a cursor of the shown document
+        :return: returns nothing
+        """
+        if self.plain_mode:
+            self.plain_editor.setTextCursor(cursor)
+        else:
+            super().setTextCursor(cursor)
+
+    def toPlainText(self) -> str:
+        """
+        :return: returns the text of the shown document
+        """
+        if self.plain_mode:
+            return self.plain_editor.toPlainText()
+        return super().toPlainText()
+
+    def toHtml(self) -> str:
+        """
+        :return: returns the shown document as html
+        """
+        if self.plain_mode:
+            return self.plain_editor.document().toHtml()
+        return super().toHtml()
+
+    def setPlainText(self, text: str):
+        """
+        Replaces the text of the shown document
+        :param text: the plain text
+        :return: returns nothing
+        """
+        if self.plain_mode:
+            self.plain_editor.setPlainText(text)
+        else:
+            super().setPlainText(text)
+
+    def setText(self, text: str):
+        """
+        Replaces the text of the shown document, html is only parsed by the rich text editor
+        :param text: the plain text or html
+        :return: returns nothing
+        """
+        if self.plain_mode:
+            self.plain_editor.setPlainText(text)
+        else:
+            super().setText(text)
+
+    def insertPlainText(self, text: str):
+        """
+        Inserts text at the cursor of the shown document
+        :param text: the plain text
+        :return: returns nothing
+        """
+        if self.plain_mode:
+            self.plain_editor.insertPlainText(text)
+        else:
+            super().insertPlainText(text)
+
+    def find(self, *args) -> bool:
+        """
+        Finds text in the shown document and selects it
+        :return: returns whether or not the text was found
+        """
+        if self.plain_mode:
+            return self.plain_editor.find(*args)
+        return super().find(*args)
+
+    def isReadOnly(self) -> bool:
+        """
+        :return: returns whether or not the shown document can be edited
+        """
+        return self.getEditor().isReadOnly()
+
+    def horizontalScrollBar(self):
+        """
+        :return: returns the horizontal scroll bar of the editor of the shown document
+        """
+        if self.plain_mode:
+            return self.plain_editor.horizontalScrollBar()
+        return super().horizontalScrollBar()
+
+    def verticalScrollBar(self):
+        """
+        :return: returns the vertical scroll bar of the editor of the shown document, the one
+        of the plain text editor scrolls by lines
+        """
+        if self.plain_mode:
+            return self.plain_editor.verticalScrollBar()
+        return super().verticalScrollBar()
+
+    def print_(self, printer):
+        """
+        Prints the shown document
+        :param printer: the printer to print to
+        :return: returns nothing
+        """
+        if self.plain_mode:
+            self.plain_editor.print_(printer)
+        else:
+            super().print_(printer)
+
+    def releaseTextDocument(self, text_document: QTextDocument):
+        """
+        Forgets a document that will not be shown again
+        :param text_document: a document created by createTextDocument
+        :return: returns nothing
+        """
+        self.stopLoading(text_document)
+        if text_document is not self.document():
+            self.highlighters.pop(text_document, None)
+
+    def getViewState(self) -> tuple:
+        """
+        :return: returns the (anchor, position, horizontal scroll, vertical scroll) of the
+        cursor and the scroll bars
+        """
+        cursor = self.textCursor()
+        return (cursor.anchor(), cursor.position(), self.horizontalScrollBar().value(),
+                self.verticalScrollBar().value())
+
+    def setViewState(self, view_state: tuple):
+        """
+        Restores the cursor and the scroll bars
+        :param view_state: the state returned by getViewState
+        :return: returns nothing
+        """
+        anchor, position, horizontal, vertical = view_state
+        last = self.document().characterCount() - 1
+        cursor = self.textCursor()
+        cursor.setPosition(min(anchor, last))
+        cursor.setPosition(min(position, last), QtGui.QTextCursor.KeepAnchor)
+        self.setTextCursor(cursor)
+        self.horizontalScrollBar().setValue(horizontal)
+        self.verticalScrollBar().setValue(vertical)
+
     def setFormatText(self, text: str, formatting: bool):
         """
-        Sets formatted or not text
+        Sets formatted or not text, plain text larger than the progressive load size is
+        loaded in chunks
         """
+        self.stopLoading()
         self.enableFormatting(formatting)
+        if not formatting and len(text) > self.doc_props.progressive_load_size:
+            self.loadProgressively(text)
+            return
         self.setText(text)
-        if not formatting:
+        # plain text documents only hold the default format
+        if not formatting and not self.plain_mode:
+            self.clearAllFormatting()
+
+    def loadProgressively(self, text: str):
+        """
+        Shows the first chunk of the plain text right away and appends the rest in chunks from
+        the event loop, the editor is read only until the whole text is loaded
+        :param text: the plain text to load
+        :return: returns nothing
+        """
+        logging.info("Loading %d characters progressively", len(text))
+        first = min(len(text), self.doc_props.load_chunk_size)
+        self.setPlainText(text[:first])
+        if not self.plain_mode:
             self.clearAllFormatting()
 
+        text_document = self.document()
+        self.loads[text_document] = [text, first]
+        # the appended chunks are not edits the user can undo
+        text_document.setUndoRedoEnabled(False)
+        self.updateReadOnly()
+        self.loading_progress.emit(first, len(text))
+        self.load_timer.start()
+
+    def loadNextChunk(self):
+        """
+        Appends the next chunk of the text being loaded into the shown document, or into
+        another document being loaded if the shown one is loaded
+        :return: returns nothing
+        """
+        if not self.loads:
+            self.load_timer.stop()
+            return
+        text_document = self.document()
+        if text_document not in self.loads:
+            text_document = next(iter(self.loads))
+        load = self.loads[text_document]
+        text, position = load
+        end = min(len(text), position + self.doc_props.load_chunk_size)
+        # appending is not a change to save, keep the modified flag as it was
+        modified = text_document.isModified()
+        cursor = QtGui.QTextCursor(text_document)
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText(text[position:end], QTextCharFormat())
+        text_document.setModified(modified)
+        load[1] = end
+        if text_document is self.document():
+            self.loading_progress.emit(end, len(text))
+        if end == len(text):
+            self.finishLoading(text_document)
+
+    def finishLoading(self, text_document: QTextDocument, cancelled: bool = False):
+        """
+        Ends loading the text of a document
+        :param text_document: the document being loaded
+        :param cancelled: whether or not the rest of the text was dropped
+        :return: returns nothing
+        """
+        _, position = self.loads.pop(text_document)
+        if not self.loads:
+            self.load_timer.stop()
+        text_document.setUndoRedoEnabled(True)
+        if cancelled:
+            logging.info("Loading cancelled after %d characters", position)
+            self.partial_documents.add(text_document)
+        if text_document is not self.document():
+            return
+        # check the whole text once, the word under the cursor is not checked for every block
+        # while the document is loading
+        if self.spellcheck_enabled:
+            self.spellCheckAll()
+        self.updateReadOnly()
+        self.loading_finished.emit()
+
+    def loadRemaining(self):
+        """
+        Appends the rest of the text being loaded into the shown document right away
+        :return: returns nothing
+        """
+        while self.isLoading():
+            self.loadNextChunk()
+
+    def cancelLoading(self):
+        """
+        Stops loading the text of the shown document and keeps the part that was loaded, which
+        can not be saved
+        :return: returns nothing
+        """
+        if self.isLoading():
+            self.finishLoading(self.document(), True)
+
+    def stopLoading(self, text_document: QTextDocument = None):
+        """
+        Stops loading a document whose contents are replaced or dropped and forgets whether it
+        was loaded partially
+        :param text_document: the document, the shown one if None
+        :return: returns nothing
+        """
+        if text_document is None:
+            text_document = self.document()
+        self.partial_documents.discard(text_document)
+        if text_document in self.loads:
+            self.finishLoading(text_document)
+        else:
+            self.updateReadOnly()
+
+    def isLoading(self, text_document: QTextDocument = None) -> bool:
+        """
+        :param text_document: the document, the shown one if None
+        :return: returns whether or not the document is still being loaded
+        """
+        if text_document is None:
+            text_document = self.document()
+        return text_document in self.loads
+
+    def isPartial(self, text_document: QTextDocument = None) -> bool:
+        """
+        :param text_document: the document, the shown one if None
+        :return: returns whether or not the document only holds the start of its file
+        """
+        if text_document is None:
+            text_document = self.document()
+        return text_document in self.partial_documents
+
+    def updateReadOnly(self):
+        """
+        Makes the editor read only while the shown document is loading or partially loaded
+        :return: returns nothing
+        """
+        read_only = self.isLoading() or self.isPartial()
+        self.setReadOnly(read_only)
+        self.plain_editor.setReadOnly(read_only)
+
     def enableFormatting(self, enable: bool = True):
         """
         Sets formatting enabled or disabled
@@ -457,7 +895,10 @@ class Document(QTextEdit):
         Overload undo to be able to undo autocorrect
         """
         self.blockSignals(True)
-        super().undo()
+        if self.plain_mode:
+            self.plain_editor.undo()
+        else:
+            super().undo()
         self.blockSignals(False)
 
     def redo(self):
@@ -465,7 +906,10 @@ class Document(QTextEdit):
         Overload undo to be able to undo autocorrect
         """
         self.blockSignals(True)
-        super().redo()
+        if self.plain_mode:
+            self.plain_editor.redo()
+        else:
+            super().redo()
         self.blockSignals(False)
 
     def toggle_spellcheck(self, enabled: bool):
@@ -490,6 +934,9 @@ class Document(QTextEdit):
         grabs current word in text document and runs a spell checker
         :return: returns nothing
         """
+        # the whole document is checked once loading finished
+        if self.isLoading():
+            return
         cursor = self.textCursor()
         pos = cursor.position()
         _, _, tmp = self._getWordFromPos(pos)
@@ -546,7 +993,8 @@ class Document(QTextEdit):
         """
         if self.spellcheck_enabled:
             logging.debug("Re-checking entire document to re-construct misspelled words dictionary")
-            all_words = self.toPlainText().split()
+            # every distinct word is checked once
+            all_words = set(self.toPlainText().split())
             self.misspelled_words = self.spell_checker.unknown(all_words)
             logging.debug(self.misspelled_words)
         elif self.misspelled_words:
@@ -0,0 +1,262 @@
+"""
+This module holds the read only viewer of files that are too large to be opened in the document
+"""
+import html
+import logging
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QPainter, QColor, QFontDatabase
+from PyQt5.QtWidgets import QAbstractScrollArea, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, \
+    QToolButton, QLabel
+
+from LeafNote.Utils.MappedFile import MappedFile
+
+# pixels between the left edge of the view and the text
+MARGIN = 4
+
+
+class MappedView(QAbstractScrollArea):
+    """
+    Paints the lines of a mapped file that are visible, the vertical scroll bar moves by lines
+    """
+
+    def __init__(self):
+        """
+        Creates an empty view
+        """
+        super().__init__()
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.mapped_file = None
+        # match - the (line, column, length) of the shown match or None
+        self.match = None
+        self.text_width = 0
+
+    def setMappedFile(self, mapped_file: MappedFile):
+        """
+        Shows another file from its first line
+        :param mapped_file: the file to show or None
+        :return: returns nothing
+        """
+        self.mapped_file = mapped_file
+        self.match = None
+        self.text_width = 0
+        self.horizontalScrollBar().setRange(0, 0)
+        self.updateLineCount()
+        self.verticalScrollBar().setValue(0)
+        self.viewport().update()
+
+    def getVisibleLineCount(self) -> int:
+        """
+        :return: returns the number of lines that fit in the view
+        """
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing())
+
+    def updateLineCount(self):
+        """
+        Lets the vertical scroll bar reach the lines indexed so far
+        :return: returns nothing
+        """
+        lines = 0 if self.mapped_file is None else self.mapped_file.getLineCount()
+        visible = self.getVisibleLineCount()
+        self.verticalScrollBar().setRange(0, max(0, lines - visible))
+        self.verticalScrollBar().setPageStep(visible)
+
+    def showMatch(self, line: int, column: int, length: int):
+        """
+        Scrolls to a match and highlights it
+        :param line: the line of the match
+        :param column: the column of the match in characters
+        :param length: the length of the match in characters
+        :return: returns nothing
+        """
+        self.match = (line, column, length)
+        self.updateLineCount()
+        # the match may be past the lines indexed so far
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setMaximum(max(scroll_bar.maximum(), line))
+        visible = self.getVisibleLineCount()
+        first = scroll_bar.value()
+        if not first <= line < first + visible:
+            scroll_bar.setValue(line - visible // 2)
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        """
+        Updates the page step to the number of visible lines
+        """
+        super().resizeEvent(event)
+        self.updateLineCount()
+
+    def scrollContentsBy(self, dx, dy):
+        """
+        Repaints the lines after scrolling
+        """
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        """
+        Paints the visible lines
+        """
+        if self.mapped_file is None:
+            return
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        height = metrics.lineSpacing()
+        first = self.verticalScrollBar().value()
+        left = MARGIN - self.horizontalScrollBar().value()
+
+        lines = self.mapped_file.getLines(first, self.getVisibleLineCount() + 1)
+        for index, text in enumerate(lines):
+            top = index * height
+            if self.match is not None and self.match[0] == first + index:
+                _, column, length = self.match
+                x = left + metrics.horizontalAdvance(text[:column].expandtabs(4))
+                width = metrics.horizontalAdvance(text[column:column + length].expandtabs(4))
+                painter.fillRect(x, top, width, height, QColor("yellow"))
+            text = text.expandtabs(4)
+            painter.drawText(left, top + metrics.ascent(), text)
+            self.text_width = max(self.text_width, metrics.horizontalAdvance(text))
+        painter.end()
+
+        # the widest line painted so far sets how far the view scrolls horizontally
+        width = self.text_width + 2 * MARGIN - self.viewport().width()
+        self.horizontalScrollBar().setRange(0, max(0, width))
+        self.horizontalScrollBar().setPageStep(self.viewport().width())
+
+
+class MappedViewer(QWidget):
+    """
+    Shows a huge file read only in place of the document, with a search over its bytes
+    """
+
+    def __init__(self):
+        """
+        Creates the hidden viewer
+        """
+        super().__init__()
+        logging.debug("Creating Mapped Viewer")
+        self.mapped_file = None
+        # match_offset - the byte offset of the shown match or None
+        self.match_offset = None
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+
+        find_bar = QHBoxLayout()
+        find_bar.setContentsMargins(4, 2, 4, 2)
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText("Find in file...")
+        self.search_bar.returnPressed.connect(self.findNext)
+        self.search_bar.textChanged.connect(self.onSearchChanged)
+        find_bar.addWidget(self.search_bar)
+
+        btn_previous = QToolButton()
+        btn_previous.setText(html.unescape("&#8593;"))
+        btn_previous.setToolTip("Previous Occurrence")
+        btn_previous.clicked.connect(self.findPrevious)
+        find_bar.addWidget(btn_previous)
+        btn_next = QToolButton()
+        btn_next.setText(html.unescape("&#8595;"))
+        btn_next.setToolTip("Next Occurrence")
+        btn_next.clicked.connect(self.findNext)
+        find_bar.addWidget(btn_next)
+
+        self.label_status = QLabel()
+        find_bar.addWidget(self.label_status)
+        layout.addLayout(find_bar)
+
+        self.view = MappedView()
+        layout.addWidget(self.view)
+
+        # the scroll range and the status follow the indexing of the lines
+        self.index_timer = QTimer(self)
+        self.index_timer.setInterval(250)
+        self.index_timer.timeout.connect(self.updateIndexStatus)
+
+        self.hide()
+
+    def setMappedFile(self, mapped_file: MappedFile):
+        """
+        Shows a mapped file, hides the viewer if None
+        :param mapped_file: the file to show or None
+        :return: returns nothing
+        """
+        if mapped_file is self.mapped_file:
+            return
+        self.mapped_file = mapped_file
+        self.match_offset = None
+        self.view.setMappedFile(mapped_file)
+        self.setVisible(mapped_file is not None)
+        if mapped_file is None:
+            self.index_timer.stop()
+        else:
+            self.index_timer.start()
+        self.updateIndexStatus()
+
+    def updateIndexStatus(self):
+        """
+        Shows how far the lines are indexed
+        :return: returns nothing
+        """
+        if self.mapped_file is None:
+            return
+        self.view.updateLineCount()
+        if self.mapped_file.isIndexed():
+            self.index_timer.stop()
+            self.label_status.setText("Read only - {:,} lines".format(
+                self.mapped_file.getLineCount()))
+        else:
+            self.label_status.setText("Read only - indexing {:.0%}".format(
+                self.mapped_file.getIndexProgress()))
+
+    def onSearchChanged(self):
+        """
+        Starts the next search from the shown lines
+        :return: returns nothing
+        """
+        self.match_offset = None
+
+    def findNext(self):
+        """
+        Shows the next occurrence of the searched text
+        :return: returns nothing
+        """
+        self.find(False)
+
+    def findPrevious(self):
+        """
+        Shows the previous occurrence of the searched text
+        :return: returns nothing
+        """
+        self.find(True)
+
+    def find(self, backward: bool):
+        """
+        Searches the bytes of the file for the searched text and wraps around at its ends
+        :param backward: whether or not to search towards the start of the file
+        :return: returns whether or not the text was found
+        """
+        pattern = self.search_bar.text().encode('utf-8')
+        if self.mapped_file is None or not pattern:
+            return False
+
+        if self.match_offset is None:
+            start = self.mapped_file.getLineOffset(self.view.verticalScrollBar().value())
+        elif backward:
+            start = self.match_offset
+        else:
+            start = self.match_offset + 1
+        offset = self.mapped_file.find(pattern, start, backward)
+        if offset == -1:
+            offset = self.mapped_file.find(pattern, self.mapped_file.size if backward else 0,
+                                           backward)
+        if offset == -1:
+            logging.info("Not found in mapped file - %s", self.search_bar.text())
+            self.label_status.setText("No occurrences")
+            return False
+
+        self.match_offset = offset
+        line, column = self.mapped_file.getPosition(offset)
+        self.view.showMatch(line, column, len(self.search_bar.text()))
+        return True
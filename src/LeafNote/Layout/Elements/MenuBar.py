@@ -6,7 +6,7 @@ import logging
 from functools import partial
 
 from PyQt5.QtWidgets import QAction, QMenu
-from PyQt5.QtWidgets import QFileDialog, QMenuBar, QActionGroup
+from PyQt5.QtWidgets import QFileDialog, QMenuBar, QActionGroup, QTreeWidget, QTreeWidgetItem
 
 from LeafNote import Utils, Widgets
 from LeafNote.Layout.Elements import Document
@@ -71,6 +71,7 @@ class MenuBar(QMenuBar):
             # if the user selected a new folder
             if folder_name != "":
                 app.left_menu.updateDirectory(folder_name)
+                Utils.Encryptor.resumeCryptoJob(app, file_manager)
             else:
                 logging.info("User chose not to open folder")
 
@@ -141,6 +142,12 @@ class MenuBar(QMenuBar):
         def onFindBtn():
             """
             """
+            # huge files are searched by the find bar of the mapped viewer
+            if app.viewer.mapped_file is not None:
+                logging.info("Clicked Find Action - mapped file")
+                app.viewer.search_bar.setFocus()
+                return
+
             state_replace = app.search_and_replace.replace.isVisible()
             logging.info("Clicked Find Action - %s", str(state_replace))
             if state_replace:
@@ -251,6 +258,33 @@ class MenuBar(QMenuBar):
             makeViewAction("Fit Columns", "", left_menu.resizeColumnsToContent))
         # ========= END LEFT MENU OPTIONS SECTION =========
 
+        def onMemoryUsageAction():
+            """
+            Called on clicking memory usage action
+            """
+            logging.info("Clicked Memory Usage Action")
+            file_manager = app.file_manager
+            usage = file_manager.getMemoryUsage()
+            resident = file_manager.residency.total()
+            dialog = Utils.DialogBuilder(app, "Memory Usage", "Open Documents",
+                                         "%d of %d documents in memory using %.1f of %.1f MB"
+                                         % (sum(1 for _, r, _ in usage if r), len(usage),
+                                            resident / 2 ** 20,
+                                            file_manager.residency.budget / 2 ** 20))
+            tree = QTreeWidget()
+            tree.setHeaderLabels(["File", "State", "Size (KB)"])
+            tree.setRootIsDecorated(False)
+            for path, is_resident, size in usage:
+                tree.addTopLevelItem(QTreeWidgetItem([
+                    path, "In Memory" if is_resident else "Hibernated", "%.1f" % (size / 1024)]))
+            tree.resizeColumnToContents(0)
+            dialog.addWidget(tree)
+            dialog.setMinimumWidth(500)
+            dialog.exec()
+
+        menu_view.addSeparator()
+        menu_view.addAction(makeViewAction("Memory Usage", "", onMemoryUsageAction))
+
         # ========= END VIEW MENU SECTION =========
         return menu_view
 
@@ -77,6 +77,10 @@ class MenuLeft(QTreeView):
         self.setRootIndex(self.model.index(abs_path))
         self.sortByColumn(0, Qt.AscendingOrder)
 
+        # the decrypted files of the last workspace are not kept
+        if self.fileManager.encryptor is not None:
+            self.fileManager.encryptor.clearCache()
+        self.fileManager.search_engine.clearCache()
         self.fileManager.encryptor = None
         # Check for encryption key in Workspace
         path_key = os.path.join(abs_path, ".leafCryptoKey")
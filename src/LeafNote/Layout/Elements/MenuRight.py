@@ -52,6 +52,7 @@ class MenuRight(QScrollArea):
 
         self.setupComponents()
         self.setupDetails()
+        self.document.loading_finished.connect(self.updateSummary)
         # Initial setup of labels, when no file is open
         self.updateDetails(None)
         self.updateReminders()
@@ -160,6 +161,9 @@ class MenuRight(QScrollArea):
         """
         Updates and expands the right menu summary section
         """
+        # the summary is made once the document is loaded
+        if self.document.isLoading():
+            return
         logging.debug("Updating Summary")
         if self.document.summarizer is not None:
             self.col_summary_body.show()
@@ -5,6 +5,7 @@ from .BarBottom import BarBottom
 from .BarOpenTabs import BarOpenTabs
 from .BarTop import BarTop
 from .Document import Document
+from .MappedViewer import MappedViewer
 from .MenuBar import MenuBar
 from .MenuLeft import MenuLeft
 from .MenuRight import MenuRight
@@ -42,7 +42,7 @@ class Layout(QWidget):
         return main_layout
 
     def makeHSplitterLayout(self, left_menu, bar_open_tabs, document,
-                            right_menu, search_and_replace):
+                            right_menu, search_and_replace, viewer):
         """
         This will create the layout containing the middle section of the application
         :param left_menu: reference to the left menu of the application
@@ -50,6 +50,7 @@ class Layout(QWidget):
         :param document: reference to the document
         :param right_menu: reference to the right menu of the application.
         :param search_and_replace: reference to the search and replace for the document
+        :param viewer: reference to the viewer shown in place of the document for huge files
         :return: returns the created layout
         """
         logging.debug("Creating Layout - Horizontal")
@@ -67,6 +68,8 @@ class Layout(QWidget):
         doc_layout.addWidget(bar_open_tabs)
         doc_layout.addWidget(search_and_replace)
         doc_layout.addWidget(document)
+        doc_layout.addWidget(document.plain_editor)
+        doc_layout.addWidget(viewer)
         horizontal_workspace.addWidget(document_view)
 
         horizontal_workspace.addWidget(right_menu)
@@ -4,6 +4,7 @@ this module holds the widget that will display the replace feature in a document
 import logging
 
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLineEdit, QPushButton
 
 
@@ -70,6 +71,7 @@ class ReplaceDoc(QWidget):
         Replaces the current selection of the search string with the replace string
         """
         logging.info("Clicked Replace")
+        self.search_and_replace.search.search_debouncer.flush()
         cursor = self.document.textCursor()
         if cursor.hasSelection():
             cursor.insertText(self.replace_bar.text())
@@ -77,11 +79,32 @@ class ReplaceDoc(QWidget):
 
     def onReplaceAll(self):
         """
-        Replaces all occurrences of the search string with the replace string
+        Replaces all occurrences of the search string with the replace string.
+        The occurrences indexed by the search bar are replaced as a single undo step.
         """
         logging.info("Clicked Replace All")
-        cursor = self.document.textCursor()
-        while cursor.hasSelection():
+        search = self.search_and_replace.search
+        search.search_debouncer.flush()
+        index = search.match_index
+        matches = list(zip(index.starts, index.ends))
+        if not matches:
+            return
+
+        # the index is rebuilt once afterwards instead of being updated for every replacement
+        index.clear()
+
+        # replace from the end so the positions of the remaining matches stay valid
+        editor = self.document.getEditor()
+        editor.setUpdatesEnabled(False)
+        cursor = QTextCursor(self.document.document())
+        cursor.beginEditBlock()
+        for start, end in reversed(matches):
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
             cursor.insertText(self.replace_bar.text())
-            self.search_and_replace.search.onNextOccurrenceSelect()
-            cursor = self.document.textCursor()
+        cursor.endEditBlock()
+        editor.setUpdatesEnabled(True)
+        logging.info("Replaced %d occurrences", len(matches))
+
+        # update the occurrences shown by the search bar
+        search.onChanged(search.search_bar.text())
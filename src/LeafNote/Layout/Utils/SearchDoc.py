@@ -3,12 +3,20 @@ This module contains a widget that gives the user the ability to search through
 """
 import html
 import logging
+import re
 from functools import partial
 
-from PyQt5.QtCore import Qt, QRegExp
-from PyQt5.QtGui import QTextDocument, QKeySequence
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QKeySequence, QTextCursor
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLineEdit, QPushButton, QLabel, QShortcut
 
+from LeafNote.Utils.Debouncer import Debouncer
+from LeafNote.Utils.MatchIndex import MatchIndex
+from LeafNote.Utils.SearchEngine import SearchPattern
+
+# converts the separators in text selected with a cursor to the ones returned by toPlainText
+PLAIN_TEXT_TABLE = str.maketrans({'\u2029': '\n', '\u2028': '\n', '\u00a0': ' '})
+
 
 class SearchDoc(QWidget):
     """
@@ -29,9 +37,14 @@ class SearchDoc(QWidget):
         self.search = ""
         self.current = 0
         self.total = 0
-        self.flags = QTextDocument.FindFlag(0)
         self.txt_no_results = "0 results"
-        self.last_pos = 0
+        self.match_index = MatchIndex()
+        # search_debouncer - runs the search once the user stopped typing
+        self.search_debouncer = Debouncer(self.onChanged)
+        # text_document - the QTextDocument whose changes update the match index
+        self.text_document = self.document.document()
+        self.text_document.contentsChange.connect(self.onContentsChange)
+        self.document.text_document_changed.connect(self.onDocumentChanged)
         self.initUI()
         self.hide()
 
@@ -52,7 +65,7 @@ class SearchDoc(QWidget):
         # add the qLineEdit
         self.search_bar = QLineEdit()
         self.search_bar.setContentsMargins(0, 0, 0, 0)
-        self.search_bar.textChanged[str].connect(self.onChanged)
+        self.search_bar.textChanged[str].connect(self.search_debouncer.trigger)
         self.search_bar.setFixedWidth(200)
         self.search_bar.setStyleSheet("QLineEdit {background: rgb(218, 218, 218)}")
         self.horizontal_layout.addWidget(self.search_bar, alignment=Qt.AlignLeft)
@@ -176,30 +189,107 @@ class SearchDoc(QWidget):
         handles the button click for the previous occurrence search
         """
         logging.info("Clicked Previous")
-        cursor = self.document.textCursor()
-        if cursor.position() != self.last_pos:
-            cursor.setPosition(self.last_pos)
-            self.document.setTextCursor(cursor)
-
-        if self.document.find(self.search, self.flags | QTextDocument.FindBackward):
-            self.current -= 1
-            self.occurances.setText(str(self.current) + '/' + str(self.total))
-            self.last_pos = self.document.textCursor().position()
+        self.search_debouncer.flush()
+        index = self.match_index.previousIndex(self.document.textCursor().selectionStart())
+        if index is not None:
+            self.selectOccurrence(index)
 
     def onNextOccurrenceSelect(self):
         """
         handles the button click for the next occurrence search
         """
         logging.info("Clicked Next")
+        self.search_debouncer.flush()
+        index = self.match_index.nextIndex(self.document.textCursor().selectionEnd())
+        if index is not None:
+            self.selectOccurrence(index)
+
+    def selectOccurrence(self, index: int):
+        """
+        Selects the occurrence at the given index of the match index in the document
+        :param index: index of the occurrence
+        :return: returns nothing
+        """
+        start, end = self.match_index.span(index)
         cursor = self.document.textCursor()
-        if cursor.position() != self.last_pos:
-            cursor.setPosition(self.last_pos)
-            self.document.setTextCursor(cursor)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self.document.setTextCursor(cursor)
+        self.current = index + 1
+        self.updateOccurrences()
 
-        if self.document.find(self.search, self.flags):
-            self.current += 1
+    def updateOccurrences(self):
+        """
+        Updates the label showing the current occurrence and the number of occurrences
+        :return: returns nothing
+        """
+        self.total = len(self.match_index)
+        if self.total == 0:
+            self.current = 0
+            self.occurances.setText(self.txt_no_results)
+        else:
+            self.current = min(max(self.current, 1), self.total)
             self.occurances.setText(str(self.current) + '/' + str(self.total))
-            self.last_pos = self.document.textCursor().position()
+
+    def onContentsChange(self, position: int, removed: int, added: int):
+        """
+        Updates the match index with the lines of the document that were changed
+        :param position: the position of the change
+        :param removed: the number of characters removed
+        :param added: the number of characters added
+        :return: returns nothing
+        """
+        if self.match_index.pattern is None:
+            return
+
+        # find the whole lines touched by the change
+        document = self.document.document()
+        last = document.characterCount() - 1
+        first_block = document.findBlock(min(position, last))
+        last_block = document.findBlock(min(position + added, last))
+        start = first_block.position()
+        end = last_block.position() + last_block.length() - 1
+
+        # get the text of the lines the way toPlainText returns it
+        cursor = QTextCursor(document)
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        text = cursor.selectedText().translate(PLAIN_TEXT_TABLE)
+
+        self.match_index.update(start, end, added - removed, text)
+
+        # keep the current occurrence if it is still selected
+        cursor = self.document.textCursor()
+        if cursor.hasSelection():
+            index = self.match_index.indexOf(cursor.selectionStart(), cursor.selectionEnd())
+            if index is not None:
+                self.current = index + 1
+        self.updateOccurrences()
+
+    def onDocumentChanged(self):
+        """
+        Follows the changes of the document the editor switched to and indexes the current
+        search in it
+        :return: returns nothing
+        """
+        try:
+            self.text_document.contentsChange.disconnect(self.onContentsChange)
+        except (TypeError, RuntimeError):
+            # the previous document was already deleted
+            pass
+        self.text_document = self.document.document()
+        self.text_document.contentsChange.connect(self.onContentsChange)
+
+        pattern = self.match_index.pattern
+        if pattern is not None:
+            self.match_index.setPattern(pattern, self.document.toPlainText())
+        self.current = 0
+        cursor = self.document.textCursor()
+        if cursor.hasSelection():
+            index = self.match_index.indexOf(cursor.selectionStart(), cursor.selectionEnd())
+            if index is not None:
+                self.current = index + 1
+        self.updateOccurrences()
 
     def onCloseSearch(self):
         """
@@ -213,41 +303,35 @@ class SearchDoc(QWidget):
         """
         this handles any change the user makes to the search bar
         """
+        self.search_debouncer.cancel()
         self.search = search
+        self.current = 0
 
-        # update the number of occurrences of the search
-        if self.case_sensitive.isChecked():
-            list_search = self.document.toPlainText()
-            if self.whole_word.isChecked():
-                list_search = list_search.split()
-            self.total = list_search.count(search)
-        else:
-            list_search = self.document.toPlainText().lower()
-            if self.whole_word.isChecked():
-                list_search = list_search.split()
-            self.total = list_search.count(search.lower())
-
-        if self.total == 0 or len(self.search) == 0:
-            self.current = 0
-            self.occurances.setText(self.txt_no_results)
-        else:
-            self.current = 1
-            self.occurances.setText(str(self.current) + '/' + str(self.total))
+        # index every occurrence of the search, only checking the previous occurrences
+        # when the search extends the previous one
+        previous = self.match_index.pattern
+        try:
+            if len(search) == 0:
+                self.match_index.clear()
+            else:
+                pattern = SearchPattern(search, self.case_sensitive.isChecked(),
+                                        self.whole_word.isChecked(),
+                                        self.regex_search.isChecked(), True)
+                if pattern.refines(previous):
+                    self.match_index.refine(pattern, self.document.toPlainText())
+                else:
+                    self.match_index.setPattern(pattern, self.document.toPlainText())
+        except re.error:
+            logging.info("Invalid search pattern - %s", search)
+            self.match_index.clear()
 
         # set the cursor to the beginning of the document
         cursor = self.document.textCursor()
         cursor.setPosition(0)
         self.document.setTextCursor(cursor)
-        # set up the default search flags
-        self.flags = QTextDocument.FindFlag(0)
-        # if search is case sensitive
-        if self.case_sensitive.isChecked():
-            self.flags = self.flags | QTextDocument.FindCaseSensitively
-        # if search is whole word sensitive
-        if self.whole_word.isChecked():
-            self.flags = self.flags | QTextDocument.FindWholeWords
-        # if the user IS searching for regex
-        if self.regex_search.isChecked():
-            self.search = QRegExp(self.search)
-        self.document.find(self.search, self.flags)
-        self.last_pos = self.document.textCursor().position()
+
+        # select the first occurrence
+        if len(self.match_index) > 0:
+            self.selectOccurrence(0)
+        else:
+            self.updateOccurrences()
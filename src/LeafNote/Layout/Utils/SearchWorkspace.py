@@ -4,13 +4,26 @@ This module holds the widget to display all search results in a given workspace
 
 import logging
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 from PyQt5 import QtCore
-from PyQt5.QtCore import Qt, QFileInfo, QRegExp
-from PyQt5.QtGui import QStandardItemModel, QStandardItem, QKeySequence, QTextDocument
+from PyQt5.QtCore import Qt, QFileInfo, QThread, pyqtSignal
+from PyQt5.QtGui import QStandardItemModel, QStandardItem, QKeySequence, QColor, QTextCursor
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QTextEdit, QSplitter, \
-    QTreeView, QAbstractItemView, QShortcut, QPushButton, QHBoxLayout, QSizePolicy, QSpacerItem
+    QTreeView, QAbstractItemView, QShortcut, QPushButton, QHBoxLayout, QSizePolicy, \
+    QSpacerItem, QPlainTextEdit, QDialogButtonBox
+
+from LeafNote.Utils import DialogBuilder
+from LeafNote.Utils.Debouncer import Debouncer
+from LeafNote.Utils.ReplaceEngine import ReplaceEngine
+from LeafNote.Utils.SearchEngine import SearchPattern
+
+# characters the text cursor counts as two positions
+ASTRAL_PATTERN = re.compile("[\U00010000-\U0010FFFF]")
 
 
 class Item(QStandardItem):
@@ -18,12 +31,17 @@ class Item(QStandardItem):
     This is the item that is held in the tree view model
     """
 
-    def __init__(self, path):
+    def __init__(self, path, matches: list = None, snippets: list = None):
         """
         this initializes the item
+        :param path: the file the item represents
+        :param matches: list of (start, end) offsets of the matches in the file
+        :param snippets: list of Snippet of the lines around the first matches
         """
         self.file_name = QFileInfo(path).fileName()
         self.path = path
+        self.matches = matches if matches is not None else []
+        self.snippets = snippets if snippets is not None else []
         super().__init__(self.file_name)
 
     def getFileName(self):
@@ -40,6 +58,20 @@ class Item(QStandardItem):
         """
         return self.path
 
+    def getMatches(self):
+        """
+        returns the offsets of the matches in the file held by the item
+        :return: returns a list of (start, end) offsets
+        """
+        return self.matches
+
+    def getSnippets(self):
+        """
+        returns the lines around the first matches in the file held by the item
+        :return: returns a list of Snippet
+        """
+        return self.snippets
+
 
 class FileViewer(QTreeView):
     """
@@ -75,13 +107,15 @@ class FileViewer(QTreeView):
         self.doubleClicked.connect(self.onDoubleClick)
         self.selectionModel().currentRowChanged.connect(self.onSelection)
 
-    def insertFile(self, path):
+    def insertFile(self, path, matches: list = None, snippets: list = None):
         """
         this inserts a new item into the model
         :param path: the file the item represents
+        :param matches: list of (start, end) offsets of the matches in the file
+        :param snippets: list of Snippet of the lines around the first matches
         :return: returns nothing
         """
-        item = Item(path)
+        item = Item(path, matches, snippets)
         self.model.appendRow(item)
 
     def clearFiles(self):
@@ -102,10 +136,8 @@ class FileViewer(QTreeView):
         if item is None:
             return
 
-        # set the display to show the file
-        data = self.search_workspace.file_manager.getFileData(item.path)
-        self.search_workspace.display.setText(data)
-        self.search_workspace.onNextOccurrenceSelect()
+        # show the matches of the file without loading it
+        self.search_workspace.showSnippets(item)
 
     def onDoubleClick(self, index):
         """
@@ -128,10 +160,80 @@ class FileViewer(QTreeView):
         self.search_workspace.closeWidget()
 
 
+class SearchThread(QThread):
+    """
+    Searches a list of files on a pool of worker threads and reports the matching
+    files in batches while the search is still running
+    """
+    # emits the list of (path, result) of the files found since the last batch
+    results_found = pyqtSignal(list)
+
+    # the minimum time in seconds between two batches of results
+    batch_interval = 0.05
+
+    def __init__(self, files: list, search_file):
+        """
+        Sets up the search
+        :param files: the paths of the files to search
+        :param search_file: function that returns the result of searching the given path,
+        or None if the file does not match
+        """
+        super().__init__()
+        self.files = files
+        self.search_file = search_file
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stops the search. Results that were not reported yet are dropped.
+        :return: returns nothing
+        """
+        self.cancelled.set()
+
+    def isCancelled(self) -> bool:
+        """
+        :return: returns whether or not the search was cancelled
+        """
+        return self.cancelled.is_set()
+
+    def run(self):
+        """
+        Called after thread start
+        """
+        def searchPath(path):
+            """
+            Checks a single file unless the search was cancelled
+            """
+            if self.isCancelled():
+                return None
+            return self.search_file(path)
+
+        batch = []
+        last_batch = 0
+        workers = min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for path, result in zip(self.files, executor.map(searchPath, self.files)):
+                if self.isCancelled():
+                    return
+                if result is not None:
+                    batch.append((path, result))
+                if batch and time.monotonic() - last_batch >= self.batch_interval:
+                    self.results_found.emit(batch)
+                    batch = []
+                    last_batch = time.monotonic()
+
+        if batch and not self.isCancelled():
+            self.results_found.emit(batch)
+
+
 class SearchWorkspace(QWidget):
     """
     Widget that handles searching through the current workspace.
     """
+    # the number of lines shown before and after each match
+    snippet_context = 1
+    # the background color of the matches shown in the snippets
+    highlight_color = "#fff59d"
 
     def __init__(self, document, file_manager, path):
         """
@@ -154,10 +256,25 @@ class SearchWorkspace(QWidget):
         self.display = None
 
         self.files = []
+        self.index = self.file_manager.getWorkspaceIndex(self.path)
         self.file_viewer = FileViewer(self)
         self.close_dialog_callback = None
-        self.flags = QTextDocument.FindFlag(0)
-        self.search = ""
+        # pattern - the compiled pattern of the current query
+        self.pattern = None
+        self.replace_engine = ReplaceEngine(self.file_manager)
+        # search_thread - the thread running the search of the current query
+        self.search_thread = None
+        # cancelled_threads - threads of previous queries that are still shutting down
+        self.cancelled_threads = []
+        # search_complete - whether or not every file of the current query was searched
+        self.search_complete = False
+        # search_debouncer - runs the search once the user stopped typing
+        self.search_debouncer = Debouncer(self.onChanged)
+        # display_item - the item whose whole file is loaded into the display, or None while
+        # the display shows the snippets of the selected item
+        self.display_item = None
+        # snippet_spans - the (start, end) positions in the display of the snippet matches
+        self.snippet_spans = []
 
         self.initUI()
 
@@ -188,7 +305,7 @@ class SearchWorkspace(QWidget):
         # add the qLineEdit as a search bar
         self.search_bar = QLineEdit()
         self.search_bar.setContentsMargins(0, 0, 0, 0)
-        self.search_bar.textChanged[str].connect(self.onChanged)
+        self.search_bar.textChanged[str].connect(self.search_debouncer.trigger)
         self.search_bar.setStyleSheet("QLineEdit {background: rgb(218, 218, 218)}")
 
         # create shortcuts for the line edit
@@ -411,6 +528,7 @@ class SearchWorkspace(QWidget):
         :returns nothing
         """
         logging.debug("Opening file")
+        self.search_debouncer.flush()
         if from_shortcut:
             logging.debug("User opening file from shortcut")
         # get the selected file
@@ -429,10 +547,32 @@ class SearchWorkspace(QWidget):
         closes the widget
         :return: returns nothing
         """
+        self.search_debouncer.cancel()
+        self.cancelSearch()
+        for thread in list(self.cancelled_threads):
+            thread.wait()
         self.close()
+        self.index.save()
         if self.close_dialog_callback is not None:
             self.close_dialog_callback()
 
+    def cancelSearch(self):
+        """
+        Cancels the search of the previous query if it is still running
+        :return: returns nothing
+        """
+        if self.search_thread is None:
+            return
+
+        self.search_thread.cancel()
+        self.search_thread.results_found.disconnect()
+        # keep a reference to the thread until its workers noticed the cancellation
+        if self.search_thread.isRunning():
+            thread = self.search_thread
+            self.cancelled_threads.append(thread)
+            thread.finished.connect(partial(self.cancelled_threads.remove, thread))
+        self.search_thread = None
+
     def onChanged(self, search):
         """
         when the search text gets changed query the workspace for the search phrase
@@ -440,123 +580,356 @@ class SearchWorkspace(QWidget):
         :return: returns nothing
         """
 
+        self.search_debouncer.cancel()
+
+        # the files found by the previous query, if it searched every file
+        previous_pattern = self.pattern
+        previous_files = self.files if self.search_complete else None
+
         # clear the previous query
+        self.cancelSearch()
         self.file_viewer.clearFiles()
+        self.display.setExtraSelections([])
         self.display.setText("")
+        self.display_item = None
+        self.snippet_spans = []
         self.files = []
+        self.pattern = None
+        self.search_complete = False
 
         if search == "":
             return
 
-        # get a list of all files in the workspace
-        files = getAllFiles(self.path)
+        try:
+            # ^ and $ match at every line like they do when searching the document
+            pattern = SearchPattern(search, self.case_sensitive.isChecked(),
+                                    self.whole_word.isChecked(), self.regex_search.isChecked(),
+                                    True)
+        except re.error:
+            logging.info("Invalid search pattern - %s", search)
+            return
+        self.pattern = pattern
+
+        # a file can only match a search that extends the previous one if it matched the
+        # previous one, both by its contents and by its name
+        files = self.index.getAllFiles()
+        if previous_files is not None and pattern.refines(previous_pattern):
+            files = previous_files
 
-        # for each file in the list open it and look for the search word
-        for f in files:
-            # if the file is a file and it can be opened
-            if os.path.isfile(f):
-                # if the search phrase is in the file add a button to the scroll area
-                if self.searchFile(f, search) or str(search) in f:
-                    self.files.append(f)
-                    self.file_viewer.insertFile(f)
+        # narrow the files down to the ones the index says may contain the search phrase
+        candidates = self.index.candidates(search, self.whole_word.isChecked(),
+                                           self.regex_search.isChecked())
+        files = [f for f in files if candidates is None or f in candidates or str(search) in f]
+
+        def searchFile(path):
+            """
+            the file name matching the search phrase is a match on its own
+            """
+            matches, snippets = self.searchFile(path, pattern)
+            if matches or str(search) in path:
+                return matches, snippets
+            return None
+
+        # search the files in the background and show the results as they are found
+        self.search_thread = SearchThread(files, searchFile)
+        self.search_thread.results_found.connect(
+            partial(self.onResultsFound, self.search_thread))
+        self.search_thread.finished.connect(partial(self.onSearchFinished, self.search_thread))
+        self.search_thread.start()
+
+    def onResultsFound(self, search_thread, results: list):
+        """
+        adds a batch of matching files to the results
+        :param search_thread: the thread that found the files
+        :param results: list of (path, (matches, snippets)) of the matching files
+        :return: returns nothing
+        """
+        # drop results of a query that has since been replaced
+        if search_thread is not self.search_thread or search_thread.isCancelled():
+            return
+
+        is_first_batch = not self.files
+        for f, (matches, snippets) in results:
+            self.files.append(f)
+            self.file_viewer.insertFile(f, matches, snippets)
 
         # set the focus on the first search result
-        # index = self.file_viewer.indexBelow(self.file_viewer.rootIndex())
-        index = self.file_viewer.model.index(0, 0)
-        self.file_viewer.setCurrentIndex(index)
-        self.onNextOccurrenceSelect()
+        if is_first_batch:
+            index = self.file_viewer.model.index(0, 0)
+            self.file_viewer.setCurrentIndex(index)
 
-    def searchFile(self, file_name: str, search: str) -> bool:
+    def onSearchFinished(self, search_thread):
         """
-        this will search the given file for the search string
-        :return: returns if the search string is in the file
+        marks the results of the current query as complete once every file was searched
+        :param search_thread: the thread that finished
+        :return: returns nothing
         """
-        text_edit = QTextEdit()
-        text_edit.setText(self.file_manager.getFileData(file_name))
-        self.search = search
+        if search_thread is self.search_thread and not search_thread.isCancelled():
+            self.search_complete = True
 
-        # set the cursor to the beginning of the document
-        cursor = text_edit.textCursor()
-        cursor.setPosition(0)
-        text_edit.setTextCursor(cursor)
+    def searchFile(self, file_name: str, pattern: SearchPattern) -> tuple:
+        """
+        this will search the given file for the search pattern.
+        It does not touch any widgets so it can run on a worker thread.
+        :return: returns the list of (start, end) offsets of the matches in the file and the
+        list of Snippet of the lines around the first matches
+        """
+        return self.file_manager.search_engine.findSnippets(file_name, pattern,
+                                                            self.snippet_context)
 
-        # set up the default search flags
-        self.flags = QTextDocument.FindFlag(0)
+    def showSnippets(self, item: Item):
+        """
+        shows the lines around the matches of the given item in the display, numbered by
+        their line in the file, and selects the first match
+        :param item: the item to show
+        :return: returns nothing
+        """
+        self.display_item = None
+        lines = []
+        spans = []
+        position = 0
+        for snippet in item.snippets:
+            snippet_lines = snippet.text.split("\n")
+            width = len(str(snippet.line + len(snippet_lines) - 1))
+
+            # keep where the text of each line starts in the display
+            line_starts = []
+            for i, line in enumerate(snippet_lines):
+                prefix = str(snippet.line + i).rjust(width) + ": "
+                line_starts.append(position + len(prefix))
+                lines.append(prefix + line)
+                position += len(prefix) + len(line) + 1
+            lines.append("")
+            position += 1
+
+            def toDisplay(offset, snippet=snippet, line_starts=line_starts):
+                """
+                maps an offset into the snippet text onto the display
+                """
+                line = snippet.text.count("\n", 0, offset)
+                return line_starts[line] + offset - snippet.text.rfind("\n", 0, offset) - 1
+            spans.append((toDisplay(snippet.start), toDisplay(snippet.end)))
+
+        if len(item.matches) > len(item.snippets):
+            lines.append(str(len(item.matches) - len(item.snippets)) + " more matches")
+        elif not item.matches:
+            lines.append("The file name matches the search")
+
+        self.snippet_spans = spans
+        self.display.setPlainText("\n".join(lines))
+
+        # highlight every match shown
+        selections = []
+        for start, end in spans:
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(QColor(self.highlight_color))
+            selection.cursor = self.display.textCursor()
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QTextCursor.KeepAnchor)
+            selections.append(selection)
+        self.display.setExtraSelections(selections)
+
+        self.selectSnippet(0)
+
+    def selectSnippet(self, index: int):
+        """
+        selects the match of the snippet at the given index in the display
+        :param index: index of the snippet
+        :return: returns nothing
+        """
+        cursor = self.display.textCursor()
+        if 0 <= index < len(self.snippet_spans):
+            start, end = self.snippet_spans[index]
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+        else:
+            cursor.setPosition(0)
+        self.display.setTextCursor(cursor)
 
-        # if search is case sensitive
-        if self.case_sensitive.isChecked():
-            self.flags = self.flags | QTextDocument.FindCaseSensitively
+    def currentSnippet(self) -> int:
+        """
+        :return: returns the index of the snippet whose match is selected in the display
+        """
+        cursor = self.display.textCursor()
+        span = (cursor.selectionStart(), cursor.selectionEnd())
+        return self.snippet_spans.index(span) if span in self.snippet_spans else 0
 
-        # if search is whole word sensitive
-        if self.whole_word.isChecked():
-            self.flags = self.flags | QTextDocument.FindWholeWords
+    def showFile(self, item: Item, index: int = 0):
+        """
+        loads the whole file of the given item into the display and selects one of its matches
+        :param item: the item to show
+        :param index: index of the match to select
+        :return: returns nothing
+        """
+        self.display.setExtraSelections([])
+        data = self.file_manager.getFileData(item.path)
+        self.display.setText(data)
+        self.display_item = item
+        self.selectMatch(item, index)
 
-        # if the user IS searching for regex
-        if self.regex_search.isChecked():
-            self.search = QRegExp(self.search)
+    def getDisplayMatches(self) -> list:
+        """
+        Finds the matches of the current pattern in the display with the engine that searched
+        the files, so the matches selected are the ones that were found
+        :return: returns the list of (start, end) cursor positions of the matches
+        """
+        if self.pattern is None:
+            return []
+        text = self.display.toPlainText()
+        spans = list(self.pattern.finditer(text))
+        # the cursor counts the characters outside the basic plane twice
+        if ASTRAL_PATTERN.search(text):
+            spans = [(len(text[:start].encode('utf-16-le')) // 2,
+                      len(text[:end].encode('utf-16-le')) // 2) for start, end in spans]
+        return spans
 
-        return text_edit.find(self.search, self.flags)
+    def selectSpan(self, span: tuple):
+        """
+        selects the given (start, end) positions in the display
+        :param span: the positions to select
+        :return: returns nothing
+        """
+        cursor = self.display.textCursor()
+        cursor.setPosition(span[0])
+        cursor.setPosition(span[1], QTextCursor.KeepAnchor)
+        self.display.setTextCursor(cursor)
+
+    def selectMatch(self, item: Item, index: int = 0):
+        """
+        selects a match of the given item in the display
+        :param item: the item shown in the display
+        :param index: index of the match to select
+        :return: returns nothing
+        """
+        spans = self.getDisplayMatches()
+        cursor = self.display.textCursor()
+        cursor.setPosition(0)
+        self.display.setTextCursor(cursor)
+        if spans:
+            self.selectSpan(spans[index] if index < len(spans) else spans[0])
 
     def onPreviousOccurrenceSelect(self):
         """
         handles the button click for the previous occurrence search
         """
         logging.info("Clicked Previous")
-        self.display.find(self.search, self.flags | QTextDocument.FindBackward)
+        if self.display_item is None:
+            self.selectSnippet(max(self.currentSnippet() - 1, 0))
+        else:
+            cursor = self.display.textCursor()
+            spans = [span for span in self.getDisplayMatches()
+                     if span[1] <= cursor.selectionStart()]
+            if spans:
+                self.selectSpan(spans[-1])
 
     def onNextOccurrenceSelect(self):
         """
         handles the button click for the next occurrence search
         """
         logging.info("Clicked Next")
-        self.display.find(self.search, self.flags)
+        if self.display_item is None:
+            self.selectSnippet(min(self.currentSnippet() + 1, len(self.snippet_spans) - 1))
+        else:
+            cursor = self.display.textCursor()
+            spans = [span for span in self.getDisplayMatches()
+                     if span[0] >= cursor.selectionEnd()]
+            if spans:
+                self.selectSpan(spans[0])
 
     def onReplace(self):
         """
         Replaces the current selection of the search string with the replace string
         """
         logging.info("Clicked Replace")
+        index = self.file_viewer.currentIndex()
+        item = self.file_viewer.model.itemFromIndex(index)
+        if item is None:
+            return
+
+        # the whole file is needed to replace a match shown in a snippet
+        if self.display_item is not item:
+            self.showFile(item, self.currentSnippet())
+
         cursor = self.display.textCursor()
         if cursor.hasSelection():
             cursor.insertText(self.replace_bar.text())
         self.onNextOccurrenceSelect()
 
         # save the changes to the selected file
-        index = self.file_viewer.currentIndex()
-        item = self.file_viewer.model.itemFromIndex(index)
-        if item is not None:
-            f = item.path
-            self.replaceFileData(f)
+        self.replaceFileData(item.path)
 
     def onReplaceAll(self):
         """
         Replaces all occurrences of the search string with the replace string
         """
         logging.info("Clicked Replace All")
-        # get the selected file
-        index = self.file_viewer.currentIndex()
-        item = self.file_viewer.model.itemFromIndex(index)
-        if item is None:
+        self.search_debouncer.flush()
+        if self.pattern is None or self.search_thread is None:
             return
 
-        current_file = item.path
-        # iterate through each file containing the search screen
-        for f in self.files:
-            # get the data from the current file and insert it into the display
-            data = self.file_manager.getFileData(f)
-            self.display.setText(data)
-            self.display.find(self.search, self.flags)
-            # iterate through each occurance and replace
-            cursor = self.display.textCursor()
-            while cursor.hasSelection():
-                cursor.insertText(self.replace_bar.text())
-                self.onNextOccurrenceSelect()
-                cursor = self.display.textCursor()
+        # save the open document so its unsaved changes are replaced as well
+        if self.file_manager.current_document is not None:
+            self.file_manager.saveDocument(self.document)
 
-            self.replaceFileData(f)
+        # every file the search looks at, so matches it has not reported yet are included
+        paths = self.search_thread.files
+        replacement = self.replace_bar.text()
+        preview = self.replace_engine.replaceAll(paths, self.pattern, replacement, True)
+        if not preview or not self.confirmReplaceAll(preview):
+            return
 
-        data = self.file_manager.getFileData(current_file)
-        self.display.setText(data)
+        results = self.replace_engine.replaceAll([r.path for r in preview if r.error is None],
+                                                 self.pattern, replacement)
+        for result in results:
+            self.index.update(result.path)
+            # reload the open document if it was changed
+            if self.file_manager.current_document is not None and \
+                    self.file_manager.current_document.absoluteFilePath() == result.path:
+                self.file_manager.closeDocument(self.document, result.path)
+                self.file_manager.openDocument(self.document, result.path, False)
+            # documents open in other tabs are read again when they are shown
+            elif result.path in self.file_manager.open_documents:
+                self.file_manager.discardDocument(self.document, result.path)
+
+        # show what is left of the search after the replace, searching every file again
+        # as the saved document may hold new matches
+        self.search_complete = False
+        self.onChanged(self.search_bar.text())
+
+    def confirmReplaceAll(self, preview: list) -> bool:
+        """
+        Shows the user the changes a replace all would make and asks them to confirm
+        :param preview: list of ReplaceResult of the dry run
+        :return: returns whether or not the user chose to replace
+        """
+        count = sum(r.count for r in preview)
+        files = len([r for r in preview if r.error is None and r.count])
+        skipped = sum(r.skipped for r in preview)
+        dialog = DialogBuilder(self, "Replace All",
+                               "Replace " + str(count) + " matches in " + str(files) + " files?")
+        if skipped:
+            dialog.setMsgText(str(skipped) + " matches spanning more than one line of "
+                               "formatted text are not replaced.")
+
+        lines = []
+        for result in preview:
+            if result.error is not None:
+                lines.append("Could not read " + result.path + " - " + result.error)
+                continue
+            if result.skipped:
+                lines.append("Skipping " + str(result.skipped) + " matches spanning lines in " +
+                             result.path)
+            if result.diff:
+                lines.append(result.diff)
+        diff = QPlainTextEdit()
+        diff.setReadOnly(True)
+        diff.setLineWrapMode(QPlainTextEdit.NoWrap)
+        diff.setPlainText("\n".join(lines))
+        dialog.addWidget(diff)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Cancel | QDialogButtonBox.Yes)
+        dialog.addButtonBox(button_box)
+        return bool(dialog.exec())
 
     def replaceFileData(self, path):
         """
@@ -575,16 +948,10 @@ class SearchWorkspace(QWidget):
                 self.file_manager.current_document.absoluteFilePath() == path:
             self.file_manager.closeDocument(self.document, path)
             closed_doc = True
+        elif path in self.file_manager.open_documents:
+            self.file_manager.discardDocument(self.document, path)
 
         self.file_manager.writeFileData(path, data)
         if closed_doc:
             self.file_manager.openDocument(self.document, path, False)
 
-
-def getAllFiles(path):
-    """
-    returns a list of all files from the given path down the tree
-    :param path: a path to the directory to get all files from
-    :return: returns a list of files in the given directory
-    """
-    return [os.path.join(r, file) for r, d, f in os.walk(path) for file in f]
@@ -25,6 +25,20 @@ class AppProps:
         self.default_width = 800
         self.default_height = 600
         self.resizable = True
+        # files larger than this many bytes are skipped by workspace search and indexing
+        self.max_scan_size = 16 * 1024 * 1024
+        # files larger than this many bytes are mapped and shown read only instead of being
+        # read into the document
+        self.mapped_file_size = 64 * 1024 * 1024
+        # estimated bytes the open documents may use before the least recently used ones are
+        # hibernated, the document that is shown is always kept
+        self.tab_memory_budget = 64 * 1024 * 1024
+        # milliseconds without edits before the edits are written to the recovery journal
+        self.autosave_delay = 3000
+        # milliseconds without edits before the document is saved and its journal removed
+        self.autosave_idle = 30000
+        # directory holding the recovery journals of the documents with unsaved edits
+        self.path_journal = os.path.join(os.path.expanduser("~"), ".leafnote", "journal")
 
         # Defines the default path the program opens to
         self.path_res = os.path.join(script_path, "Resources")
@@ -25,6 +25,14 @@ class DocProps:
         self.def_enable_spellcheck = True
         self.def_enable_autocorrect = False
 
+        # Plain text longer than this many characters is loaded in chunks of the chunk size
+        self.progressive_load_size = 1024 * 1024
+        self.load_chunk_size = 256 * 1024
+        # Words and paragraphs of documents longer than this many characters are counted once
+        # the user stopped typing for the count delay in milliseconds
+        self.count_delay_size = 256 * 1024
+        self.count_delay = 500
+
         # Font sizes available in the TopBar
         self.list_font_sizes = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12", "13",
                                 "14", "15", "16", "17", "18", "19", "20", "22", "24", "26", "28",
@@ -0,0 +1,68 @@
+"""
+This module holds helpers to write files without ever leaving them half written
+"""
+import contextlib
+import logging
+import os
+import stat
+import tempfile
+
+
+def getUmask() -> int:
+    """
+    :return: returns the file mode creation mask of the process
+    """
+    # the mask can only be read by setting it, which is done once before threads are started
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# the mode files get when they are created with open
+NEW_FILE_MODE = 0o666 & ~getUmask()
+
+
+@contextlib.contextmanager
+def atomicOpen(path: str):
+    """
+    Opens a temporary file next to the given path for writing and renames it over the original
+    once the block is left without an error, so the file holds either its old or its new
+    contents even after a crash
+    :param path: the file to write to
+    :return: returns a context manager giving the binary file object to write to
+    :raises OSError: if the file could not be written
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+
+        # keep the permissions of the file being replaced, temporary files are only readable
+        # by the owner
+        if os.path.exists(path):
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        else:
+            os.chmod(tmp_path, NEW_FILE_MODE)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        logging.error("Could not write file - %s", path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomicWrite(path: str, data: bytes):
+    """
+    Writes the data to a temporary file next to the given path and then renames it over the
+    original, so the file holds either its old or its new contents even after a crash
+    :param path: the file to write data to
+    :param data: the bytes to write to the file
+    :return: returns nothing
+    :raises OSError: if the file could not be written
+    """
+    with atomicOpen(path) as file:
+        file.write(data)
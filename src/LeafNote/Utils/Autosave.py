@@ -0,0 +1,457 @@
+"""
+This module saves the edits made to documents in recovery journals while the user types, so
+changes that were not saved can be restored after a crash
+"""
+import hashlib
+import json
+import logging
+import os
+
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QDialogButtonBox
+
+from LeafNote.Utils.Debouncer import Debouncer
+from LeafNote.Utils.DialogBuilder import DialogBuilder
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class RecoveryJournal:
+    """
+    Keeps a journal file for every document with edits that are not saved. A journal starts
+    with a header naming the file and the hash of the saved data the edits apply to, followed
+    by one line for every edit, so edits are appended without rewriting the document. In an
+    encrypted workspace the header is encrypted along with the edits. An edit can also be a
+    snapshot of the whole document, which is how formatted documents are journaled.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Initializes the journal
+        :param directory: the directory holding the journal files
+        """
+        self.directory = directory
+        # bases - dict of (path : hash) of the saved data the journals of this session apply to
+        self.bases = {}
+
+    def getJournalPath(self, path: str) -> str:
+        """
+        :return: returns the path to the journal file of the document at the given path
+        """
+        name = hashlib.sha1(path.encode('utf-8', 'surrogatepass')).hexdigest()
+        return os.path.join(self.directory, name + JOURNAL_SUFFIX)
+
+    def append(self, path: str, base: str, edits: list, encrypt=None):
+        """
+        Appends edits to the journal of a document, starting a new journal if the edits apply
+        to other saved data than the journal does
+        :param path: path to the document
+        :param base: the hash of the saved data the edits apply to
+        :param edits: list of (position, removed, text) edits
+        :param encrypt: function that encrypts bytes or None
+        :return: returns nothing
+        :raises OSError: if the journal could not be written
+        """
+        lines = []
+        mode = 'ab'
+        if self.bases.get(path) != base:
+            header = {"path": path, "base": base, "encrypted": False}
+            if encrypt is not None:
+                # the path and the hash of the plain text must not be readable either
+                token = encrypt(json.dumps(header).encode('utf-8'))
+                header = {"encrypted": True, "header": token.decode('ascii')}
+            lines.append(json.dumps(header).encode('utf-8'))
+            mode = 'wb'
+        for edit in edits:
+            line = json.dumps(edit).encode('utf-8')
+            lines.append(line if encrypt is None else encrypt(line))
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.getJournalPath(path), mode) as file:
+            file.write(b"\n".join(lines) + b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.bases[path] = base
+
+    def start(self, path: str, base: str, edits: list, encrypt=None):
+        """
+        Starts the journal of a document over with the given edits
+        :param path: path to the document
+        :param base: the hash of the saved data the edits apply to
+        :param edits: list of (position, removed, text) edits or snapshots
+        :param encrypt: function that encrypts bytes or None
+        :return: returns nothing
+        :raises OSError: if the journal could not be written
+        """
+        self.bases.pop(path, None)
+        self.append(path, base, edits, encrypt)
+
+    def getBase(self, path: str):
+        """
+        :return: returns the hash of the saved data the journal of this session applies to or
+        None if the document has no journal
+        """
+        return self.bases.get(path)
+
+    def remove(self, path: str):
+        """
+        Removes the journal of a document
+        :param path: path to the document
+        :return: returns nothing
+        """
+        self.bases.pop(path, None)
+        removeFile(self.getJournalPath(path))
+
+    def removeAll(self):
+        """
+        Removes the journals written in this session
+        :return: returns nothing
+        """
+        for path in list(self.bases):
+            self.remove(path)
+
+    def getLeftovers(self, decrypt=None) -> list:
+        """
+        Reads the journals left behind by a session that did not close properly
+        :param decrypt: function that decrypts bytes or None
+        :return: returns a list of (journal path, header, edits), journals that can not be
+        read are skipped
+        """
+        leftovers = []
+        if not os.path.isdir(self.directory):
+            return leftovers
+        for name in sorted(os.listdir(self.directory)):
+            journal_path = os.path.join(self.directory, name)
+            if not name.endswith(JOURNAL_SUFFIX):
+                continue
+            try:
+                with open(journal_path, 'rb') as file:
+                    lines = file.read().splitlines()
+                header = json.loads(lines[0])
+                if header["encrypted"]:
+                    if decrypt is None:
+                        logging.info("Journal is encrypted - %s", journal_path)
+                        continue
+                    header = json.loads(decrypt(header["header"].encode('ascii')))
+                    header["encrypted"] = True
+                edits = []
+                for line in lines[1:]:
+                    if header["encrypted"]:
+                        line = decrypt(line)
+                    edits.append(json.loads(line))
+            except Exception as e:  # pylint: disable=broad-except
+                # a crash while the last edit was written leaves it incomplete
+                logging.warning("Could not read journal %s - %s", journal_path, e)
+                continue
+            leftovers.append((journal_path, header, edits))
+        return leftovers
+
+
+def isFormatted(path: str) -> bool:
+    """
+    :return: returns whether or not the document at the path holds formatted text
+    """
+    return path.endswith(".lef")
+
+
+def removeFile(path: str):
+    """
+    Removes a file if it exists
+    :param path: path to the file
+    :return: returns nothing
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning("Could not remove file - %s", e)
+
+
+class Autosave:
+    """
+    Records the edits made to the shown document and writes them to its recovery journal a few
+    seconds after the user stopped typing. When the user stays idle for longer, the document is
+    saved to its file and the journal is removed.
+    """
+
+    def __init__(self, file_manager, document, app_props):
+        """
+        Connects to the document
+        :param file_manager: reference to the file manager
+        :param document: reference to the document
+        :param app_props: the properties holding the autosave delays and journal directory
+        """
+        logging.debug("Creating Autosave")
+        self.file_manager = file_manager
+        self.document = document
+        self.journal = RecoveryJournal(app_props.path_journal)
+        # edits - dict of (path : list of (position, removed, text)) not written to the journal
+        self.edits = {}
+        # recording - whether or not changes to the document are edits, false while a file
+        # is loaded into it
+        self.recording = True
+        self.journal_debouncer = Debouncer(self.writeJournal, app_props.autosave_delay)
+        self.save_debouncer = Debouncer(self.onIdle, app_props.autosave_idle)
+
+        # text_document - the QTextDocument whose edits are recorded
+        self.text_document = self.document.document()
+        self.text_document.contentsChange.connect(self.onContentsChange)
+        self.document.text_document_changed.connect(self.onDocumentChanged)
+
+    def onDocumentChanged(self):
+        """
+        Follows the edits of the document the editor switched to
+        :return: returns nothing
+        """
+        try:
+            self.text_document.contentsChange.disconnect(self.onContentsChange)
+        except (TypeError, RuntimeError):
+            # the previous document was already deleted
+            pass
+        self.text_document = self.document.document()
+        self.text_document.contentsChange.connect(self.onContentsChange)
+
+    def onContentsChange(self, position: int, removed: int, added: int):
+        """
+        Records an edit of the shown document
+        :param position: the position of the change
+        :param removed: the number of characters removed
+        :param added: the number of characters added
+        :return: returns nothing
+        """
+        # the chunks appended while a file is loaded are not edits
+        if not self.recording or self.document.isLoading() or \
+                self.file_manager.current_document is None:
+            return
+        path = self.file_manager.current_document.absoluteFilePath()
+        self.journal_debouncer.trigger()
+        self.save_debouncer.trigger()
+
+        # the edits of the text do not hold formatting, formatted documents are journaled as
+        # a whole once the user stopped typing
+        if isFormatted(path):
+            self.edits.setdefault(path, [])
+            return
+
+        document = self.document.document()
+        last = document.characterCount() - 1
+        cursor = QTextCursor(document)
+        cursor.setPosition(min(position, last))
+        cursor.setPosition(min(position + added, last), QTextCursor.KeepAnchor)
+        # paragraph separators are turned back into new blocks when the edit is replayed
+        text = cursor.selectedText()
+
+        self.edits.setdefault(path, []).append((position, removed, text))
+
+    def reset(self, path: str):
+        """
+        Drops the recorded edits of a document whose contents were just loaded or saved
+        :param path: path to the document
+        :return: returns nothing
+        """
+        self.edits.pop(path, None)
+
+    def writeJournal(self):
+        """
+        Appends the recorded edits to the journals of their documents
+        :return: returns nothing
+        """
+        encrypt = self.getEncrypt()
+        for path, edits in self.edits.items():
+            base = self.file_manager.getStoredHash(path)
+            if base is None:
+                continue
+            try:
+                if isFormatted(path):
+                    self.writeSnapshot(path, base, encrypt)
+                else:
+                    self.journal.append(path, base.hex(), edits, encrypt)
+            except OSError as e:
+                logging.exception(e)
+                logging.error("Could not write journal - %s", path)
+        self.edits.clear()
+
+    def getEncrypt(self):
+        """
+        :return: returns the function that encrypts the journals or None if the workspace is
+        not encrypted
+        """
+        if self.file_manager.encryptor is None:
+            return None
+        return self.file_manager.encryptor.encrypt
+
+    def writeSnapshot(self, path: str, base: bytes, encrypt=None):
+        """
+        Starts the journal of a document over with its whole text, the html of formatted
+        documents
+        :param path: path to the open document
+        :param base: the hash of the saved data the snapshot replaces
+        :param encrypt: function that encrypts bytes or None
+        :return: returns nothing
+        :raises OSError: if the journal could not be written
+        """
+        data = self.file_manager.getOpenDocumentData(self.document, path)
+        if data is None:
+            return
+        snapshot = {"snapshot": data[0], "html": isFormatted(path)}
+        self.journal.start(path, base.hex(), [snapshot], encrypt)
+
+    def onIdle(self):
+        """
+        Saves the shown document once the user stayed idle, which makes its journal obsolete
+        :return: returns nothing
+        """
+        if self.file_manager.current_document is None:
+            return
+        path = self.file_manager.current_document.absoluteFilePath()
+        if self.file_manager.isModified(self.document):
+            logging.info("Autosaving - %s", path)
+            self.file_manager.saveDocument(self.document)
+        else:
+            self.discard(path)
+
+    def onSaved(self, path: str):
+        """
+        Removes the journal of a document after it was saved, unless the journal was started
+        after the save
+        :param path: path to the document
+        :return: returns nothing
+        """
+        base = self.journal.getBase(path)
+        saved = self.file_manager.getStoredHash(path)
+        if base is not None and (saved is None or base != saved.hex()):
+            self.journal.remove(path)
+
+    def onSaveFailed(self, path: str):
+        """
+        Journals the whole text of a document that could not be saved, as the edits recorded
+        before the save were dropped when it was queued
+        :param path: path to the document
+        :return: returns nothing
+        """
+        self.reset(path)
+        base = self.file_manager.getStoredHash(path)
+        if base is None:
+            return
+        try:
+            self.writeSnapshot(path, base, self.getEncrypt())
+        except OSError as e:
+            logging.exception(e)
+            logging.error("Could not write journal - %s", path)
+
+    def discard(self, path: str):
+        """
+        Drops the edits and the journal of a document
+        :param path: path to the document
+        :return: returns nothing
+        """
+        self.reset(path)
+        self.journal.remove(path)
+
+    def discardAll(self):
+        """
+        Drops every recorded edit and removes the journals of this session
+        :return: returns nothing
+        """
+        self.journal_debouncer.cancel()
+        self.save_debouncer.cancel()
+        self.edits.clear()
+        self.journal.removeAll()
+
+    def discardSaved(self):
+        """
+        Removes the journals of this session once the application quits. The documents with
+        changes that are not saved, because the user did not save them or their last save
+        failed, are journaled as a whole so they can be recovered on the next start.
+        :return: returns nothing
+        """
+        self.journal_debouncer.cancel()
+        self.save_debouncer.cancel()
+        self.edits.clear()
+        unsaved = set(self.file_manager.getModifiedDocuments(self.document))
+        current = self.file_manager.current_document
+        if current is not None and self.file_manager.isModified(self.document):
+            unsaved.add(current.absoluteFilePath())
+        # a failed save marked the document as saved when it was queued
+        for path in self.file_manager.open_documents:
+            if self.file_manager.save_queue.hasFailed(path):
+                unsaved.add(path)
+
+        for path in list(self.journal.bases):
+            if path not in unsaved:
+                self.journal.remove(path)
+        encrypt = self.getEncrypt()
+        for path in unsaved:
+            base = self.file_manager.getStoredHash(path)
+            if base is None:
+                continue
+            try:
+                self.writeSnapshot(path, base, encrypt)
+            except OSError as e:
+                logging.exception(e)
+                logging.error("Could not write journal - %s", path)
+
+    def replay(self, edits: list):
+        """
+        Applies journaled edits to the shown document as a single undo step
+        :param edits: list of (position, removed, text) edits or snapshots
+        :return: returns nothing
+        """
+        document = self.document.document()
+        cursor = QTextCursor(document)
+        cursor.beginEditBlock()
+        for edit in edits:
+            if isinstance(edit, dict):
+                cursor.select(QTextCursor.Document)
+                if edit["html"]:
+                    cursor.insertHtml(edit["snapshot"])
+                else:
+                    cursor.insertText(edit["snapshot"])
+                continue
+            position, removed, text = edit
+            last = document.characterCount() - 1
+            cursor.setPosition(min(position, last))
+            cursor.setPosition(min(position + removed, last), QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+
+    def recover(self, app):
+        """
+        Offers to restore the edits of the journals left behind by a session that did not
+        close properly
+        :param app: reference to the application
+        :return: returns nothing
+        """
+        decrypt = None
+        if self.file_manager.encryptor is not None:
+            decrypt = self.file_manager.encryptor.decrypt
+        for journal_path, header, edits in self.journal.getLeftovers(decrypt):
+            path = header["path"]
+            if not os.path.isfile(path):
+                logging.warning("File of journal no longer exists - %s", path)
+                removeFile(journal_path)
+                continue
+
+            # the edits only apply to the data that was saved when they were made
+            self.file_manager.getFileData(path)
+            saved = self.file_manager.getStoredHash(path)
+            if saved is None or saved.hex() != header["base"]:
+                logging.warning("File changed since its journal was written - %s", path)
+                removeFile(journal_path)
+                continue
+
+            recover_dialog = DialogBuilder(app, "Recover Changes",
+                                           "Recover unsaved changes?",
+                                           "LeafNote closed before the changes to " +
+                                           os.path.basename(path) + " were saved.\n"
+                                           "Would you like to restore them?")
+            button_box = QDialogButtonBox(QDialogButtonBox.No | QDialogButtonBox.Yes)
+            recover_dialog.addButtonBox(button_box)
+            restore = recover_dialog.exec()
+            removeFile(journal_path)
+            if restore and self.file_manager.openDocument(self.document, path):
+                logging.info("Recovering changes - %s", path)
+                # the edits apply to the whole text, not only to the chunks loaded so far
+                self.document.loadRemaining()
+                self.replay(edits)
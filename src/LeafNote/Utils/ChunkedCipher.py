@@ -0,0 +1,282 @@
+"""
+This module holds the format encrypted workspace files are written in. The data is split into
+segments that are encrypted on their own, so files are encrypted as a stream and a range of
+bytes is read by decrypting only the segments holding it.
+
+The file starts with a header of the magic bytes, the version, the segment size and a random
+salt. Every segment after it is encrypted with AES-GCM using a key derived from the workspace
+key and the salt, the index of the segment and whether or not it is the last one are part of
+its nonce, so segments can not be reordered, dropped or cut off without failing to decrypt.
+"""
+import base64
+import io
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b"LEAFENC"
+VERSION = 1
+# magic, version, segment size, salt
+HEADER_FORMAT = ">7sBI16s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+# the number of decrypted segments a reader keeps
+CACHED_SEGMENTS = 8
+
+
+def isContainer(data: bytes) -> bool:
+    """
+    :param data: the first bytes of a file
+    :return: returns whether or not the data starts with the header of an encrypted file
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def isContainerFile(path: str) -> bool:
+    """
+    :return: returns whether or not the file at the given path is an encrypted file
+    """
+    try:
+        with open(path, 'rb') as file:
+            return isContainer(file.read(len(MAGIC)))
+    except OSError:
+        return False
+
+
+def getNonce(index: int, final: bool) -> bytes:
+    """
+    :return: returns the nonce of a segment
+    """
+    return struct.pack(">QI", index, 1 if final else 0)
+
+
+class ChunkedCipher:
+    """
+    Encrypts and decrypts files segment by segment with the key of the workspace
+    """
+
+    def __init__(self, key: bytes, segment_size: int = SEGMENT_SIZE):
+        """
+        Sets up the cipher
+        :param key: the url safe base64 encoded key of the workspace
+        :param segment_size: the number of bytes of data in every segment that is written
+        """
+        self.master_key = base64.urlsafe_b64decode(key)
+        self.segment_size = segment_size
+
+    def deriveKey(self, info: bytes, salt: bytes = None) -> bytes:
+        """
+        :param info: the purpose of the key, keys for different purposes are unrelated
+        :param salt: the random salt of the key or None
+        :return: returns a key derived from the key of the workspace
+        """
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info)
+        return hkdf.derive(self.master_key)
+
+    def getAead(self, salt: bytes) -> AESGCM:
+        """
+        :return: returns the cipher of the segments of the file with the given salt
+        """
+        return AESGCM(self.deriveKey(b"LeafNote segments", salt))
+
+    def readHeader(self, header: bytes) -> tuple:
+        """
+        :param header: the first HEADER_SIZE bytes of an encrypted file
+        :return: returns the segment size and the cipher of the segments of the file
+        :raises InvalidToken: if the header is not valid
+        """
+        if len(header) < HEADER_SIZE:
+            raise InvalidToken
+        magic, version, segment_size, salt = struct.unpack(HEADER_FORMAT, header[:HEADER_SIZE])
+        if magic != MAGIC or version != VERSION or segment_size == 0:
+            raise InvalidToken
+        return segment_size, self.getAead(salt)
+
+    def encryptStream(self, source, target):
+        """
+        Encrypts the data of a file object into another, holding one segment at a time
+        :param source: the binary file object to read data from
+        :param target: the binary file object to write the encrypted data to
+        :return: returns nothing
+        """
+        salt = os.urandom(16)
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.segment_size, salt)
+        aead = self.getAead(salt)
+        target.write(header)
+
+        index = 0
+        segment = source.read(self.segment_size)
+        while True:
+            # the last segment is marked, an empty file still has one empty segment
+            following = source.read(self.segment_size)
+            final = not following
+            target.write(aead.encrypt(getNonce(index, final), segment, header))
+            if final:
+                return
+            segment = following
+            index += 1
+
+    def decryptStream(self, source, target):
+        """
+        Decrypts an encrypted file object into another, holding one segment at a time
+        :param source: the binary file object to read the encrypted data from
+        :param target: the binary file object to write the data to
+        :return: returns nothing
+        :raises InvalidToken: if the data was not encrypted with the key or was changed
+        """
+        header = source.read(HEADER_SIZE)
+        segment_size, aead = self.readHeader(header)
+
+        index = 0
+        segment = source.read(segment_size + TAG_SIZE)
+        while True:
+            following = source.read(segment_size + TAG_SIZE)
+            final = not following
+            try:
+                target.write(aead.decrypt(getNonce(index, final), segment, header))
+            except InvalidTag as e:
+                raise InvalidToken from e
+            if final:
+                return
+            segment = following
+            index += 1
+
+    def encrypt(self, data: bytes) -> bytes:
+        """
+        :return: returns the data encrypted as a whole
+        """
+        target = io.BytesIO()
+        self.encryptStream(io.BytesIO(data), target)
+        return target.getvalue()
+
+    def decrypt(self, data: bytes) -> bytes:
+        """
+        :return: returns the encrypted data decrypted as a whole
+        :raises InvalidToken: if the data was not encrypted with the key or was changed
+        """
+        target = io.BytesIO()
+        self.decryptStream(io.BytesIO(data), target)
+        return target.getvalue()
+
+
+class ChunkedReader:
+    """
+    Gives access to the decrypted bytes of an encrypted file like to a bytes object, only the
+    segments holding the bytes that are read are decrypted. The recently decrypted segments
+    are kept, the reader can be used from several threads.
+    """
+
+    def __init__(self, data, cipher: ChunkedCipher):
+        """
+        Reads the header of the encrypted data
+        :param data: the encrypted bytes, usually a memory map of the file
+        :param cipher: the cipher holding the key of the workspace
+        :raises InvalidToken: if the data is not an encrypted file
+        """
+        self.data = data
+        self.header = bytes(data[:HEADER_SIZE])
+        self.segment_size, self.aead = cipher.readHeader(self.header)
+
+        body = len(data) - HEADER_SIZE
+        stored_size = self.segment_size + TAG_SIZE
+        self.segment_count = max(1, -(-body // stored_size))
+        self.size = body - self.segment_count * TAG_SIZE
+        if self.size < 0:
+            raise InvalidToken
+
+        # segments - ordered dict of (index : data) of the decrypted segments, least recent first
+        self.segments = OrderedDict()
+        self.lock = threading.Lock()
+        # a file that was cut off has no last segment
+        self.getSegment(self.segment_count - 1)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def getSegment(self, index: int) -> bytes:
+        """
+        :param index: the index of the segment
+        :return: returns the decrypted data of the segment
+        :raises InvalidToken: if the segment was changed
+        """
+        with self.lock:
+            if index in self.segments:
+                self.segments.move_to_end(index)
+                return self.segments[index]
+
+        stored_size = self.segment_size + TAG_SIZE
+        start = HEADER_SIZE + index * stored_size
+        final = index == self.segment_count - 1
+        try:
+            segment = self.aead.decrypt(getNonce(index, final),
+                                        bytes(self.data[start:start + stored_size]), self.header)
+        except InvalidTag as e:
+            raise InvalidToken from e
+
+        with self.lock:
+            self.segments[index] = segment
+            while len(self.segments) > CACHED_SEGMENTS:
+                self.segments.popitem(last=False)
+        return segment
+
+    def __getitem__(self, item) -> bytes:
+        """
+        :param item: a slice of decrypted byte offsets, steps are not supported
+        :return: returns the decrypted bytes
+        """
+        if not isinstance(item, slice):
+            raise TypeError("only slices of encrypted files can be read")
+        start, stop, _ = item.indices(self.size)
+        if start >= stop:
+            return b""
+        first = start // self.segment_size
+        last = (stop - 1) // self.segment_size
+        data = b"".join(self.getSegment(index) for index in range(first, last + 1))
+        offset = first * self.segment_size
+        return data[start - offset:stop - offset]
+
+    def find(self, sub: bytes, start: int = 0, end: int = None) -> int:
+        """
+        :return: returns the lowest offset of sub between start and end or -1 like bytes.find
+        """
+        end = self.size if end is None else min(end, self.size)
+        position = max(0, start)
+        if not sub:
+            return position if position <= end else -1
+        while position < end:
+            # matches starting in this segment may reach into the next one
+            boundary = (position // self.segment_size + 1) * self.segment_size
+            window = self[position:min(end, boundary + len(sub) - 1)]
+            found = window.find(sub)
+            if found != -1:
+                return position + found
+            position = boundary
+        return -1
+
+    def rfind(self, sub: bytes, start: int = 0, end: int = None) -> int:
+        """
+        :return: returns the highest offset of sub between start and end or -1 like bytes.rfind
+        """
+        end = self.size if end is None else min(end, self.size)
+        start = max(0, start)
+        if not sub:
+            return end if start <= end else -1
+        if end <= start:
+            return -1
+        boundary = ((end - 1) // self.segment_size) * self.segment_size
+        while boundary + self.segment_size > start:
+            position = max(start, boundary)
+            window = self[position:min(end, boundary + self.segment_size + len(sub) - 1)]
+            found = window.rfind(sub)
+            if found != -1:
+                return position + found
+            boundary -= self.segment_size
+        return -1
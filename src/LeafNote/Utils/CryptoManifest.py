@@ -0,0 +1,210 @@
+"""
+This module keeps the journal of the state every file of a workspace was left in by encrypting
+or decrypting it, so an interrupted job resumes where it stopped
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+
+from LeafNote.Utils.AtomicFile import atomicWrite
+
+# name of the file in the root of the workspace that holds the manifest
+MANIFEST_FILE = ".leafCryptoManifest"
+STATE_PLAIN = "plain"
+STATE_ENCRYPTED = "encrypted"
+OPERATION_ENCRYPT = "encrypt"
+OPERATION_DECRYPT = "decrypt"
+
+
+def getFileStamp(path: str):
+    """
+    :return: returns the size, modification time and inode of a file, or None if it does not
+    exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class DigestFile:
+    """
+    Wraps a binary file object and keeps a keyed hash of the bytes read from or written to it,
+    so the contents of a file are hashed while they are streamed
+    """
+
+    def __init__(self, file, key: bytes):
+        """
+        Sets up the hash
+        :param file: the binary file object to wrap
+        :param key: the key of the hash, the hashes of plain text must not be guessable
+        """
+        self.file = file
+        self.digest = hmac.new(key, digestmod=hashlib.sha256)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def hexdigest(self) -> str:
+        """
+        :return: returns the hash of the bytes read or written so far
+        """
+        return self.digest.hexdigest()
+
+
+class CryptoManifest:
+    """
+    Journals the state, the hash of the plain contents and the stamp of every file a crypto job
+    wrote. The manifest starts with the job that is running, followed by one line for every file
+    that is done, so files are recorded without rewriting the manifest. A file whose stamp still
+    matches its entry is known to be in that state without reading it. Lines lost in a crash
+    only make the job look at those files again.
+    """
+
+    def __init__(self, root: str):
+        """
+        Loads the manifest of a workspace
+        :param root: path to the root of the workspace
+        """
+        logging.debug("Creating Crypto Manifest")
+        self.root = os.path.abspath(root)
+        self.path = os.path.join(self.root, MANIFEST_FILE)
+        # operation - the job that did not finish or None
+        self.operation = None
+        # entries - dict of (relative path : (state, hash, stamp)) of the files that were written
+        self.entries = {}
+        self.file = None
+        self.load()
+
+    def load(self):
+        """
+        Reads the manifest, a line cut off by a crash is left out
+        :return: returns nothing
+        """
+        self.operation = None
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning("Could not read crypto manifest - %s", e)
+            return
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logging.warning("Skipping damaged crypto manifest line")
+                continue
+            if "operation" in entry:
+                self.operation = entry["operation"]
+            elif "path" in entry:
+                self.entries[entry["path"]] = (entry["state"], entry.get("hash"),
+                                               entry.get("stamp"))
+
+    def getRelativePath(self, path: str) -> str:
+        """
+        :return: returns the path of the file relative to the root of the workspace
+        """
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def getEntry(self, path: str):
+        """
+        :param path: path to the file
+        :return: returns the (state, hash, stamp) recorded for the file or None
+        """
+        return self.entries.get(self.getRelativePath(path))
+
+    def getState(self, path: str):
+        """
+        :param path: path to the file
+        :return: returns the state recorded for the file if it was not changed since, else None
+        """
+        entry = self.getEntry(path)
+        if entry is None or entry[2] is None or entry[2] != getFileStamp(path):
+            return None
+        return entry[0]
+
+    def begin(self, operation: str):
+        """
+        Records that a job started, the entries of files that no longer exist are dropped
+        :param operation: OPERATION_ENCRYPT or OPERATION_DECRYPT
+        :return: returns nothing
+        :raises OSError: if the manifest could not be written
+        """
+        logging.info("Beginning crypto job - %s", operation)
+        self.operation = operation
+        self.entries = {path: entry for path, entry in self.entries.items()
+                        if os.path.exists(os.path.join(self.root, path))}
+        self.rewrite()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, path: str, state: str, digest: str = None):
+        """
+        Appends the state a file was written in
+        :param path: path to the file
+        :param state: STATE_PLAIN or STATE_ENCRYPTED
+        :param digest: the hash of the plain contents of the file or None if it is not known
+        :return: returns nothing
+        """
+        relative_path = self.getRelativePath(path)
+        stamp = getFileStamp(path)
+        self.entries[relative_path] = (state, digest, stamp)
+        if self.file is None:
+            return
+        try:
+            self.file.write(json.dumps({"path": relative_path, "state": state, "hash": digest,
+                                        "stamp": stamp}) + "\n")
+            # a line lost in a crash is only looked at again, so the lines are not synced
+            self.file.flush()
+        except OSError as e:
+            logging.warning("Could not write crypto manifest - %s", e)
+
+    def finish(self, done: bool):
+        """
+        Records the end of a job
+        :param done: whether or not every file is in the target state
+        :return: returns nothing
+        """
+        self.close()
+        if done:
+            logging.info("Finished crypto job - %s", self.operation)
+            self.operation = None
+        try:
+            self.rewrite()
+        except OSError as e:
+            logging.warning("Could not write crypto manifest - %s", e)
+
+    def rewrite(self):
+        """
+        Writes the whole manifest, dropping the lines of entries that were recorded again
+        :return: returns nothing
+        :raises OSError: if the manifest could not be written
+        """
+        lines = []
+        if self.operation is not None:
+            lines.append(json.dumps({"operation": self.operation}))
+        for path, (state, digest, stamp) in sorted(self.entries.items()):
+            lines.append(json.dumps({"path": path, "state": state, "hash": digest,
+                                     "stamp": stamp}))
+        atomicWrite(self.path, "".join(line + "\n" for line in lines).encode('utf-8'))
+
+    def close(self):
+        """
+        Closes the manifest file
+        :return: returns nothing
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
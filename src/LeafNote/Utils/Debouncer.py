@@ -0,0 +1,58 @@
+"""
+this module contains a helper that delays a call until its trigger has been idle for a while
+"""
+from PyQt5.QtCore import QTimer
+
+
+class Debouncer:
+    """
+    Calls the target once the trigger stopped being called for the given interval,
+    with the arguments of the last trigger
+    """
+
+    def __init__(self, target, interval: int = 150):
+        """
+        Sets up the timer
+        :param target: function to call
+        :param interval: the idle time in milliseconds before the target is called
+        """
+        self.target = target
+        self.args = ()
+        self.pending = False
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+
+    def trigger(self, *args):
+        """
+        Restarts the idle time and remembers the arguments to call the target with
+        :return: returns nothing
+        """
+        self.args = args
+        self.pending = True
+        self.timer.start()
+
+    def isPending(self) -> bool:
+        """
+        :return: returns whether or not the target is waiting to be called
+        """
+        return self.pending
+
+    def cancel(self):
+        """
+        Drops the pending call if there is one
+        :return: returns nothing
+        """
+        self.pending = False
+        self.timer.stop()
+
+    def flush(self):
+        """
+        Calls the target right away if a call is pending
+        :return: returns nothing
+        """
+        if not self.pending:
+            return
+        self.cancel()
+        self.target(*self.args)
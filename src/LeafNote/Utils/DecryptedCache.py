@@ -0,0 +1,88 @@
+"""
+This module keeps the decrypted contents of encrypted files in memory, so files that did not
+change are not decrypted again every time they are searched or opened
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+# the number of bytes of decrypted data kept by default
+CACHE_SIZE = 64 * 1024 * 1024
+
+
+class DecryptedCache:
+    """
+    Least recently used cache of the decrypted contents of files within a byte budget. An entry
+    is only used while the file keeps the modification time and size it had when it was read.
+    The cached copies are overwritten with zeros when they are dropped, so plain text does not
+    stay behind in memory the cache gave up. The cache can be used from several threads.
+    """
+
+    def __init__(self, budget: int = CACHE_SIZE):
+        """
+        Starts with an empty cache
+        :param budget: the number of bytes of decrypted data to keep at most
+        """
+        logging.debug("Creating Decrypted Cache")
+        self.budget = budget
+        self.size = 0
+        # entries - ordered dict of (path : (stamp, data)) least recently used first, stamp is
+        # (modification time in nanoseconds, size) of the encrypted file
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str, stamp: tuple):
+        """
+        :param path: path to the file
+        :param stamp: the modification time in nanoseconds and the size of the file
+        :return: returns the decrypted data of the file or None if it is not cached
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                # the file changed since it was decrypted
+                self._drop(path)
+                return None
+            self.entries.move_to_end(path)
+            return bytes(entry[1])
+
+    def put(self, path: str, stamp: tuple, data: bytes):
+        """
+        Keeps the decrypted data of a file, dropping the least recently used files to stay
+        within the budget
+        :param path: path to the file
+        :param stamp: the modification time in nanoseconds and the size of the file
+        :param data: the decrypted data
+        :return: returns nothing
+        """
+        if len(data) > self.budget:
+            return
+        with self.lock:
+            if path in self.entries:
+                self._drop(path)
+            self.entries[path] = (stamp, bytearray(data))
+            self.size += len(data)
+            while self.size > self.budget:
+                self._drop(next(iter(self.entries)))
+
+    def clear(self):
+        """
+        Drops every file
+        :return: returns nothing
+        """
+        with self.lock:
+            logging.debug("Clearing %d decrypted files", len(self.entries))
+            for path in list(self.entries):
+                self._drop(path)
+
+    def _drop(self, path: str):
+        """
+        Drops a file and overwrites its data, the lock has to be held
+        :param path: path to the file
+        :return: returns nothing
+        """
+        _, data = self.entries.pop(path)
+        self.size -= len(data)
+        data[:] = bytes(len(data))
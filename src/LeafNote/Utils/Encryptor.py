@@ -1,49 +1,410 @@
 """
 This module holds a class to encrypt a file and or a directory
 """
+import functools
 import logging
+import multiprocessing
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
-from PyQt5.QtWidgets import QDialogButtonBox
-from cryptography.fernet import Fernet
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QDialogButtonBox, QProgressBar
+from cryptography.fernet import Fernet, InvalidToken
 
 from LeafNote.Utils import DialogBuilder
+from LeafNote.Utils.AtomicFile import atomicOpen, atomicWrite
+from LeafNote.Utils.ChunkedCipher import ChunkedCipher, HEADER_SIZE, isContainer
+from LeafNote.Utils.DecryptedCache import DecryptedCache
+from LeafNote.Utils.CryptoManifest import CryptoManifest, DigestFile, MANIFEST_FILE, \
+    STATE_PLAIN, STATE_ENCRYPTED, OPERATION_ENCRYPT, OPERATION_DECRYPT
+
+# every token of the encryptor starts with the base64 of its version byte
+TOKEN_PREFIX = b"gAAAAA"
+
+
+def isEncryptedData(data: bytes) -> bool:
+    """
+    Classifies a file from its first bytes without decrypting it
+    :param data: the data of a file or at least its first HEADER_SIZE bytes
+    :return: returns whether or not the data looks encrypted
+    """
+    return isContainer(data) or data.startswith(TOKEN_PREFIX)
 
 
 class Encryptor(Fernet):
     """
-    this class will encrypt a given file
+    this class will encrypt a given file. Files are written in the segmented format of
+    ChunkedCipher, files encrypted as a single token by older versions are still read.
     """
 
     def __init__(self, key):
         super().__init__(key)
         logging.debug("Creating Encryptor")
+        # key - the key the encryptor was created with, passed to the worker processes
+        self.key = key
+        self.cipher = ChunkedCipher(key)
+        # digest_key - the key of the hashes of plain contents kept in the crypto manifest
+        self.digest_key = self.cipher.deriveKey(b"LeafNote manifest")
+        # cache - the decrypted contents of the files read through readFile
+        self.cache = DecryptedCache()
 
-    def encryptFile(self, path):
+    def encryptData(self, data: bytes) -> bytes:
         """
-        Given a filename (str) and key (bytes), it encrypts the file and write it
+        :return: returns the data encrypted in the format files are written in
         """
-        with open(path, "rb") as file:
-            # read all file data
-            file_data = file.read()
-        # encrypt data
-        encrypted_data = self.encrypt(file_data)
-        # write the encrypted file
-        with open(path, "wb") as file:
-            file.write(encrypted_data)
+        return self.cipher.encrypt(data)
+
+    def decryptData(self, data: bytes) -> bytes:
+        """
+        :return: returns the decrypted data of an encrypted file
+        :raises InvalidToken: if the data is not encrypted with the key
+        """
+        if isContainer(data):
+            return self.cipher.decrypt(data)
+        return self.decrypt(data)
+
+    def getPlainData(self, data: bytes) -> bytes:
+        """
+        Reads the data of any file of the workspace, the header tells encrypted files from
+        plain ones so plain files are never run through the cipher
+        :param data: the data read from the file
+        :return: returns the decrypted data or the data itself if it is not encrypted
+        :raises InvalidToken: if the data is encrypted but was changed or uses another key
+        """
+        if isContainer(data):
+            return self.cipher.decrypt(data)
+        if data.startswith(TOKEN_PREFIX):
+            try:
+                return self.decrypt(data)
+            except InvalidToken:
+                # plain text may start like a token by chance
+                logging.debug("Data is not a token")
+        return data
+
+    def readFile(self, path: str, file, head: bytes = b"") -> bytes:
+        """
+        Reads the rest of an open file of the workspace and decrypts it if it is encrypted. The
+        decrypted data is cached by the modification time and size of the file, so a file that
+        did not change is neither read nor decrypted again.
+        :param path: path to the file
+        :param file: the file opened in binary mode
+        :param head: the bytes already read from the start of the file
+        :return: returns the plain data of the file
+        :raises InvalidToken: if the file is encrypted but was changed or uses another key
+        :raises OSError: if the file could not be read
+        """
+        stat = os.fstat(file.fileno())
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        data = self.cache.get(path, stamp)
+        if data is not None:
+            return data
+
+        data = head + file.read()
+        if not isEncryptedData(data):
+            return data
+        data = self.getPlainData(data)
+        self.cache.put(path, stamp, data)
+        return data
 
-    def decryptFile(self, path):
+    def clearCache(self):
         """
-        Given a filename (str) and key (bytes), it decrypts the file and write it
+        Drops the decrypted contents of every file, called before the encryptor is given up
+        :return: returns nothing
+        """
+        self.cache.clear()
+
+    def isEncryptedFile(self, path: str) -> bool:
+        """
+        :return: returns whether or not the file is encrypted with the key
+        :raises OSError: if the file could not be read
         """
         with open(path, "rb") as file:
-            # read the encrypted data
-            encrypted_data = file.read()
-        # decrypt data
-        decrypted_data = self.decrypt(encrypted_data)
-        # write the original file
-        with open(path, "wb") as file:
-            file.write(decrypted_data)
+            start = file.read(HEADER_SIZE)
+            if isContainer(start):
+                try:
+                    self.cipher.readHeader(start)
+                except InvalidToken:
+                    return False
+                return True
+            if not start.startswith(TOKEN_PREFIX):
+                return False
+            data = start + file.read()
+        try:
+            self.decrypt(data)
+        except InvalidToken:
+            return False
+        return True
+
+    def encryptFile(self, path) -> str:
+        """
+        Given a filename (str), it encrypts the file segment by segment and writes it
+        :return: returns the hash of the plain contents of the file
+        """
+        with atomicOpen(path) as target:
+            with open(path, "rb") as file:
+                source = DigestFile(file, self.digest_key)
+                self.cipher.encryptStream(source, target)
+        return source.hexdigest()
+
+    def decryptFile(self, path, digest: str = None) -> str:
+        """
+        Given a filename (str), it decrypts the file and writes it
+        :param digest: the hash the plain contents must have or None
+        :return: returns the hash of the plain contents of the file
+        :raises InvalidToken: if the file could not be decrypted, the file is left as it is
+        """
+        with atomicOpen(path) as file:
+            target = DigestFile(file, self.digest_key)
+            with open(path, "rb") as source:
+                if isContainer(source.read(HEADER_SIZE)):
+                    source.seek(0)
+                    self.cipher.decryptStream(source, target)
+                else:
+                    source.seek(0)
+                    target.write(self.decrypt(source.read()))
+            if digest is not None and target.hexdigest() != digest:
+                raise InvalidToken
+        return target.hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def getEncryptor(key: bytes) -> Encryptor:
+    """
+    :return: returns the encryptor of the key, every worker process keeps the last one
+    """
+    return Encryptor(key)
+
+
+def encryptPath(key: bytes, path: str, digest: str = None) -> tuple:
+    """
+    Encrypts a file in a worker process, files that are already encrypted are left as they are
+    so an interrupted job can be run again
+    :param key: the key to encrypt with
+    :param path: path to the file
+    :param digest: not used, encrypting takes the same arguments as decrypting
+    :return: returns the path, the error message or None if the file was encrypted and the hash
+    of its plain contents or None if it is not known
+    """
+    encryptor = getEncryptor(key)
+    try:
+        if not encryptor.isEncryptedFile(path):
+            return path, None, encryptor.encryptFile(path)
+    except OSError as e:
+        return path, str(e), None
+    return path, None, None
+
+
+def decryptPath(key: bytes, path: str, digest: str = None) -> tuple:
+    """
+    Decrypts a file in a worker process, files that are not encrypted are left as they are so
+    an interrupted job can be run again
+    :param key: the key to decrypt with
+    :param path: path to the file
+    :param digest: the hash the plain contents must have or None
+    :return: returns the path, the error message or None if the file was decrypted and the hash
+    of its plain contents or None if it is not known
+    """
+    encryptor = getEncryptor(key)
+    try:
+        if encryptor.isEncryptedFile(path):
+            return path, None, encryptor.decryptFile(path, digest)
+    except InvalidToken:
+        return path, "The file is damaged and could not be decrypted", None
+    except OSError as e:
+        return path, str(e), None
+    return path, None, None
+
+
+class CryptoJob(QThread):
+    """
+    Encrypts or decrypts a list of files on a pool of worker processes, one for every core,
+    and reports its progress while it runs. Every file is written atomically, so a cancelled
+    job leaves every file either encrypted or decrypted. With a manifest the state of every
+    file is journaled, files the manifest knows to be done are skipped without reading them.
+    """
+    # emitted with the number of files done, the number of files and the last file done
+    progress = pyqtSignal(int, int, str)
+
+    # the minimum time in seconds between two progress reports
+    progress_interval = 0.05
+
+    def __init__(self, key: bytes, paths: list, encrypt: bool, manifest: CryptoManifest = None):
+        """
+        Sets up the job
+        :param key: the key of the encryptor
+        :param paths: the files to encrypt or decrypt
+        :param encrypt: whether to encrypt or decrypt the files
+        :param manifest: the manifest of the workspace or None
+        """
+        super().__init__()
+        self.key = key
+        self.paths = paths
+        self.encrypt = encrypt
+        self.manifest = manifest
+        # failed - list of (path, error message) of the files that could not be written
+        self.failed = []
+        # skipped - the number of files the manifest knew to be done
+        self.skipped = 0
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stops the job once the files being written are done
+        :return: returns nothing
+        """
+        logging.info("Cancelling crypto job")
+        self.cancelled.set()
+
+    def isCancelled(self) -> bool:
+        """
+        :return: returns whether or not the job was cancelled
+        """
+        return self.cancelled.is_set()
+
+    def run(self):
+        """
+        Called after thread start
+        """
+        target = encryptPath if self.encrypt else decryptPath
+        state = STATE_ENCRYPTED if self.encrypt else STATE_PLAIN
+        if self.manifest is not None:
+            try:
+                self.manifest.begin(OPERATION_ENCRYPT if self.encrypt else OPERATION_DECRYPT)
+            except OSError as e:
+                logging.exception(e)
+                self.failed.append((self.manifest.path, str(e)))
+                self.progress.emit(0, len(self.paths), "")
+                return
+
+        workers = max(1, min(os.cpu_count() or 1, len(self.paths)))
+        paths = iter(self.paths)
+        done = 0
+        last_progress = 0
+        # forking a process that runs Qt threads is not safe
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                # only a few files are queued at a time so cancelling does not wait for all
+                running = set()
+                while True:
+                    while len(running) < 2 * workers and not self.isCancelled():
+                        path = next(paths, None)
+                        if path is None:
+                            break
+                        digest = None
+                        if self.manifest is not None:
+                            known_state = self.manifest.getState(path)
+                            if known_state == state:
+                                done += 1
+                                self.skipped += 1
+                                continue
+                            # a file not changed since it was encrypted must decrypt to the
+                            # same contents
+                            if known_state == STATE_ENCRYPTED:
+                                digest = self.manifest.getEntry(path)[1]
+                        running.add(executor.submit(target, self.key, path, digest))
+                    if not running:
+                        break
+
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        path, error, digest = future.result()
+                        done += 1
+                        if error is not None:
+                            logging.error("Could not write file - %s: %s", path, error)
+                            self.failed.append((path, error))
+                        elif self.manifest is not None:
+                            self.manifest.record(path, state, digest)
+                        if time.monotonic() - last_progress >= self.progress_interval:
+                            self.progress.emit(done, len(self.paths), path)
+                            last_progress = time.monotonic()
+        except BrokenProcessPool as e:
+            logging.exception(e)
+            self.failed.append(("", str(e)))
+        if self.manifest is not None:
+            self.manifest.finish(not self.isCancelled() and not self.failed)
+        self.progress.emit(done, len(self.paths), "")
+        logging.info("%s %d of %d files, %d were already done",
+                     "Encrypted" if self.encrypt else "Decrypted", done, len(self.paths),
+                     self.skipped)
+
+
+def runCryptoJob(app, job: CryptoJob, text_title: str, cancellable: bool = True):
+    """
+    Runs a crypto job while a dialog shows its progress, the application keeps handling
+    events until the job is done
+    :param app: reference to the main application object
+    :param job: the job to run
+    :param text_title: the title of the dialog
+    :param cancellable: whether or not the user can cancel the job
+    :return: returns nothing
+    """
+    dialog_progress = DialogBuilder(app, "Crypto", text_title, "")
+    progress_bar = QProgressBar()
+    progress_bar.setRange(0, max(1, len(job.paths)))
+    dialog_progress.addWidget(progress_bar)
+
+    def onProgress(done, total, path):
+        """
+        Shows the number of files done
+        """
+        progress_bar.setValue(done)
+        dialog_progress.setMsgText("%d of %d files\n%s" % (done, total, path))
+
+    if cancellable:
+        button_box = QDialogButtonBox(QDialogButtonBox.Cancel)
+        button_box.rejected.connect(job.cancel)
+        dialog_progress.addWidget(button_box)
+    job.progress.connect(onProgress)
+    job.finished.connect(dialog_progress.accept)
+    job.start()
+    dialog_progress.exec()
+
+    # the dialog may be closed before the job is done
+    if job.isRunning():
+        if cancellable:
+            job.cancel()
+        job.wait()
+
+    if job.failed:
+        dialog_failed = DialogBuilder(app, "Crypto - Error",
+                                      "%d files could not be written" % len(job.failed),
+                                      "\n".join(path for path, _ in job.failed[:10]))
+        dialog_failed.addButtonBox(QDialogButtonBox(QDialogButtonBox.Ok))
+        dialog_failed.exec()
+
+
+def getWorkspaceFiles(path_workspace: str) -> list:
+    """
+    Lists the files decrypting looks at. Hidden and ignored files are included, as they may
+    have been encrypted before they were hidden or ignored.
+    :return: returns the paths of every file in the workspace but the key and the manifest
+    """
+    paths = []
+    for dirpath, _, filenames in os.walk(path_workspace):
+        for filename in filenames:
+            if dirpath != path_workspace or filename not in ('.leafCryptoKey', MANIFEST_FILE):
+                paths.append(os.path.join(dirpath, filename))
+    return paths
+
+
+def getEncryptedFiles(encryptor: Encryptor, paths: list) -> list:
+    """
+    :return: returns the paths of the files that are still encrypted, files that could not be
+    read are counted as encrypted
+    """
+    encrypted = []
+    for path in paths:
+        try:
+            if encryptor.isEncryptedFile(path):
+                encrypted.append(path)
+        except OSError as e:
+            logging.warning("Could not read file - %s", e)
+            encrypted.append(path)
+    return encrypted
 
 
 def onEncryptionAction(app, file_manager):
@@ -101,23 +462,15 @@ def encryptionDialogHandler(app, file_manager, button):
         path_workspace = app.left_menu.model.rootPath()
         path_key = os.path.join(path_workspace, '.leafCryptoKey')
         try:
-            with open(path_key, 'wb') as f:
-                f.write(key)
-                logging.debug("Saved key to: %s", path_key)
+            atomicWrite(path_key, key)
+            logging.debug("Saved key to: %s", path_key)
         except OSError as e:
             logging.exception(e)
             logging.error("Failed to save CRYPTO KEY")
             return
 
         file_manager.encryptor = Encryptor(key)
-        logging.info("START ENCRYPT FILES IN WORKSPACE: %s", path_workspace)
-        for dirpath, dirnames, filenames in os.walk(path_workspace):
-            for filename in [f for f in filenames if not f.startswith(".")]:
-                path = os.path.join(dirpath, filename)
-                file_manager.encryptor.encryptFile(path)
-                logging.info(" - Encrypted: %s", path)
-                logging.debug(dirnames)
-        logging.info("END ENCRYPT FILES IN WORKSPACE: %s", path_workspace)
+        encryptWorkspace(app, file_manager, path_workspace)
 
     else:
         logging.info("User canceled")
@@ -132,27 +485,109 @@ def decryptionDialogHandler(app, file_manager, button):
     """
     if button.text() == "&Yes":
         logging.info("User clicked Yes")
+        decryptWorkspace(app, file_manager, app.left_menu.model.rootPath())
 
-        path_workspace = app.left_menu.model.rootPath()
-        logging.info("START DECRYPT WORKSPACE: %s", path_workspace)
-        for dirpath, dirnames, filenames in os.walk(path_workspace):
-            for filename in [f for f in filenames if not f.startswith(".")]:
-                path = os.path.join(dirpath, filename)
-                file_manager.encryptor.decryptFile(path)
-                logging.info(" - Decrypted: %s", path)
-                logging.debug(dirnames)
-        logging.info("END DECRYPT WORKSPACE: %s", path_workspace)
+    else:
+        logging.info("User canceled")
 
-        path_key = os.path.join(path_workspace, '.leafCryptoKey')
-        if os.path.exists(path_key):
-            os.remove(path_key)
-            logging.debug("Removed CRYPTO KEY: %s", path_key)
-        else:
-            logging.error("Failed to remove CRYPTO KEY")
-            return
 
-        file_manager.encryptor = None
-        logging.debug("De-initialized Encryptor")
+def encryptWorkspace(app, file_manager, path_workspace: str):
+    """
+    Encrypts the files of the workspace with the encryptor of the file manager
+    :param app: application context
+    :param file_manager: file_manager context
+    :param path_workspace: path to the root of the workspace
+    :return: returns whether or not every file was encrypted
+    """
+    # let the queued saves finish before the files are encrypted
+    file_manager.save_queue.flush()
+    logging.info("START ENCRYPT FILES IN WORKSPACE: %s", path_workspace)
+    paths = list(file_manager.getWorkspaceFilter(path_workspace).walk())
+    job = CryptoJob(file_manager.encryptor.key, paths, True, CryptoManifest(path_workspace))
+    runCryptoJob(app, job, "Encrypting Workspace")
+    # the search engine keeps the plain text it read before the files were encrypted
+    file_manager.search_engine.clearCache()
+    # the index holds the tokens of every file
+    file_manager.rewriteWorkspaceIndex(path_workspace)
+    # files that were not encrypted yet are still read, the manifest keeps the job to be
+    # resumed
+    logging.info("END ENCRYPT FILES IN WORKSPACE: %s", path_workspace)
+    return not job.isCancelled() and not job.failed
+
+
+def decryptWorkspace(app, file_manager, path_workspace: str):
+    """
+    Decrypts the files of the workspace and removes the key once every file is decrypted
+    :param app: application context
+    :param file_manager: file_manager context
+    :param path_workspace: path to the root of the workspace
+    :return: returns whether or not every file was decrypted
+    """
+    file_manager.save_queue.flush()
+    logging.info("START DECRYPT WORKSPACE: %s", path_workspace)
+    # files that are not encrypted are skipped by their header
+    paths = getWorkspaceFiles(path_workspace)
+    job = CryptoJob(file_manager.encryptor.key, paths, False, CryptoManifest(path_workspace))
+    runCryptoJob(app, job, "Decrypting Workspace")
+    logging.info("END DECRYPT WORKSPACE: %s", path_workspace)
+
+    # the key is kept until no encrypted file is left
+    if job.isCancelled() or job.failed or \
+            getEncryptedFiles(file_manager.encryptor, getWorkspaceFiles(path_workspace)):
+        logging.warning("Workspace not fully decrypted, keeping CRYPTO KEY")
+        return False
 
+    path_key = os.path.join(path_workspace, '.leafCryptoKey')
+    if os.path.exists(path_key):
+        os.remove(path_key)
+        logging.debug("Removed CRYPTO KEY: %s", path_key)
     else:
+        logging.error("Failed to remove CRYPTO KEY")
+        return False
+
+    # the hashes of the manifest were keyed with the removed key
+    path_manifest = os.path.join(path_workspace, MANIFEST_FILE)
+    if os.path.exists(path_manifest):
+        os.remove(path_manifest)
+
+    file_manager.encryptor.clearCache()
+    file_manager.search_engine.clearCache()
+    file_manager.encryptor = None
+    logging.debug("De-initialized Encryptor")
+    file_manager.rewriteWorkspaceIndex(path_workspace)
+    return True
+
+
+def resumeCryptoJob(app, file_manager):
+    """
+    Offers to finish encrypting or decrypting the workspace if the manifest holds a job that
+    was interrupted
+    :param app: application context
+    :param file_manager: file_manager context
+    :return: returns nothing
+    """
+    path_workspace = app.left_menu.model.rootPath()
+    operation = CryptoManifest(path_workspace).operation
+    if operation is None:
+        return
+    if file_manager.encryptor is None:
+        logging.error("Crypto job can not be resumed without the CRYPTO KEY")
+        return
+
+    logging.info("Found interrupted crypto job - %s", operation)
+    if operation == OPERATION_ENCRYPT:
+        text_title = "The workspace was left partly encrypted."
+        text_msg = "Would you like to finish encrypting it?"
+    else:
+        text_title = "The workspace was left partly decrypted."
+        text_msg = "Would you like to finish decrypting it?"
+    dialog_resume = DialogBuilder(app, "Crypto - Resume", text_title, text_msg)
+    dialog_resume.addButtonBox(QDialogButtonBox(QDialogButtonBox.No | QDialogButtonBox.Yes))
+    if not dialog_resume.exec():
         logging.info("User canceled")
+        return
+
+    if operation == OPERATION_ENCRYPT:
+        encryptWorkspace(app, file_manager, path_workspace)
+    else:
+        decryptWorkspace(app, file_manager, path_workspace)
@@ -3,14 +3,59 @@ File Manager module defines the methods used to
 open, save, close, create and modify files.
 Both Plain-Text and Proprietary Format LEF files.
 """
+import hashlib
 import logging
 import os
 
 from PyQt5.QtCore import QFileInfo
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
-from PyQt5.QtWidgets import QFileDialog, QDialogButtonBox, QDialog
+from PyQt5.QtWidgets import QFileDialog, QDialogButtonBox, QDialog, QPlainTextEdit
+from cryptography.fernet import InvalidToken
 
 from LeafNote.Utils import DialogBuilder
+from LeafNote.Utils.AtomicFile import atomicWrite
+from LeafNote.Utils.ChunkedCipher import isContainerFile
+from LeafNote.Utils.FileWatcher import FileWatcher
+from LeafNote.Utils.Hibernation import BYTES_PER_CHARACTER, TabResidency, hibernate, wake
+from LeafNote.Utils.LineMerge import merge, formatDiff, getOpcodes, splitLines
+from LeafNote.Utils.MappedFile import MappedFile
+from LeafNote.Utils.Encryptor import isEncryptedData
+from LeafNote.Utils.SaveQueue import SaveQueue
+from LeafNote.Utils.SearchEngine import SearchEngine
+from LeafNote.Utils.WorkspaceFilter import WorkspaceFilter, isBinaryData, SNIFF_SIZE
+from LeafNote.Utils.WorkspaceIndex import WorkspaceIndex, removeIndex
+
+# the choices offered when an open file with unsaved changes was changed by another program
+KEEP_MINE = 0
+MERGE_CHANGES = 1
+TAKE_THEIRS = 2
+
+
+def contentHash(data: str, encoded: bytes = None) -> bytes:
+    """
+    :param data: the text of the file
+    :param encoded: the utf-8 bytes of the text if they are already known
+    :return: returns the digest used to tell whether or not the contents of a file changed
+    """
+    if encoded is None:
+        encoded = data.encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(encoded, digest_size=16).digest()
+
+
+def decodeData(data: bytes) -> tuple:
+    """
+    Turns the bytes of a file into the text of a document, line breaks are turned into \\n like
+    reading the file as text does
+    :param data: the plain bytes of the file
+    :return: returns the text and its utf-8 bytes
+    :raises ValueError: if the data is not utf-8 text
+    """
+    text = data.decode('utf-8')
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        data = text.encode('utf-8')
+    return text, data
 
 
 class FileManager:
@@ -29,12 +74,82 @@ class FileManager:
 
         # open_documents - dict that holds the key value pairs of (absolute path : QFileInfo)
         self.open_documents = {}
+        # text_documents - dict of (absolute path : QTextDocument) holding the contents of
+        # every open document so switching between them does not re-read the file
+        self.text_documents = {}
+        # view_states - dict of (absolute path : (anchor, position, h scroll, v scroll)) of the
+        # open documents that are not shown, including the ones restored from the last session
+        # that were not read yet
+        self.view_states = {}
+        # hibernated_documents - dict of (absolute path : HibernatedDocument) of the open
+        # documents that were dropped from memory to stay within the memory budget
+        self.hibernated_documents = {}
+        # mapped_files - dict of (absolute path : MappedFile) of the open files that are too
+        # large for the document, they are shown read only by the mapped viewer
+        self.mapped_files = {}
+        # saved_hashes - dict of (absolute path : contentHash) of the data last read from or
+        # written to every file, before encryption
+        self.saved_hashes = {}
+        # snapshots - dict of (absolute path : HibernatedDocument) of the data last read from or
+        # written to every open file, the base the changes of other programs are merged with
+        self.snapshots = {}
+        # file_watcher - reports the open files changed by other programs
+        self.file_watcher = FileWatcher()
+        self.file_watcher.changed.connect(self.onExternalChange)
+        # autosave - records the edits of the shown document in recovery journals, set by the
+        # application once the document exists
+        self.autosave = None
+        # save_queue - writes the saved documents on a worker thread
+        self.save_queue = SaveQueue()
+        self.save_queue.saved.connect(self.onFileSaved)
+        self.save_queue.failed.connect(self.onSaveFailed)
+        # residency - the least recently used order of the documents held in memory
+        self.residency = TabResidency(self.app.app_props.tab_memory_budget)
         # current_document - the current document that is displayed to the user
         self.current_document = None
-        # last_access - the time when the file was opened
-        self.file_opened_time = None
 
         self.encryptor = None
+        # workspace_index - the search index of the workspace, created when first searched
+        self.workspace_index = None
+        # search_engine - matches search phrases against files in the workspace
+        self.search_engine = SearchEngine(self)
+
+    def getWorkspaceIndex(self, root: str) -> WorkspaceIndex:
+        """
+        Returns the search index of the given workspace, bringing it up to date with the disk
+        :param root: path to the root of the workspace
+        :return: returns the workspace index
+        """
+        if self.workspace_index is None or \
+                self.workspace_index.root != os.path.abspath(root):
+            if self.workspace_index is not None:
+                self.workspace_index.save()
+            self.workspace_index = WorkspaceIndex(root, self)
+
+        self.workspace_index.refresh()
+        return self.workspace_index
+
+    def rewriteWorkspaceIndex(self, root: str):
+        """
+        Stores the search index of a workspace like its files after the workspace was encrypted
+        or decrypted, an index that is not loaded is removed and built again when searched
+        :param root: path to the root of the workspace
+        :return: returns nothing
+        """
+        if self.workspace_index is not None and \
+                self.workspace_index.root == os.path.abspath(root):
+            self.workspace_index.rewrite()
+        else:
+            removeIndex(root)
+
+    def getWorkspaceFilter(self, root: str) -> WorkspaceFilter:
+        """
+        Returns the filter deciding which files of the given workspace are scanned,
+        with the ignore rules currently on disk
+        :param root: path to the root of the workspace
+        :return: returns the workspace filter
+        """
+        return WorkspaceFilter(root, self.app.app_props.max_scan_size)
 
     def saveDocument(self, document):
         """
@@ -44,6 +159,21 @@ class FileManager:
         """
         file_missing = False
 
+        # if the document has not been edited do nothing
+        if self.current_document is not None and not document.document().isModified():
+            return False
+
+        # mapped files are read only, the document only holds a placeholder
+        if self.current_document is not None and \
+                self.isMapped(self.current_document.absoluteFilePath()):
+            return False
+
+        # a document that is still loading or was only partially loaded would truncate the file
+        if self.current_document is not None and (document.isLoading() or document.isPartial()):
+            logging.warning("Not saving partially loaded document - %s",
+                            self.current_document.absoluteFilePath())
+            return False
+
         # get the current text from the document shown to the user
         if self.app.btn_mode_switch.isChecked():
             data = document.toHtml()
@@ -52,9 +182,10 @@ class FileManager:
             data = document.toPlainText()
             file_filter = ""
 
-        # if the file has not been changed do nothing
-        if self.current_document is not None and data == self.getFileData(
-                self.current_document.absoluteFilePath()):
+        # if the edits did not change the file do nothing
+        if self.current_document is not None and self.isSaved(
+                self.current_document.absoluteFilePath(), data):
+            document.document().setModified(False)
             return False
 
         # if a file has already been opened write to the file
@@ -67,14 +198,10 @@ class FileManager:
                 return False
 
             if not file_missing:
-                # if the file is not missing check its time
-                if self.checkCurrentFileTime(document):
-                    # if the user is up to date or wants to save the current document
-                    self.writeFileData(self.current_document.absoluteFilePath(), data)
-                    self.file_opened_time = os.path.getatime(
-                        self.current_document.absoluteFilePath()
-                    )
-                    logging.info("Saved File - %s", self.current_document.absoluteFilePath())
+                # changes made to the file by other programs were already merged when they
+                # were noticed by the file watcher
+                self.queueFileData(self.current_document.absoluteFilePath(), data)
+                document.document().setModified(False)
                 return True
 
         # get the entered data
@@ -90,11 +217,14 @@ class FileManager:
 
         # write the text in the document shown to the user to the given file path
         self.writeFileData(path, data)
+        document.document().setModified(False)
 
         # append the newly created file to the dict of open docs and set it to the curr document
         self.open_documents[path] = QFileInfo(path)
+        self.text_documents[path] = document.document()
+        self.enforceMemoryBudget(document, path)
         self.current_document = self.open_documents[path]
-        self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
+        self.watchFile(path, data)
 
         # if the file had been moved or deleted while editing and the user chose to save
         if file_missing:
@@ -104,6 +234,109 @@ class FileManager:
         logging.info("Saved File - %s", path)
         return True
 
+    def isSaved(self, path: str, data: str) -> bool:
+        """
+        Checks whether or not the data is what was last read from or written to the file
+        :param path: path to the file
+        :param data: the data that would be written to the file
+        :return: returns true if writing the data would not change the file
+        """
+        return self.saved_hashes.get(path) == contentHash(data)
+
+    def setSavedData(self, path: str, data: str, encoded: bytes = None, queued: bool = False):
+        """
+        Remembers the data that was read from or written to a file
+        :param path: path to the file
+        :param data: the data of the file before encryption
+        :param encoded: the utf-8 bytes of the data if they are already known
+        :param queued: whether or not the data is only queued to be written, the file holds
+        the data it held before until the save queue wrote it
+        :return: returns nothing
+        """
+        self.saved_hashes[path] = contentHash(data, encoded)
+        if not queued:
+            self.save_queue.setDigest(path, self.saved_hashes[path])
+        # only the open files are merged with the changes of other programs
+        if path in self.open_documents:
+            self.snapshots[path] = hibernate(data, encoded=encoded)
+
+    def getStoredHash(self, path: str):
+        """
+        :return: returns the contentHash of the data the file holds, as last read or written
+        successfully, or None if it is not known
+        """
+        return self.save_queue.getDigest(path)
+
+    def isModified(self, document) -> bool:
+        """
+        Checks whether or not the shown document has changes that are not saved to its file
+        :param document: reference to the document
+        :return: returns true if the document needs to be saved
+        """
+        if self.current_document is None:
+            return document.toPlainText() != ""
+        if not document.document().isModified():
+            return False
+        if self.current_document.suffix() == "lef":
+            data = document.toHtml()
+        else:
+            data = document.toPlainText()
+        return not self.isSaved(self.current_document.absoluteFilePath(), data)
+
+    def getOpenDocumentData(self, document, path: str):
+        """
+        :param document: reference to the document
+        :param path: path to an open document
+        :return: returns the (text, modified) of the document held in memory or hibernated, or
+        None if its text is not known completely
+        """
+        text_document = self.text_documents.get(path)
+        if text_document is not None:
+            if document.isLoading(text_document) or document.isPartial(text_document):
+                return None
+            if QFileInfo(path).suffix() == 'lef':
+                return text_document.toHtml(), text_document.isModified()
+            return text_document.toPlainText(), text_document.isModified()
+        hibernated = self.hibernated_documents.get(path)
+        if hibernated is not None:
+            return wake(hibernated), hibernated.modified
+        return None
+
+    def getModifiedDocuments(self, document) -> list:
+        """
+        Checks the open documents that are not shown for changes that are not saved
+        :param document: reference to the document
+        :return: returns the paths of the documents that need to be saved
+        """
+        modified = []
+        for path in self.open_documents:
+            if self.text_documents.get(path) is document.document():
+                continue
+            state = self.getOpenDocumentData(document, path)
+            if state is not None and state[1] and not self.isSaved(path, state[0]):
+                modified.append(path)
+        return modified
+
+    def saveOpenDocument(self, document, path: str) -> bool:
+        """
+        Saves an open document that is not shown
+        :param document: reference to the document
+        :param path: path to the open document
+        :return: returns whether or not the document was queued to be saved
+        """
+        if self.text_documents.get(path) is document.document():
+            return self.saveDocument(document)
+        state = self.getOpenDocumentData(document, path)
+        if state is None:
+            return False
+        self.queueFileData(path, state[0])
+        if path in self.text_documents:
+            self.text_documents[path].setModified(False)
+        else:
+            self.hibernated_documents[path] = self.hibernated_documents[path]._replace(
+                modified=False)
+        return True
+
     def checkCurrentFileExists(self):
         """
         this checks if the current file the user is working on exists.
@@ -144,48 +377,6 @@ class FileManager:
         logging.info("User chose NOT to save the file.")
         return False, False
 
-    def checkCurrentFileTime(self, document):
-        """
-        this will check the times of the current file to see if its outdated. If it is up to date
-        save it. If it is not up to date prompt the user if they want to update to the most
-        recent changes or keep their current changes.
-        :param document: reference to the document
-        :return: returns true if the user wants to keep their changes, false otherwise
-        """
-        if self.file_opened_time is not None and self.file_opened_time < os.path.getmtime(
-                self.current_document.absoluteFilePath()):
-            # if the file has been modified since the document was opened
-            logging.warning("opened: %s, modified: %s", str(self.file_opened_time),
-                            str(os.path.getmtime(self.current_document.absoluteFilePath())))
-
-            # prompt the user if they want to keep their changes
-            file_not_up_to_date_dialog = DialogBuilder(self.app,
-                                                       "File not up to date",
-                                                       "File not up to date",
-                                                       "The file has been "
-                                                       "externally "
-                                                       "modified. Would you "
-                                                       "like to keep your "
-                                                       "changes?")
-            button_box = QDialogButtonBox(QDialogButtonBox.No | QDialogButtonBox.Yes)
-            file_not_up_to_date_dialog.addButtonBox(button_box)
-
-            if file_not_up_to_date_dialog.exec():
-                # if they want to keep their changes return true
-                logging.debug("User chose to keep their changes")
-                return True
-
-            # if they want to update to the most recent changes on disk return false
-            logging.debug("User chose to update to file saved on disk")
-            data = self.getFileData(self.current_document.absoluteFilePath())
-            self.writeFileData(self.current_document.absoluteFilePath(), data)
-            self.openDocument(document, self.current_document.absoluteFilePath(), False)
-            self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
-            return False
-
-        # return true if the file is up to date
-        return True
-
     def saveAsDocument(self, document):
         """
         prompts the user for a new filename or path and saves the document as that
@@ -219,7 +410,7 @@ class FileManager:
         # add the document to the dict of documents
         self.open_documents[new_path] = QFileInfo(new_path)
         self.current_document = self.open_documents[new_path]
-        self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
+        self.watchFile(new_path, data)
 
         # open the document with its new text
         self.openDocument(document, new_path)
@@ -236,33 +427,40 @@ class FileManager:
         # if the path exists in the open docs list remove it
         if path in self.open_documents:
             self.open_documents.pop(path)
+            text_document = self.text_documents.pop(path, None)
+            self.view_states.pop(path, None)
+            self.hibernated_documents.pop(path, None)
+            self.residency.remove(path)
+            self.unmapFile(path)
+            self.unwatchFile(path)
+            if self.autosave is not None:
+                self.autosave.discard(path)
             logging.info("Closed File - %s", path)
 
             # if the open documents is NOT empty change the current document to another open file
             if bool(self.open_documents):
-                # get the current tab and open its respective file
+                # get the current tab and show its respective file
                 index = self.app.bar_open_tabs.currentIndex()
                 path = self.app.bar_open_tabs.tabData(index)
                 self.current_document = self.open_documents[path]
+                state = (self.current_document.suffix() == 'lef')
 
                 # get File data will never return None here because the document
                 # had to already be opened to get to this point
-                # update the formatting enabled accordingly
-                text = self.getFileData(self.current_document.absoluteFilePath())
-                document.setFormatText(text, self.current_document.suffix() == 'lef')
-                self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
-
-                state = (self.current_document.suffix() == 'lef')
+                self.showDocument(document, path)
 
             # if the open documents IS empty set the current document
             # to none/empty document with no path
             else:
                 self.current_document = None
-                self.file_opened_time = None
 
-                document.setPlainText("")
+                self.showEmptyDocument(document)
                 state = False
 
+            if text_document is not None:
+                document.releaseTextDocument(text_document)
+
+            self.updateViewer(document)
             self.app.right_menu.updateDetails(self.current_document)
             self.app.updateFormatBtnsState(state)
 
@@ -281,10 +479,22 @@ class FileManager:
         """
         logging.info("closeAll")
         self.current_document = None
-        self.file_opened_time = None
 
         self.open_documents.clear()
-        document.setPlainText("")
+        self.showEmptyDocument(document)
+        for text_document in self.text_documents.values():
+            document.releaseTextDocument(text_document)
+        self.text_documents.clear()
+        self.view_states.clear()
+        self.hibernated_documents.clear()
+        self.residency.sizes.clear()
+        for path in list(self.mapped_files):
+            self.unmapFile(path)
+        self.file_watcher.unwatchAll()
+        self.snapshots.clear()
+        self.updateViewer(document)
+        if self.autosave is not None:
+            self.autosave.discardAll()
         self.app.updateFormatBtnsState(False)
 
     def openDocument(self, document, path: str, save: bool = True):
@@ -320,85 +530,357 @@ class FileManager:
                 logging.info("No File Path Given")
                 return False
 
-            # retrieve the text from the file you are attempting to open
-            data = self.getFileData(path)
-            if data is None:
-                return False
+            # retrieve the text from the file you are attempting to open, files too large
+            # to read are mapped and the document holds an empty placeholder
+            if self.isHugeFile(path):
+                if not self.mapFile(path):
+                    return False
+                data = ""
+            else:
+                data = self.getFileData(path)
+                if data is None:
+                    return False
 
             # appends the path to the list of open documents and sets it to the current document
+            self.storeViewState(document)
             self.open_documents[path] = QFileInfo(path)
             self.current_document = self.open_documents[path]
-            self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
+            self.watchFile(path, None if self.isMapped(path) else data)
 
             # if the file is not opened in the open tabs bar open it
             if path not in self.app.bar_open_tabs.open_tabs:
                 self.app.bar_open_tabs.addTab(path)
 
+            # check for the proprietary file extension .lef and update the top bar accordingly
+            self.loadDocument(document, path, data)
+            self.enforceMemoryBudget(document, path)
             logging.info("Opened Document - %s", path)
 
         # if the document has already been opened in this session
         else:
-            # get the data from the file and set the current document
-            data = self.getFileData(path)
-            if data is None:
+            self.storeViewState(document)
+            if not self.showDocument(document, path):
                 return False
 
             self.current_document = self.open_documents[path]
-            self.file_opened_time = os.path.getatime(self.current_document.absoluteFilePath())
-            self.app.bar_open_tabs.setCurrentIndex(self.app.bar_open_tabs.open_tabs[path])
+            self.app.bar_open_tabs.setCurrentIndex(self.app.bar_open_tabs.getTabIndex(path))
             logging.info("Document Already Open - %s", path)
 
-        # check for the proprietary file extension .lef and update the top bar accordingly
-        document.setFormatText(data, self.current_document.suffix() == 'lef')
-
         # Update the formatting buttons based on the state
         self.app.updateFormatBtnsState(self.current_document.suffix() == 'lef')
         # update the document shown to the user
+        self.updateViewer(document)
         self.app.right_menu.updateDetails(path)
         # self.app.left_menu.selectItemFromPath(path)
         return True
 
+    def loadDocument(self, document, path: str, data: str):
+        """
+        Shows the data of a file in a document of its own and keeps the document in memory
+        :param document: reference to the document
+        :param path: path to the file
+        :param data: the data read from the file
+        :return: returns nothing
+        """
+        # plain text files are edited by the plain text editor, the document shown while no
+        # file was open is reused for the first file if it is edited by the right editor
+        plain = QFileInfo(path).suffix() != 'lef'
+        shown = document.document()
+        if shown in self.text_documents.values() or document.isPlainTextDocument(shown) != plain:
+            document.setTextDocument(document.createTextDocument(plain))
+            if shown not in self.text_documents.values():
+                document.releaseTextDocument(shown)
+        # loading the file is not an edit to journal
+        if self.autosave is not None:
+            self.autosave.recording = False
+        document.setFormatText(data, QFileInfo(path).suffix() == 'lef')
+        if self.autosave is not None:
+            self.autosave.recording = True
+        document.document().setModified(False)
+        self.text_documents[path] = document.document()
+
+    def showEmptyDocument(self, document):
+        """
+        Shows a new empty document in the rich text editor once no file is open
+        :param document: reference to the document
+        :return: returns nothing
+        """
+        shown = document.document()
+        document.setTextDocument(document.createTextDocument())
+        if shown not in self.text_documents.values():
+            document.releaseTextDocument(shown)
+
+    def showDocument(self, document, path: str) -> bool:
+        """
+        Shows an open document, from memory if it is held there, otherwise from its hibernated
+        copy or from the file
+        :param document: reference to the document
+        :param path: path to the open document
+        :return: returns whether or not the document could be shown
+        """
+        if path in self.text_documents:
+            document.setTextDocument(self.text_documents[path], self.view_states.pop(path, None))
+            document.enableFormatting(QFileInfo(path).suffix() == 'lef')
+        elif path in self.hibernated_documents:
+            logging.info("Waking Document - %s", path)
+            hibernated = self.hibernated_documents.pop(path)
+            self.loadDocument(document, path, wake(hibernated))
+            document.document().setModified(hibernated.modified)
+            if hibernated.view_state is not None:
+                document.setViewState(hibernated.view_state)
+            self.app.bar_open_tabs.setTabResident(path, True)
+        elif self.isMapped(path):
+            self.loadDocument(document, path, "")
+        else:
+            # documents that were discarded or restored from the last session are read again
+            if self.isHugeFile(path):
+                if not self.mapFile(path):
+                    return False
+                data = ""
+            else:
+                data = self.getFileData(path)
+                if data is None:
+                    return False
+            self.loadDocument(document, path, data)
+            view_state = self.view_states.pop(path, None)
+            if view_state is not None and not self.isMapped(path):
+                document.setViewState(view_state)
+            self.app.bar_open_tabs.setTabResident(path, True)
+        self.enforceMemoryBudget(document, path)
+        return True
+
+    def restoreDocument(self, path: str, view_state: tuple = None):
+        """
+        Opens a tab of the last session without reading its file, the file is read when the
+        tab is first shown
+        :param path: path to the file
+        :param view_state: the cursor and scroll position to show the document at or None
+        :return: returns nothing
+        """
+        logging.info("Restoring Document - %s", path)
+        self.open_documents[path] = QFileInfo(path)
+        if view_state is not None:
+            self.view_states[path] = view_state
+        self.watchFile(path)
+        self.app.bar_open_tabs.addTab(path)
+        self.app.bar_open_tabs.setTabResident(path, False)
+
+    def getViewState(self, document, path: str):
+        """
+        :param document: reference to the document
+        :param path: path to an open document
+        :return: returns the cursor and scroll position of the open document or None if it is
+        not known
+        """
+        if self.current_document is not None and \
+                self.current_document.absoluteFilePath() == path and \
+                self.text_documents.get(path) is document.document():
+            return document.getViewState()
+        if path in self.hibernated_documents:
+            return self.hibernated_documents[path].view_state
+        return self.view_states.get(path)
+
+    def isHugeFile(self, path: str) -> bool:
+        """
+        Checks whether or not a file is too large to be read into the document. Encrypted
+        files written as a single token by older versions are always read since they have to
+        be decrypted as a whole.
+        :param path: path to the file
+        :return: returns true if the file should be mapped
+        """
+        if self.encryptor is not None and not isContainerFile(path):
+            return False
+        try:
+            return os.path.getsize(path) > self.app.app_props.mapped_file_size
+        except OSError:
+            return False
+
+    def mapFile(self, path: str) -> bool:
+        """
+        Maps a file that is too large to be read into the document
+        :param path: path to the file
+        :return: returns whether or not the file could be mapped
+        """
+        logging.info("Mapping huge file - %s", path)
+        try:
+            cipher = self.encryptor.cipher if self.encryptor is not None else None
+            self.mapped_files[path] = MappedFile(path, cipher)
+        except (OSError, ValueError, InvalidToken) as e:
+            logging.exception(e)
+            logging.error("File could not be mapped!")
+            map_failed = DialogBuilder(self.app,
+                                       "File Too Large",
+                                       "Could not open the selected file.",
+                                       str(e))
+            map_failed.addButtonBox(QDialogButtonBox(QDialogButtonBox.Ok))
+            map_failed.exec()
+            return False
+        return True
+
+    def isMapped(self, path: str) -> bool:
+        """
+        :return: returns whether or not the open file is shown by the mapped viewer
+        """
+        return path in self.mapped_files
+
+    def unmapFile(self, path: str):
+        """
+        Unmaps a file that was closed
+        :param path: path to the file
+        :return: returns nothing
+        """
+        mapped_file = self.mapped_files.pop(path, None)
+        if mapped_file is not None:
+            if self.app.viewer.mapped_file is mapped_file:
+                self.app.viewer.setMappedFile(None)
+            mapped_file.close()
+
+    def updateViewer(self, document):
+        """
+        Shows the mapped viewer in place of the document while a mapped file is current
+        :param document: reference to the document
+        :return: returns nothing
+        """
+        mapped_file = None
+        if self.current_document is not None:
+            mapped_file = self.mapped_files.get(self.current_document.absoluteFilePath())
+        self.app.viewer.setMappedFile(mapped_file)
+        document.setEditorVisible(mapped_file is None)
+
+    def enforceMemoryBudget(self, document, path: str):
+        """
+        Marks the shown document as the most recently used one and hibernates the least
+        recently used documents until the ones held in memory fit in the memory budget
+        :param document: reference to the document
+        :param path: path to the shown document
+        :return: returns nothing
+        """
+        size = self.text_documents[path].characterCount() * BYTES_PER_CHARACTER
+        self.residency.touch(path, size)
+        for evicted in self.residency.evictions(path):
+            # the text of documents that are not fully loaded can not be restored
+            text_document = self.text_documents[evicted]
+            if document.isLoading(text_document) or document.isPartial(text_document):
+                continue
+            self.hibernateDocument(document, evicted)
+
+    def hibernateDocument(self, document, path: str):
+        """
+        Drops an open document that is not shown from memory and keeps a compressed copy of it
+        :param document: reference to the document
+        :param path: path to the open document
+        :return: returns nothing
+        """
+        logging.info("Hibernating Document - %s", path)
+        text_document = self.text_documents.pop(path)
+        if QFileInfo(path).suffix() == 'lef':
+            text = text_document.toHtml()
+        else:
+            text = text_document.toPlainText()
+        self.hibernated_documents[path] = hibernate(text, text_document.isModified(),
+                                                    self.view_states.pop(path, None))
+        self.residency.remove(path)
+        document.releaseTextDocument(text_document)
+        self.app.bar_open_tabs.setTabResident(path, False)
+
+    def discardDocument(self, document, path: str):
+        """
+        Drops the contents of an open document that is not shown, so they are read from the
+        file again the next time it is shown
+        :param document: reference to the document
+        :param path: path to the open document
+        :return: returns nothing
+        """
+        text_document = self.text_documents.pop(path, None)
+        if text_document is not None:
+            document.releaseTextDocument(text_document)
+        if self.hibernated_documents.pop(path, None) is not None:
+            self.app.bar_open_tabs.setTabResident(path, True)
+        self.view_states.pop(path, None)
+        self.residency.remove(path)
+
+    def isResident(self, path: str) -> bool:
+        """
+        :return: returns whether or not the open document of the path is held in memory
+        """
+        return path in self.text_documents
+
+    def getMemoryUsage(self) -> list:
+        """
+        :return: returns a list of (path, resident, size) of the open documents where the size
+        is the estimated size in memory or the size of the hibernated copy
+        """
+        usage = []
+        for path in self.open_documents:
+            if path in self.residency:
+                usage.append((path, True, self.residency.sizes[path]))
+            elif path in self.hibernated_documents:
+                usage.append((path, False, len(self.hibernated_documents[path].data)))
+        return usage
+
+    def storeViewState(self, document):
+        """
+        Remembers the cursor and scroll position of the current document before another
+        document is shown
+        :param document: reference to the document
+        :return: returns nothing
+        """
+        if self.current_document is None:
+            return
+        path = self.current_document.absoluteFilePath()
+        if self.text_documents.get(path) is document.document():
+            self.view_states[path] = document.getViewState()
+
     def getFileData(self, path: str):
         """
         This retrieves the data from the file at the specified path.
         :param path: The path to read data from
         :return: Returns a string of the read in data
         """
-        # open the file with read only privileges
+        # wait for the queued data of the file to be written
         logging.debug(path)
-        file = open(path, 'r')
+        self.save_queue.waitFor(path)
 
-        # check if the file was opened
-        if file.closed:
-            logging.info("Could Not Open File - %s", path)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read(SNIFF_SIZE)
+                # the first bytes tell encrypted files from plain ones
+                encrypted = self.encryptor is not None and isEncryptedData(data)
+                is_binary = not encrypted and isBinaryData(data)
+                if encrypted:
+                    logging.debug("File was encrypted. Decrypting")
+                    data = self.encryptor.readFile(path, file, data)
+                elif not is_binary:
+                    data += file.read()
+            if not is_binary:
+                text, data = decodeData(data)
+
+        except (ValueError, OSError, InvalidToken) as e:
+            corrupted_file = DialogBuilder(self.app,
+                                           "File Corrupted",
+                                           "Could not open the selected file.",
+                                           "")
+            button_box = QDialogButtonBox(QDialogButtonBox.Ok)
+            corrupted_file.addButtonBox(button_box)
+            corrupted_file.exec()
+            logging.exception(e)
+            logging.error("File could not be opened!")
             return None
 
-        # read all data then close file
-        with file:
-            try:
-                data = file.read()
-
-            except (ValueError, OSError) as e:
-                corrupted_file = DialogBuilder(self.app,
-                                               "File Corrupted",
-                                               "Could not open the selected file.",
-                                               "")
-                button_box = QDialogButtonBox(QDialogButtonBox.Ok)
-                corrupted_file.addButtonBox(button_box)
-                corrupted_file.exec()
-                logging.exception(e)
-                logging.error("File could not be opened!")
-                return None
-        file.close()
-
-        try:
-            if self.encryptor is not None:
-                data = self.encryptor.decrypt(data.encode()).decode()
-                logging.debug("File was encrypted. Decrypting")
-        except OSError:
-            logging.info("File wasn't encrypted. Proceeding as normal")
+        # do not show binary files as text
+        if is_binary:
+            logging.info("Not a text file - %s", path)
+            binary_file = DialogBuilder(self.app,
+                                        "Not a Text File",
+                                        "Could not open the selected file.",
+                                        "The file does not contain text.")
+            button_box = QDialogButtonBox(QDialogButtonBox.Ok)
+            binary_file.addButtonBox(button_box)
+            binary_file.exec()
+            return None
 
-        return data
+        self.setSavedData(path, text, data)
+        return text
 
     # opens the file at the given path and writes the given data to it
     def writeFileData(self, path: str, data: str):
@@ -408,24 +890,307 @@ class FileManager:
         :param data: The data to write to the file
         :return: Returns nothing
         """
-        # open the file with write only privileges
         logging.debug(path)
+        # wait for the queued data of the file to be written so it is not written over
+        self.save_queue.waitFor(path)
+        encoded = data.encode('utf-8')
         if self.encryptor is not None:
             logging.debug("Writing Encrypted")
-            file = open(path, 'wb')
-            data = self.encryptor.encrypt(data.encode())
+            written = self.encryptor.encryptData(encoded)
         else:
             logging.debug("Writing Plain Text")
-            file = open(path, 'w')
+            written = encoded
 
-        # check if the file was opened
-        if file.closed:
-            logging.warning("Could Not Open File - %s", path)
+        # write the data to a temporary file then move it over the file
+        try:
+            atomicWrite(path, written)
+        except OSError as e:
+            logging.exception(e)
+            logging.warning("Could Not Write File - %s", path)
             return
+        self.save_queue.recordWrite(path)
+        self.setSavedData(path, data, encoded)
+
+        # keep the search index in sync with the written file
+        if self.workspace_index is not None and self.workspace_index.contains(path):
+            self.workspace_index.update(path)
+
+    def queueFileData(self, path: str, data: str):
+        """
+        Queues the given data to be written to the file at the specified path on the worker
+        thread of the save queue.
+        :param path: The file to write data to
+        :param data: The data to write to the file
+        :return: Returns nothing
+        """
+        encrypt = self.encryptor.encryptData if self.encryptor is not None else None
+        self.setSavedData(path, data, queued=True)
+        self.save_queue.enqueue(path, data, encrypt, self.saved_hashes[path])
+        # the recorded edits are part of the saved data
+        if self.autosave is not None:
+            self.autosave.reset(path)
+
+    def onFileSaved(self, path: str, modified: float):
+        """
+        Called once the save queue wrote a file
+        :param path: path to the file
+        :param modified: the modification time of the file after it was written
+        :return: returns nothing
+        """
+        logging.info("Saved File - %s", path)
 
-        # write data to the file then close the file
-        file.write(data)
-        file.close()
+        # the journal of the file is no longer needed
+        if self.autosave is not None:
+            self.autosave.onSaved(path)
+
+        # keep the search index in sync with the written file
+        if self.workspace_index is not None and self.workspace_index.contains(path):
+            self.workspace_index.update(path)
+
+    def onSaveFailed(self, path: str, error: str):
+        """
+        Called when the save queue could not write a file, the document is marked as
+        modified again so it is saved next time
+        :param path: path to the file
+        :param error: the error message
+        :return: returns nothing
+        """
+        logging.error("Could not save file - %s", path)
+        # the file still holds the data written before
+        stored = self.getStoredHash(path)
+        if stored is None:
+            self.saved_hashes.pop(path, None)
+        else:
+            self.saved_hashes[path] = stored
+        self.snapshots.pop(path, None)
+        if path in self.text_documents:
+            self.text_documents[path].setModified(True)
+        elif path in self.hibernated_documents:
+            self.hibernated_documents[path] = self.hibernated_documents[path]._replace(
+                modified=True)
+        if self.autosave is not None:
+            self.autosave.onSaveFailed(path)
+        save_failed = DialogBuilder(self.app,
+                                    "Save Failed",
+                                    "Could not save " + QFileInfo(path).fileName(),
+                                    error)
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok)
+        save_failed.addButtonBox(button_box)
+        save_failed.exec()
+
+    def watchFile(self, path: str, data: str = None):
+        """
+        Starts watching an open file for changes made by other programs
+        :param path: path to the open file
+        :param data: the data read from or written to the file or None if it was not read
+        :return: returns nothing
+        """
+        if data is not None:
+            self.snapshots[path] = hibernate(data)
+        self.file_watcher.watch(path)
+
+    def unwatchFile(self, path: str):
+        """
+        Stops watching a file that was closed
+        :param path: path to the file
+        :return: returns nothing
+        """
+        self.file_watcher.unwatch(path)
+        self.snapshots.pop(path, None)
+
+    def readFileData(self, path: str):
+        """
+        Reads a file without asking the user anything, the data is not remembered as saved
+        :param path: the path to read data from
+        :return: returns the data of the file or None if it could not be read
+        """
+        try:
+            with open(path, 'rb') as file:
+                if self.encryptor is not None:
+                    data = self.encryptor.readFile(path, file)
+                else:
+                    data = file.read()
+            return decodeData(data)[0]
+        except (ValueError, OSError, InvalidToken) as e:
+            logging.warning("Could not read file - %s: %s", path, str(e))
+            return None
+
+    def onExternalChange(self, path: str):
+        """
+        Called once an open file was changed on disk. Writes of the file manager itself are
+        recognized by the stamp of the written file or the hash of the saved data, other
+        changes are merged into the document.
+        :param path: path to the changed file
+        :return: returns nothing
+        """
+        if path not in self.open_documents:
+            return
+        # the file is being written by the save queue
+        if self.save_queue.isPending(path):
+            return
+        if self.isMapped(path):
+            self.remapFile(path)
+            return
+        # files that were moved or deleted are handled when they are saved
+        if not os.path.isfile(path):
+            return
+        # the app wrote the file itself, no need to read it back
+        if self.save_queue.isLastWrite(path):
+            return
+
+        data = self.readFileData(path)
+        if data is None or self.isSaved(path, data):
+            return
+        logging.info("File changed externally - %s", path)
+        self.mergeExternalChange(self.app.document, path, data)
+
+    def remapFile(self, path: str):
+        """
+        Maps a huge file again after it was changed on disk, the tab is closed if the file can
+        no longer be mapped
+        :param path: path to the mapped file
+        :return: returns nothing
+        """
+        logging.info("Remapping changed file - %s", path)
+        self.unmapFile(path)
+        if not self.mapFile(path):
+            self.app.bar_open_tabs.forceCloseTab(path)
+            return
+        self.updateViewer(self.app.document)
+
+    def mergeExternalChange(self, document, path: str, theirs: str):
+        """
+        Brings an open document up to date with its file after another program changed it.
+        Documents without unsaved changes take the data of the file, otherwise the user
+        chooses between merging the changes of both, keeping theirs or keeping the file.
+        :param document: reference to the document
+        :param path: path to the changed file
+        :param theirs: the data of the file
+        :return: returns nothing
+        """
+        lef = QFileInfo(path).suffix() == 'lef'
+        text_document = self.text_documents.get(path)
+        hibernated = self.hibernated_documents.get(path)
+
+        if text_document is not None and \
+                (document.isLoading(text_document) or document.isPartial(text_document)):
+            # a document that is not loaded completely is loaded again
+            self.setSavedData(path, theirs)
+            if text_document is document.document():
+                self.text_documents.pop(path)
+                self.loadDocument(document, path, theirs)
+            else:
+                self.discardDocument(document, path)
+            return
+        if text_document is not None:
+            mine = text_document.toHtml() if lef else text_document.toPlainText()
+            modified = text_document.isModified()
+        elif hibernated is not None:
+            mine = wake(hibernated)
+            modified = hibernated.modified
+        else:
+            # the document is read from the file the next time it is shown
+            self.setSavedData(path, theirs)
+            return
+
+        choice = TAKE_THEIRS
+        merged = theirs
+        if modified and not self.isSaved(path, mine):
+            base = wake(self.snapshots[path]) if path in self.snapshots else ""
+            merged, conflicts = merge(base, mine, theirs)
+            choice = self.askMerge(path, mine, theirs, conflicts)
+
+        if choice == KEEP_MINE:
+            logging.info("Keeping unsaved changes - %s", path)
+            text = mine
+        elif choice == MERGE_CHANGES:
+            logging.info("Merging changes - %s", path)
+            text = merged
+        else:
+            logging.info("Taking changes from disk - %s", path)
+            text = theirs
+
+        # the data on disk is the base of the changes that follow
+        self.setSavedData(path, theirs)
+        modified = text != theirs
+        if text_document is not None:
+            if text != mine:
+                self.replaceText(text_document, mine, text, lef)
+            text_document.setModified(modified)
+        else:
+            self.hibernated_documents[path] = hibernate(text, modified, hibernated.view_state)
+
+        # the journal of the document applies to the data that was replaced
+        if self.autosave is not None:
+            self.autosave.discard(path)
+
+    def askMerge(self, path: str, mine: str, theirs: str, conflicts: int) -> int:
+        """
+        Asks the user how to bring a document with unsaved changes up to date with its file
+        :param path: path to the changed file
+        :param mine: the text of the document
+        :param theirs: the data of the file
+        :param conflicts: the number of changes that conflict when merged
+        :return: returns KEEP_MINE, MERGE_CHANGES or TAKE_THEIRS
+        """
+        message = "Merge the changes on disk with your unsaved changes, keep your changes " \
+                  "or take the file from disk?"
+        if conflicts:
+            message += "\n" + str(conflicts) + " changes conflict with yours and are kept " \
+                                               "from both between conflict markers."
+        merge_dialog = DialogBuilder(self.app,
+                                     "File Changed",
+                                     QFileInfo(path).fileName() + " was changed on disk",
+                                     message)
+
+        # the differences between the document and the file
+        preview = QPlainTextEdit()
+        preview.setReadOnly(True)
+        preview.setLineWrapMode(QPlainTextEdit.NoWrap)
+        preview.setPlainText(formatDiff(splitLines(mine), splitLines(theirs)))
+        merge_dialog.addWidget(preview)
+
+        button_box = QDialogButtonBox()
+        button_box.addButton("Merge", QDialogButtonBox.AcceptRole)
+        button_box.addButton("Keep Mine", QDialogButtonBox.RejectRole)
+        btn_theirs = button_box.addButton("Take Theirs", QDialogButtonBox.DestructiveRole)
+        btn_theirs.clicked.connect(lambda: merge_dialog.done(TAKE_THEIRS))
+        merge_dialog.addButtonBox(button_box)
+        return merge_dialog.exec()
+
+    def replaceText(self, text_document, old: str, new: str, lef: bool):
+        """
+        Replaces the text of a document as a single undo step. Only the lines that differ are
+        replaced, so the cursors and the scroll position stay on the unchanged lines.
+        :param text_document: the QTextDocument holding the old text
+        :param old: the text of the document
+        :param new: the text to replace it with
+        :param lef: whether or not the texts are formatted html
+        :return: returns nothing
+        """
+        if self.autosave is not None:
+            self.autosave.recording = False
+        if lef:
+            text_document.setHtml(new)
+        else:
+            old_lines = splitLines(old)
+            new_lines = splitLines(new)
+            starts = [0]
+            for line in old_lines:
+                starts.append(starts[-1] + len(line))
+
+            cursor = QTextCursor(text_document)
+            cursor.beginEditBlock()
+            # from the end so the positions of the lines before stay valid
+            for tag, i1, i2, j1, j2 in reversed(getOpcodes(old_lines, new_lines)):
+                if tag == 'equal':
+                    continue
+                cursor.setPosition(starts[i1])
+                cursor.setPosition(starts[i2], QTextCursor.KeepAnchor)
+                cursor.insertText("".join(new_lines[j1:j2]))
+            cursor.endEditBlock()
+        if self.autosave is not None:
+            self.autosave.recording = True
 
     def lefToExt(self, document, extension: str = '.txt'):
         """
@@ -0,0 +1,100 @@
+"""
+This module watches the open files for changes made by other programs
+"""
+import logging
+import os
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, pyqtSignal
+
+from LeafNote.Utils.Debouncer import Debouncer
+
+
+class FileWatcher(QObject):
+    """
+    Watches files through the notifications of the operating system instead of polling them.
+    The changes of a file are collected until it stayed unchanged for a while, so a program
+    writing a file in several steps only reports it once.
+    """
+    # emitted with the path of a watched file once its changes settled
+    changed = pyqtSignal(str)
+
+    def __init__(self, delay: int = 200):
+        """
+        Starts watching no files
+        :param delay: the time in milliseconds a file has to stay unchanged before it is reported
+        """
+        super().__init__()
+        logging.debug("Creating File Watcher")
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.onFileChanged)
+        # paths - set of the watched paths, files replaced by another program drop out of the
+        # watcher and are added again
+        self.paths = set()
+        # changed_paths - set of the paths that changed since they were last reported
+        self.changed_paths = set()
+        self.debouncer = Debouncer(self.flush, delay)
+
+    def watch(self, path: str):
+        """
+        Starts watching a file
+        :param path: path to the file
+        :return: returns nothing
+        """
+        self.paths.add(path)
+        if path not in self.watcher.files() and os.path.exists(path):
+            self.watcher.addPath(path)
+
+    def unwatch(self, path: str):
+        """
+        Stops watching a file
+        :param path: path to the file
+        :return: returns nothing
+        """
+        self.paths.discard(path)
+        self.changed_paths.discard(path)
+        if path in self.watcher.files():
+            self.watcher.removePath(path)
+
+    def unwatchAll(self):
+        """
+        Stops watching every file
+        :return: returns nothing
+        """
+        self.debouncer.cancel()
+        self.changed_paths.clear()
+        self.paths.clear()
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+
+    def isWatched(self, path: str) -> bool:
+        """
+        :return: returns whether or not the file is watched
+        """
+        return path in self.paths
+
+    def onFileChanged(self, path: str):
+        """
+        Collects a change of a watched file
+        :param path: path to the file
+        :return: returns nothing
+        """
+        if path not in self.paths:
+            return
+        logging.debug("File changed - %s", path)
+        self.changed_paths.add(path)
+        self.debouncer.trigger()
+
+    def flush(self):
+        """
+        Reports the collected changes and watches the files that were replaced again
+        :return: returns nothing
+        """
+        self.debouncer.cancel()
+        changed_paths = sorted(self.changed_paths)
+        self.changed_paths.clear()
+        for path in changed_paths:
+            if path not in self.paths:
+                continue
+            # writing a file atomically replaces it, which ends watching it
+            self.watch(path)
+            self.changed.emit(path)
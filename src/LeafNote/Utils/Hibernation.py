@@ -0,0 +1,100 @@
+"""
+This module keeps the open documents that are not used within a memory budget. Documents that
+have not been shown for the longest time are hibernated to a compressed copy of their text.
+"""
+import logging
+import zlib
+from collections import OrderedDict, namedtuple
+
+# rough number of bytes a QTextDocument uses for every character, layout and undo included
+BYTES_PER_CHARACTER = 16
+
+# data - the compressed text, html for formatted documents
+# modified - whether or not the document had changes that were not saved
+# view_state - the cursor and scroll positions returned by Document.getViewState or None
+HibernatedDocument = namedtuple("HibernatedDocument", ["data", "modified", "view_state"])
+
+
+def hibernate(text: str, modified: bool = False, view_state: tuple = None,
+              encoded: bytes = None) -> HibernatedDocument:
+    """
+    Compresses the contents of a document
+    :param text: the plain text or html of the document
+    :param modified: whether or not the document had changes that were not saved
+    :param view_state: the cursor and scroll positions of the document
+    :param encoded: the utf-8 bytes of the text if they are already known
+    :return: returns the hibernated document
+    """
+    if encoded is None:
+        encoded = text.encode('utf-8')
+    return HibernatedDocument(zlib.compress(encoded), modified, view_state)
+
+
+def wake(hibernated: HibernatedDocument) -> str:
+    """
+    :return: returns the text of a hibernated document
+    """
+    return zlib.decompress(hibernated.data).decode('utf-8')
+
+
+class TabResidency:
+    """
+    Keeps the estimated sizes of the documents held in memory in the order they were last
+    shown, so the least recently used ones can be hibernated once the budget is exceeded
+    """
+
+    def __init__(self, budget: int):
+        """
+        Initializes an empty residency
+        :param budget: the number of bytes the documents held in memory may use
+        """
+        logging.debug("Creating Tab Residency")
+        self.budget = budget
+        # sizes - ordered dict of (path : estimated size), least recently used first
+        self.sizes = OrderedDict()
+
+    def __contains__(self, path: str) -> bool:
+        """
+        :return: returns whether or not the document of the path is held in memory
+        """
+        return path in self.sizes
+
+    def total(self) -> int:
+        """
+        :return: returns the estimated number of bytes used by the documents held in memory
+        """
+        return sum(self.sizes.values())
+
+    def touch(self, path: str, size: int):
+        """
+        Marks a document as the most recently used one
+        :param path: path to the document
+        :param size: the estimated size of the document in bytes
+        :return: returns nothing
+        """
+        self.sizes[path] = size
+        self.sizes.move_to_end(path)
+
+    def remove(self, path: str):
+        """
+        Forgets a document that was closed or hibernated
+        :param path: path to the document
+        :return: returns nothing
+        """
+        self.sizes.pop(path, None)
+
+    def evictions(self, keep: str) -> list:
+        """
+        :param keep: path to the document that is shown and can not be hibernated
+        :return: returns the paths of the least recently used documents that have to be
+        hibernated for the others to fit in the budget
+        """
+        total = self.total()
+        paths = []
+        for path, size in self.sizes.items():
+            if total <= self.budget:
+                break
+            if path != keep:
+                paths.append(path)
+                total -= size
+        return paths
@@ -0,0 +1,227 @@
+"""
+This module compares the lines of texts and merges the changes made to the same text by two
+editors
+"""
+
+# edit distance after which the lines in between are treated as replaced instead of searching
+# further, the search takes memory quadratic in the distance
+MAX_EDIT_DISTANCE = 1000
+
+CONFLICT_MINE = "<<<<<<< LeafNote\n"
+CONFLICT_SEPARATOR = "=======\n"
+CONFLICT_THEIRS = ">>>>>>> On Disk\n"
+
+
+def splitLines(text: str) -> list:
+    """
+    :return: returns the lines of the text with their line breaks
+    """
+    return text.splitlines(True)
+
+
+def getMatchingBlocks(a: list, b: list) -> list:
+    """
+    Finds the longest common subsequence of the lines with the Myers diff algorithm, after
+    removing the lines the sequences start and end with
+    :param a: the old lines
+    :param b: the new lines
+    :return: returns a list of (start in a, start in b, length) of the equal runs
+    """
+    prefix = 0
+    while prefix < len(a) and prefix < len(b) and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < len(a) - prefix and suffix < len(b) - prefix and \
+            a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    blocks = []
+    if prefix:
+        blocks.append((0, 0, prefix))
+    for i, j, size in _myers(a[prefix:len(a) - suffix], b[prefix:len(b) - suffix]):
+        blocks.append((prefix + i, prefix + j, size))
+    if suffix:
+        blocks.append((len(a) - suffix, len(b) - suffix, suffix))
+    return blocks
+
+
+def _myers(a: list, b: list) -> list:
+    """
+    :return: returns the equal runs of the lines as (start in a, start in b, length)
+    """
+    n = len(a)
+    m = len(b)
+    if not n or not m:
+        return []
+
+    # v - dict of (diagonal : furthest x reached), trace keeps v before every step
+    v = {1: 0}
+    trace = []
+    end = None
+    for d in range(min(n + m, MAX_EDIT_DISTANCE) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                end = d
+                break
+        if end is not None:
+            break
+    if end is None:
+        # the texts are too different, the lines in between are all replaced
+        return []
+
+    # walk back through the steps to collect the matched lines
+    pairs = []
+    x, y = n, m
+    for d in range(end, -1, -1):
+        v = trace[d]
+        k = x - y
+        if d == 0:
+            prev_x = prev_y = 0
+        else:
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                prev_k = k + 1
+            else:
+                prev_k = k - 1
+            prev_x = v[prev_k]
+            prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            pairs.append((x, y))
+        x, y = prev_x, prev_y
+    pairs.reverse()
+
+    blocks = []
+    for i, j in pairs:
+        if blocks and blocks[-1][0] + blocks[-1][2] == i and blocks[-1][1] + blocks[-1][2] == j:
+            blocks[-1] = (blocks[-1][0], blocks[-1][1], blocks[-1][2] + 1)
+        else:
+            blocks.append((i, j, 1))
+    return blocks
+
+
+def getOpcodes(a: list, b: list) -> list:
+    """
+    :param a: the old lines
+    :param b: the new lines
+    :return: returns a list of (tag, a start, a end, b start, b end) that turn a into b, the
+    tags are 'equal', 'replace', 'delete' and 'insert' like difflib
+    """
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, size in getMatchingBlocks(a, b) + [(len(a), len(b), 0)]:
+        if i < block_i and j < block_j:
+            opcodes.append(('replace', i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(('delete', i, block_i, j, block_j))
+        elif j < block_j:
+            opcodes.append(('insert', i, block_i, j, block_j))
+        if size:
+            opcodes.append(('equal', block_i, block_i + size, block_j, block_j + size))
+        i = block_i + size
+        j = block_j + size
+    return opcodes
+
+
+def formatDiff(a: list, b: list, limit: int = 500) -> str:
+    """
+    :param a: the old lines
+    :param b: the new lines
+    :param limit: the number of changed lines after which the rest is left out
+    :return: returns the removed lines prefixed with '-' and the added lines with '+'
+    """
+    lines = []
+    for tag, i1, i2, j1, j2 in getOpcodes(a, b):
+        if tag == 'equal':
+            continue
+        lines.append("@@ line %d @@" % (i1 + 1))
+        lines.extend("- " + line.rstrip("\r\n") for line in a[i1:i2])
+        lines.extend("+ " + line.rstrip("\r\n") for line in b[j1:j2])
+        if len(lines) > limit:
+            lines = lines[:limit] + ["..."]
+            break
+    return "\n".join(lines)
+
+
+def _getSyncRegions(base: list, mine: list, theirs: list) -> list:
+    """
+    :return: returns a list of (base start, base end, mine start, mine end, theirs start,
+    theirs end) of the runs that are equal in all three texts, ending with an empty run
+    """
+    mine_blocks = getMatchingBlocks(base, mine)
+    theirs_blocks = getMatchingBlocks(base, theirs)
+    regions = []
+    i_mine = i_theirs = 0
+    while i_mine < len(mine_blocks) and i_theirs < len(theirs_blocks):
+        mine_base, mine_start, mine_size = mine_blocks[i_mine]
+        theirs_base, theirs_start, theirs_size = theirs_blocks[i_theirs]
+        start = max(mine_base, theirs_base)
+        end = min(mine_base + mine_size, theirs_base + theirs_size)
+        if start < end:
+            mine_sub = mine_start + start - mine_base
+            theirs_sub = theirs_start + start - theirs_base
+            regions.append((start, end, mine_sub, mine_sub + end - start,
+                            theirs_sub, theirs_sub + end - start))
+        if mine_base + mine_size < theirs_base + theirs_size:
+            i_mine += 1
+        else:
+            i_theirs += 1
+    regions.append((len(base), len(base), len(mine), len(mine), len(theirs), len(theirs)))
+    return regions
+
+
+def merge(base: str, mine: str, theirs: str) -> tuple:
+    """
+    Merges the changes two editors made to the same text. Changes to different lines are
+    combined, lines both changed differently are kept from both between conflict markers.
+    :param base: the text both editors started from
+    :param mine: the text of the first editor
+    :param theirs: the text of the second editor
+    :return: returns the merged text and the number of conflicts
+    """
+    base_lines = splitLines(base)
+    mine_lines = splitLines(mine)
+    theirs_lines = splitLines(theirs)
+
+    merged = []
+    conflicts = 0
+    i_base = i_mine = i_theirs = 0
+    for base_start, base_end, mine_start, mine_end, theirs_start, theirs_end in \
+            _getSyncRegions(base_lines, mine_lines, theirs_lines):
+        base_chunk = base_lines[i_base:base_start]
+        mine_chunk = mine_lines[i_mine:mine_start]
+        theirs_chunk = theirs_lines[i_theirs:theirs_start]
+        if mine_chunk == base_chunk or mine_chunk == theirs_chunk:
+            merged.extend(theirs_chunk)
+        elif theirs_chunk == base_chunk:
+            merged.extend(mine_chunk)
+        else:
+            conflicts += 1
+            merged.append(CONFLICT_MINE)
+            merged.extend(_terminate(mine_chunk))
+            merged.append(CONFLICT_SEPARATOR)
+            merged.extend(_terminate(theirs_chunk))
+            merged.append(CONFLICT_THEIRS)
+        merged.extend(base_lines[base_start:base_end])
+        i_base, i_mine, i_theirs = base_end, mine_end, theirs_end
+    return "".join(merged), conflicts
+
+
+def _terminate(lines: list) -> list:
+    """
+    :return: returns the lines with a line break after the last one, so a conflict marker
+    can follow
+    """
+    if lines and not lines[-1].endswith(("\n", "\r")):
+        return lines[:-1] + [lines[-1] + "\n"]
+    return lines
@@ -0,0 +1,187 @@
+"""
+This module maps huge files into memory so they can be viewed without reading them into a string
+"""
+import bisect
+import logging
+import mmap
+import os
+import threading
+
+from cryptography.fernet import InvalidToken
+
+from LeafNote.Utils.ChunkedCipher import ChunkedReader, isContainer
+
+# number of bytes between the entries of the sparse line index
+BLOCK_SIZE = 64 * 1024
+# lines longer than this many bytes are cut when they are shown
+MAX_LINE_LENGTH = 4096
+
+
+class MappedFile:
+    """
+    Maps a file read only and indexes its lines on a worker thread. The index only keeps the
+    number of lines before every block of BLOCK_SIZE bytes, lines within a block are found by
+    scanning the mapped bytes. Files of an encrypted workspace are read through a ChunkedReader
+    that decrypts only the segments holding the bytes that are read.
+    """
+
+    def __init__(self, path: str, cipher=None):
+        """
+        Maps the file and starts indexing its lines
+        :param path: path to the file
+        :param cipher: the ChunkedCipher of the workspace if it is encrypted or None
+        :raises OSError: if the file could not be mapped
+        :raises InvalidToken: if the file is encrypted with another key
+        """
+        logging.debug("Mapping File - %s", path)
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # empty files can not be mapped
+        self.mapping = None
+        self.data = b""
+        if self.size:
+            self.mapping = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self.mapping
+        if cipher is not None and isContainer(self.data[:16]):
+            try:
+                self.data = ChunkedReader(self.mapping, cipher)
+            except InvalidToken:
+                self.mapping.close()
+                self.file.close()
+                raise
+            self.size = len(self.data)
+
+        # block_lines - list of the number of line breaks before every indexed block
+        self.block_lines = [0]
+        # line_count - the number of lines of the file once the index is complete or None
+        self.line_count = None
+        self.stopped = False
+        self.indexer = threading.Thread(target=self.buildIndex, name="MappedFile", daemon=True)
+        self.indexer.start()
+
+    def buildIndex(self):
+        """
+        Counts the line breaks of every block
+        :return: returns nothing
+        """
+        lines = 0
+        for start in range(0, self.size, BLOCK_SIZE):
+            if self.stopped:
+                return
+            lines += self.data[start:start + BLOCK_SIZE].count(b"\n")
+            self.block_lines.append(lines)
+        self.line_count = lines + 1
+        logging.info("Indexed %d lines - %s", self.line_count, self.path)
+
+    def waitForIndex(self):
+        """
+        Blocks until every line is indexed
+        :return: returns nothing
+        """
+        self.indexer.join()
+
+    def isIndexed(self) -> bool:
+        """
+        :return: returns whether or not every line is indexed
+        """
+        return self.line_count is not None
+
+    def getIndexProgress(self) -> float:
+        """
+        :return: returns the part of the file that is indexed between 0 and 1
+        """
+        if self.isIndexed() or not self.size:
+            return 1.0
+        return min(1.0, (len(self.block_lines) - 1) * BLOCK_SIZE / self.size)
+
+    def getLineCount(self) -> int:
+        """
+        :return: returns the number of lines, only the indexed ones while indexing
+        """
+        if self.line_count is not None:
+            return self.line_count
+        return self.block_lines[-1] + 1
+
+    def countLines(self, start: int, end: int) -> int:
+        """
+        :return: returns the number of line breaks between the byte offsets
+        """
+        lines = 0
+        for offset in range(start, end, BLOCK_SIZE):
+            lines += self.data[offset:min(end, offset + BLOCK_SIZE)].count(b"\n")
+        return lines
+
+    def getLineOffset(self, line: int) -> int:
+        """
+        :param line: the line number, starting at 0
+        :return: returns the byte offset the line starts at or the size of the file if the file
+        has less lines
+        """
+        if line <= 0:
+            return 0
+        # the last block starting before the line break that ends the previous line
+        block_lines = self.block_lines
+        block = max(0, bisect.bisect_left(block_lines, line, 0, len(block_lines)) - 1)
+        offset = block * BLOCK_SIZE
+        for _ in range(line - block_lines[block]):
+            offset = self.data.find(b"\n", offset) + 1
+            if offset == 0:
+                return self.size
+        return offset
+
+    def getLines(self, first: int, count: int) -> list:
+        """
+        Decodes lines of the file, lines that are too long are cut
+        :param first: the number of the first line
+        :param count: the number of lines
+        :return: returns the list of lines, shorter at the end of the file
+        """
+        lines = []
+        offset = self.getLineOffset(first)
+        while len(lines) < count and offset < self.size:
+            end = self.data.find(b"\n", offset)
+            end = self.size if end == -1 else end
+            line = self.data[offset:min(end, offset + MAX_LINE_LENGTH)]
+            lines.append(line.decode('utf-8', 'replace').rstrip("\r"))
+            offset = end + 1
+        # a line break at the end of the file starts an empty last line
+        if len(lines) < count and offset == self.size and \
+                (not self.size or self.data[self.size - 1:self.size] == b"\n"):
+            lines.append("")
+        return lines
+
+    def getPosition(self, offset: int) -> tuple:
+        """
+        :param offset: a byte offset in the file
+        :return: returns the line number and the column in characters of the offset
+        """
+        block = min(offset // BLOCK_SIZE, len(self.block_lines) - 1)
+        line = self.block_lines[block] + self.countLines(block * BLOCK_SIZE, offset)
+        start = self.data.rfind(b"\n", 0, offset) + 1
+        column = len(self.data[start:offset].decode('utf-8', 'replace'))
+        return line, column
+
+    def find(self, pattern: bytes, offset: int, backward: bool = False) -> int:
+        """
+        Searches the mapped bytes
+        :param pattern: the bytes to find
+        :param offset: the byte offset to search from
+        :param backward: whether or not to search towards the start of the file
+        :return: returns the byte offset of the match or -1 if there is none
+        """
+        if backward:
+            return self.data.rfind(pattern, 0, offset)
+        return self.data.find(pattern, offset)
+
+    def close(self):
+        """
+        Stops indexing and unmaps the file
+        :return: returns nothing
+        """
+        logging.debug("Unmapping File - %s", self.path)
+        self.stopped = True
+        self.indexer.join()
+        if self.mapping is not None:
+            self.mapping.close()
+        self.file.close()
@@ -0,0 +1,143 @@
+"""
+This module holds the index of the positions of every match of a search in a document
+"""
+import logging
+from bisect import bisect_left, bisect_right
+
+from LeafNote.Utils.SearchEngine import SearchPattern
+
+
+class MatchIndex:
+    """
+    Keeps the sorted (start, end) positions of every match of a search pattern in a text.
+    Matches never span lines, so an edit only requires the lines it touched to be scanned
+    again while the matches after them are shifted.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty index
+        """
+        logging.debug("Creating Match Index")
+        self.pattern = None
+        # starts, ends - the sorted start and end positions of the matches
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        """
+        :return: returns the number of matches
+        """
+        return len(self.starts)
+
+    def clear(self):
+        """
+        Forgets the pattern and all of its matches
+        :return: returns nothing
+        """
+        self.pattern = None
+        self.starts = []
+        self.ends = []
+
+    def setPattern(self, pattern: SearchPattern, text: str):
+        """
+        Indexes every match of a new pattern in the text
+        :param pattern: the compiled search pattern
+        :param text: the plain text of the document with lines separated by newlines
+        :return: returns nothing
+        """
+        self.pattern = pattern
+        self.starts, self.ends = self._scan(text, 0)
+
+    def refine(self, pattern: SearchPattern, text: str):
+        """
+        Indexes the matches of a pattern that refines the current one by checking only
+        the positions of the current matches
+        :param pattern: the compiled search pattern, see SearchPattern.refines
+        :param text: the plain text of the document with lines separated by newlines
+        :return: returns nothing
+        """
+        starts = []
+        ends = []
+        last_end = 0
+        for start in self.starts:
+            if start < last_end:
+                continue
+            match = pattern.text_pattern.match(text, start)
+            if match is not None and "\n" not in match.group():
+                starts.append(start)
+                ends.append(match.end())
+                last_end = match.end()
+        self.pattern = pattern
+        self.starts, self.ends = starts, ends
+
+    def update(self, start: int, end: int, delta: int, text: str):
+        """
+        Updates the index after an edit
+        :param start: start of the first line touched by the edit
+        :param end: end of the last line touched by the edit, after the edit
+        :param delta: the number of characters added minus the number removed
+        :param text: the text between start and end after the edit
+        :return: returns nothing
+        """
+        if self.pattern is None:
+            return
+
+        # the matches before the lines are kept, the ones after them are shifted
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end - delta)
+        starts, ends = self._scan(text, start)
+        if delta:
+            starts.extend(s + delta for s in self.starts[hi:])
+            ends.extend(e + delta for e in self.ends[hi:])
+        else:
+            starts.extend(self.starts[hi:])
+            ends.extend(self.ends[hi:])
+        self.starts[lo:] = starts
+        self.ends[lo:] = ends
+
+    def _scan(self, text: str, offset: int) -> tuple:
+        """
+        Finds the matches in the text that do not span lines
+        :param text: the text to search
+        :param offset: the position of the text in the document
+        :return: returns a tuple of the lists of start and end positions
+        """
+        starts = []
+        ends = []
+        for start, end in self.pattern.finditer(text):
+            if "\n" not in text[start:end]:
+                starts.append(start + offset)
+                ends.append(end + offset)
+        return starts, ends
+
+    def span(self, index: int) -> tuple:
+        """
+        :return: returns the (start, end) positions of the match at the given index
+        """
+        return self.starts[index], self.ends[index]
+
+    def indexOf(self, start: int, end: int):
+        """
+        :return: returns the index of the match with the given positions or None
+        """
+        index = bisect_left(self.starts, start)
+        if index < len(self.starts) and self.ends[index] == end:
+            return index
+        return None
+
+    def nextIndex(self, position: int):
+        """
+        :return: returns the index of the first match that starts at or after the position
+        or None if there is none
+        """
+        index = bisect_left(self.starts, position)
+        return index if index < len(self.starts) else None
+
+    def previousIndex(self, position: int):
+        """
+        :return: returns the index of the last match that ends at or before the position
+        or None if there is none
+        """
+        index = bisect_right(self.ends, position) - 1
+        return index if index >= 0 else None
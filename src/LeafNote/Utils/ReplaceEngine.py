@@ -0,0 +1,202 @@
+"""
+This module holds the engine used to replace a search pattern across the files of a workspace
+"""
+import difflib
+import html
+import logging
+import os
+import re
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import InvalidToken
+
+from LeafNote.Utils.AtomicFile import atomicWrite
+from LeafNote.Utils.SearchEngine import HTML_BREAK_PATTERN, SearchPattern, lefToPlainText
+
+# splits the html of a .lef file into the markup and the text between it
+HTML_MARKUP_PATTERN = re.compile(r"(<head>.*?</head>|<[^>]*>)", re.IGNORECASE | re.DOTALL)
+
+# path - the replaced file, count - number of replacements, diff - unified diff of the change,
+# error - the reason the file could not be replaced or None, skipped - number of matches that
+# could not be replaced
+ReplaceResult = namedtuple("ReplaceResult", ["path", "count", "diff", "error", "skipped"])
+
+
+def replaceText(text: str, pattern: SearchPattern, replacement: str) -> tuple:
+    """
+    Replaces every match of the pattern in plain text
+    :param text: the text to replace matches in
+    :param pattern: the compiled search pattern
+    :param replacement: the literal text to insert in place of each match
+    :return: returns a tuple of the new text and the number of replacements
+    """
+    return pattern.text_pattern.subn(lambda match: replacement, text)
+
+
+def replaceLef(data: str, pattern: SearchPattern, replacement: str) -> tuple:
+    """
+    Replaces every match of the pattern in the plain text of a .lef file, the same text the
+    search matches, leaving its markup intact. A match that spans formatting is replaced in
+    the text it starts in and removed from the text after it. A match that spans a line break
+    is skipped, as the markup of the line would have to be removed.
+    :param data: the html held by the .lef file
+    :param pattern: the compiled search pattern
+    :param replacement: the literal text to insert in place of each match
+    :return: returns a tuple of the new html, the number of replacements and the number of
+    skipped matches
+    """
+    parts = HTML_MARKUP_PATTERN.split(data)
+    # runs - list of (index of the part, offset in the plain text, text) of the text between
+    # the markup, which is at the even indices of the parts
+    runs = []
+    # breaks - the offsets of the line breaks the markup adds to the plain text
+    breaks = []
+    plain = []
+    offset = 0
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            text = html.unescape(part)
+            runs.append((i, offset, text))
+        elif HTML_BREAK_PATTERN.match(part):
+            text = "\n"
+            breaks.append(offset)
+        else:
+            continue
+        plain.append(text)
+        offset += len(text)
+    run_starts = [run[1] for run in runs]
+
+    # edits - dict of (index of the run : list of (start, end, text)) replacing its text
+    edits = {}
+    count = 0
+    skipped = 0
+    for match in pattern.text_pattern.finditer("".join(plain)):
+        start, end = match.span()
+        if bisect_left(breaks, start) != bisect_left(breaks, end):
+            skipped += 1
+            continue
+        count += 1
+        run = bisect_right(run_starts, start) - 1
+        text = replacement
+        while True:
+            _, run_start, run_text = runs[run]
+            piece_end = min(end, run_start + len(run_text))
+            edits.setdefault(run, []).append((start - run_start, piece_end - run_start, text))
+            text = ""
+            start = piece_end
+            run += 1
+            if start >= end:
+                break
+
+    for run, run_edits in edits.items():
+        index, _, run_text = runs[run]
+        pieces = []
+        last = 0
+        for start, end, text in run_edits:
+            pieces.append(run_text[last:start])
+            pieces.append(text)
+            last = end
+        pieces.append(run_text[last:])
+        parts[index] = html.escape("".join(pieces), quote=False)
+    return "".join(parts), count, skipped
+
+
+class ReplaceEngine:
+    """
+    Replaces a pattern across many files in parallel. Each file is written through a
+    temporary file that is renamed over the original, so an interrupted replace never leaves
+    half written files behind.
+    """
+
+    def __init__(self, file_manager):
+        """
+        Initializes the engine
+        :param file_manager: reference to the file manager, used for the encryptor and the
+        save queue
+        """
+        logging.debug("Creating Replace Engine")
+        self.file_manager = file_manager
+
+    def replaceAll(self, paths: list, pattern: SearchPattern, replacement: str,
+                   dry_run: bool = False) -> list:
+        """
+        Replaces every match of the pattern in the given files
+        :param paths: the files to replace matches in
+        :param pattern: the compiled search pattern
+        :param replacement: the literal text to insert in place of each match
+        :param dry_run: if true nothing is written and only the changes are reported
+        :return: returns a list of ReplaceResult for every file that has matches or errors
+        """
+        def replaceFile(path):
+            """
+            Replaces the matches in a single file
+            """
+            try:
+                return self.replaceFile(path, pattern, replacement, dry_run)
+            except OSError as e:
+                logging.exception(e)
+                return ReplaceResult(path, 0, "", str(e), 0)
+
+        workers = min(32, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(replaceFile, paths))
+
+        results = [r for r in results if r.count or r.error or r.skipped]
+        logging.info("%s %d matches in %d files, skipped %d", "Found" if dry_run else "Replaced",
+                     sum(r.count for r in results), len(results),
+                     sum(r.skipped for r in results))
+        return results
+
+    def replaceFile(self, path: str, pattern: SearchPattern, replacement: str,
+                    dry_run: bool = False) -> ReplaceResult:
+        """
+        Replaces every match of the pattern in a single file
+        :param path: the file to replace matches in
+        :param pattern: the compiled search pattern
+        :param replacement: the literal text to insert in place of each match
+        :param dry_run: if true nothing is written and only the changes are reported
+        :return: returns the ReplaceResult of the file
+        :raises OSError: if the file could not be read or written
+        """
+        # a save of the file that is still queued has to be written first
+        self.file_manager.save_queue.waitFor(path)
+        encryptor = self.file_manager.encryptor
+        with open(path, 'rb') as file:
+            if encryptor is None:
+                data = file.read()
+            else:
+                try:
+                    data = encryptor.readFile(path, file)
+                except InvalidToken:
+                    # the damaged file is not written over
+                    logging.warning("Could not decrypt file - %s", path)
+                    return ReplaceResult(path, 0, "",
+                                         "The file is damaged and could not be decrypted", 0)
+
+        # undecodable bytes are kept as they are when the file is written back
+        old_text = data.decode(errors='surrogateescape')
+        is_lef = path.endswith(".lef")
+        skipped = 0
+        if is_lef:
+            new_text, count, skipped = replaceLef(old_text, pattern, replacement)
+        else:
+            new_text, count = replaceText(old_text, pattern, replacement)
+
+        if count == 0:
+            return ReplaceResult(path, 0, "", None, skipped)
+
+        if dry_run:
+            old_lines, new_lines = old_text, new_text
+            if is_lef:
+                old_lines, new_lines = lefToPlainText(old_text), lefToPlainText(new_text)
+            diff = difflib.unified_diff(old_lines.splitlines(True), new_lines.splitlines(True),
+                                        path, path)
+            return ReplaceResult(path, count, "".join(diff), None, skipped)
+
+        data = new_text.encode(errors='surrogateescape')
+        if encryptor is not None:
+            data = encryptor.encryptData(data)
+        atomicWrite(path, data)
+        return ReplaceResult(path, count, "", None, skipped)
@@ -0,0 +1,196 @@
+"""
+This module holds a queue that writes files on a worker thread
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from LeafNote.Utils.AtomicFile import atomicWrite
+
+
+def encodeData(data: str, encrypt=None) -> bytes:
+    """
+    Turns the text of a document into the bytes written to its file
+    :param data: the text to write
+    :param encrypt: function that encrypts bytes or None
+    :return: returns the bytes to write
+    """
+    data = data.encode('utf-8')
+    if encrypt is not None:
+        data = encrypt(data)
+    return data
+
+
+def getFileStamp(path: str):
+    """
+    :return: returns the modification time in nanoseconds and the size of a file, or None if
+    it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SaveQueue(QObject):
+    """
+    Encodes, encrypts and writes files on a worker thread so saving never blocks the editor.
+    Every file is written atomically. A save of a path that is still waiting to be written
+    replaces the older one, so only the latest data of a path is written.
+    """
+    # emitted with the path and its modification time after the file was written
+    saved = pyqtSignal(str, float)
+    # emitted with the path and the error message when the file could not be written
+    failed = pyqtSignal(str, str)
+
+    def __init__(self):
+        """
+        Initializes an empty queue, the worker thread is started by the first save
+        """
+        super().__init__()
+        logging.debug("Creating Save Queue")
+        self.condition = threading.Condition()
+        # pending - ordered dict of (path : (data, encrypt, digest)) of the files waiting to be
+        # written
+        self.pending = OrderedDict()
+        # writing - the path of the file that is being written or None
+        self.writing = None
+        # last_written - dict of (path : (modification time in nanoseconds, size)) of the
+        # files written by the queue or recorded by recordWrite
+        self.last_written = {}
+        # digests - dict of (path : hash) of the data the files hold, set once the queue wrote
+        # them or by setDigest
+        self.digests = {}
+        # failures - dict of (path : error message) of the files whose last write failed
+        self.failures = {}
+        self.worker = None
+
+    def enqueue(self, path: str, data: str, encrypt=None, digest=None):
+        """
+        Queues the data to be written to the file
+        :param path: the file to write data to
+        :param data: the text to write to the file
+        :param encrypt: function that encrypts the encoded text or None
+        :param digest: the hash of the data, kept as the digest of the file once it is written
+        :return: returns nothing
+        """
+        with self.condition:
+            if path in self.pending:
+                logging.debug("Coalescing save - %s", path)
+            self.pending[path] = (data, encrypt, digest)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name="SaveQueue")
+                self.worker.start()
+            self.condition.notify_all()
+
+    def isPending(self, path: str) -> bool:
+        """
+        :return: returns whether or not the file is waiting to be or being written
+        """
+        with self.condition:
+            return path in self.pending or path == self.writing
+
+    def waitFor(self, path: str):
+        """
+        Blocks until the queued data of the file is written
+        :param path: path to the file
+        :return: returns nothing
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: path not in self.pending and path != self.writing)
+
+    def flush(self):
+        """
+        Blocks until every queued file is written
+        :return: returns nothing
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self.pending and self.writing is None)
+
+    def lastWriteStamp(self, path: str):
+        """
+        :return: returns the (modification time in nanoseconds, size) of the file after it was
+        last written by the app or None
+        """
+        with self.condition:
+            return self.last_written.get(path)
+
+    def recordWrite(self, path: str):
+        """
+        Remembers the stamp of a file the app wrote without the queue
+        :param path: path to the written file
+        :return: returns nothing
+        """
+        stamp = getFileStamp(path)
+        with self.condition:
+            self.last_written[path] = stamp
+
+    def isLastWrite(self, path: str) -> bool:
+        """
+        :return: returns whether or not the file is unchanged since the app last wrote it
+        """
+        stamp = self.lastWriteStamp(path)
+        return stamp is not None and stamp == getFileStamp(path)
+
+    def setDigest(self, path: str, digest):
+        """
+        Remembers the hash of the data a file holds after it was read or written without the
+        queue
+        :param path: path to the file
+        :param digest: the hash of the data
+        :return: returns nothing
+        """
+        with self.condition:
+            self.digests[path] = digest
+
+    def getDigest(self, path: str):
+        """
+        :return: returns the hash of the data the file held when it was last read or written,
+        or None if it is not known
+        """
+        with self.condition:
+            return self.digests.get(path)
+
+    def hasFailed(self, path: str) -> bool:
+        """
+        :return: returns whether or not the last write of the file failed
+        """
+        with self.condition:
+            return path in self.failures
+
+    def run(self):
+        """
+        Writes the queued files until the queue is empty
+        """
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.worker = None
+                    self.condition.notify_all()
+                    return
+                path, (data, encrypt, digest) = self.pending.popitem(last=False)
+                self.writing = path
+
+            try:
+                atomicWrite(path, encodeData(data, encrypt))
+                stat = os.stat(path)
+            except OSError as e:
+                logging.exception(e)
+                with self.condition:
+                    self.failures[path] = str(e)
+                self.failed.emit(path, str(e))
+            else:
+                with self.condition:
+                    self.last_written[path] = (stat.st_mtime_ns, stat.st_size)
+                    self.digests[path] = digest
+                    self.failures.pop(path, None)
+                self.saved.emit(path, stat.st_mtime)
+
+            # the signals are posted before waiting threads are released
+            with self.condition:
+                self.writing = None
+                self.condition.notify_all()
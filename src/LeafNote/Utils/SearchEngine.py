@@ -0,0 +1,340 @@
+"""
+This module holds the engine used to match search phrases against the files of a workspace.
+It does not depend on Qt so files can be searched on worker threads.
+"""
+import html
+import logging
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from cryptography.fernet import InvalidToken
+
+from LeafNote.Utils.WorkspaceFilter import SNIFF_SIZE, isBinaryData
+
+HTML_HEAD_PATTERN = re.compile(r"<head>.*?</head>", re.IGNORECASE | re.DOTALL)
+HTML_BREAK_PATTERN = re.compile(r"<(br|/p|/li|/h\d|/tr)\b[^>]*>", re.IGNORECASE)
+HTML_TAG_PATTERN = re.compile(r"<[^>]*>")
+
+# a whole word is not preceded or followed by a letter or digit
+WORD_START = r"(?<![^\W_])"
+WORD_END = r"(?![^\W_])"
+
+# line - the number of the first line of the snippet, text - the lines around the match,
+# start, end - the character offsets of the match in the text
+Snippet = namedtuple("Snippet", ["line", "text", "start", "end"])
+
+
+def lefToPlainText(data: str) -> str:
+    """
+    Projects the html of a .lef file onto the plain text the user sees
+    :param data: the html held by the .lef file
+    :return: returns the plain text of the file
+    """
+    data = HTML_HEAD_PATTERN.sub("", data)
+    data = HTML_BREAK_PATTERN.sub("\n", data)
+    data = HTML_TAG_PATTERN.sub("", data)
+    return html.unescape(data)
+
+
+def readFileText(path: str, encryptor=None):
+    """
+    Reads the plain text of the file at the given path, decrypting it if needed
+    :param path: path to the file
+    :param encryptor: the encryptor of the workspace if it is encrypted
+    :return: returns the text of the file or None if it could not be read
+    """
+    try:
+        with open(path, 'rb') as file:
+            if encryptor is not None:
+                # files that did not change since the last search are not decrypted again
+                data = encryptor.readFile(path, file)
+            else:
+                data = file.read()
+    except OSError as e:
+        logging.warning("Could not read file - %s", e)
+        return None
+    except InvalidToken:
+        logging.warning("Could not decrypt file - %s", path)
+        return None
+
+    if isBinaryData(data[:SNIFF_SIZE]):
+        logging.debug("Not a text file - %s", path)
+        return None
+
+    text = data.decode(errors='replace')
+    if path.endswith(".lef"):
+        text = lefToPlainText(text)
+    return text
+
+
+def makeSnippets(data, spans: list, context: int, decode=None) -> list:
+    """
+    Cuts the lines around each match out of the data
+    :param data: the text, or the utf-8 encoded bytes the spans point into
+    :param spans: sorted list of (start, end) offsets of the matches in the data
+    :param context: the number of lines to include before and after each match
+    :param decode: function turning a slice of the data into text if the data is not text
+    :return: returns a list of Snippet for the given matches
+    """
+    newline = "\n" if decode is None else b"\n"
+    length = len(data)
+    snippets = []
+    line = 1
+    counted = 0
+    for start, end in spans:
+        # extend the match to the start and end of the lines around it
+        first = data.rfind(newline, 0, start) + 1
+        for _ in range(context):
+            if first == 0:
+                break
+            first = data.rfind(newline, 0, first - 1) + 1
+        last = data.find(newline, end)
+        for _ in range(context):
+            if last == -1:
+                break
+            last = data.find(newline, last + 1)
+        if last == -1:
+            last = length
+
+        # the line numbers are counted incrementally as the snippets are in order
+        line += data[counted:first].count(newline)
+        counted = first
+
+        if decode is None:
+            snippets.append(Snippet(line, data[first:last], start - first, end - first))
+        else:
+            match_start = len(decode(data[first:start]))
+            match_end = match_start + len(decode(data[start:end]))
+            snippets.append(Snippet(line, decode(data[first:last]), match_start, match_end))
+    return snippets
+
+
+def decodeText(data: bytes) -> str:
+    """
+    :return: returns the text of the utf-8 encoded data
+    """
+    return data.decode(errors='replace')
+
+
+class SearchPattern:
+    """
+    A search phrase compiled with the options selected by the user
+    """
+
+    def __init__(self, search: str, case_sensitive: bool = False, whole_word: bool = False,
+                 regex: bool = False, multiline: bool = False):
+        """
+        Compiles the search phrase
+        :param search: the phrase or regular expression to search for
+        :param case_sensitive: whether or not the case of the phrase has to match
+        :param whole_word: whether or not the phrase has to match whole words
+        :param regex: whether or not the phrase is a regular expression
+        :param multiline: whether or not ^ and $ match at the start and end of every line
+        :raises re.error: if the regular expression is invalid
+        """
+        self.search = search
+        self.case_sensitive = case_sensitive
+        self.whole_word = whole_word
+        self.regex = regex
+        flags = 0 if case_sensitive else re.IGNORECASE
+        if multiline:
+            flags |= re.MULTILINE
+
+        if regex:
+            self.text_pattern = re.compile(search, flags)
+        else:
+            pattern = re.escape(search)
+            if whole_word:
+                pattern = WORD_START + pattern + WORD_END
+            self.text_pattern = re.compile(pattern, flags)
+
+        # a literal phrase can be matched against the raw bytes of a utf-8 file as long as
+        # the comparison does not depend on how non-ascii characters are classified
+        self.bytes_pattern = None
+        if not regex and not whole_word and (case_sensitive or search.isascii()):
+            self.bytes_pattern = re.compile(re.escape(search.encode()), flags)
+
+    def refines(self, previous) -> bool:
+        """
+        Checks whether or not every match of this pattern starts where a match of the previous
+        pattern does. That holds when a literal phrase extends the previous phrase and matches
+        of the previous phrase can not overlap each other.
+        :param previous: the pattern of the previous search
+        :return: returns true if the matches of the previous pattern can be refined
+        """
+        if previous is None or self.regex or previous.regex or self.whole_word or \
+                previous.whole_word or self.case_sensitive != previous.case_sensitive:
+            return False
+
+        old, new = previous.search, self.search
+        if not self.case_sensitive:
+            old, new = old.lower(), new.lower()
+            if len(old) != len(previous.search) or len(new) != len(self.search):
+                return False
+        if not old or not new.startswith(old):
+            return False
+
+        # a phrase that ends with its own beginning has overlapping matches
+        return all(old[:i] != old[-i:] for i in range(1, len(old)))
+
+    def finditer(self, text: str):
+        """
+        :return: returns an iterator over the (start, end) spans of the non-empty matches
+        """
+        return (match.span() for match in self.text_pattern.finditer(text)
+                if match.end() > match.start())
+
+
+class SearchEngine:
+    """
+    Matches search patterns against files. Plain files are scanned through a memory map,
+    while the plain text of .lef files is cached so repeated searches do not re-parse them.
+    """
+
+    # the maximum number of .lef files whose plain text is cached
+    cache_size = 256
+    # the maximum number of snippets kept for the matches of a single file
+    snippet_limit = 100
+
+    def __init__(self, file_manager):
+        """
+        Initializes the engine
+        :param file_manager: reference to the file manager, used for the encryptor
+        """
+        logging.debug("Creating Search Engine")
+        self.file_manager = file_manager
+        # text_cache - ordered dict of (path : ((mtime_ns, size), plain text)) for .lef files
+        self.text_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def clearCache(self):
+        """
+        Forgets the cached text of every file
+        :return: returns nothing
+        """
+        with self.lock:
+            self.text_cache.clear()
+
+    def readText(self, path: str):
+        """
+        Reads the plain text the user sees for the file at the given path
+        :param path: path to the file
+        :return: returns the text or None if the file could not be read
+        """
+        if not path.endswith(".lef"):
+            return readFileText(path, self.file_manager.encryptor)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            cached = self.text_cache.get(path)
+            if cached is not None and cached[0] == signature:
+                self.text_cache.move_to_end(path)
+                return cached[1]
+
+        text = readFileText(path, self.file_manager.encryptor)
+        if text is None:
+            return None
+
+        with self.lock:
+            self.text_cache[path] = (signature, text)
+            self.text_cache.move_to_end(path)
+            while len(self.text_cache) > self.cache_size:
+                self.text_cache.popitem(last=False)
+        return text
+
+    def _canMapFile(self, path: str, pattern: SearchPattern) -> bool:
+        """
+        :return: returns whether or not the raw bytes of the file can be searched directly
+        """
+        return pattern.bytes_pattern is not None and self.file_manager.encryptor is None \
+            and not path.endswith(".lef")
+
+    def contains(self, path: str, pattern: SearchPattern) -> bool:
+        """
+        Checks whether or not the file at the given path contains the pattern
+        :param path: path to the file
+        :param pattern: the compiled search pattern
+        :return: returns true if there is at least one match
+        """
+        if self._canMapFile(path, pattern):
+            try:
+                with open(path, 'rb') as file:
+                    if os.fstat(file.fileno()).st_size == 0:
+                        return False
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        return pattern.bytes_pattern.search(data) is not None
+            except (OSError, ValueError) as e:
+                logging.warning("Could not map file - %s", e)
+                return False
+
+        text = self.readText(path)
+        return text is not None and next(pattern.finditer(text), None) is not None
+
+    def findAll(self, path: str, pattern: SearchPattern) -> list:
+        """
+        Finds every match of the pattern in the file at the given path
+        :param path: path to the file
+        :param pattern: the compiled search pattern
+        :return: returns a list of (start, end) character offsets into the plain text
+        """
+        return self.findSnippets(path, pattern, 0, 0)[0]
+
+    def findSnippets(self, path: str, pattern: SearchPattern, context: int = 1,
+                     limit: int = None) -> tuple:
+        """
+        Finds every match of the pattern in the file at the given path along with the lines
+        around the first matches, so the matches can be shown without loading the whole file
+        :param path: path to the file
+        :param pattern: the compiled search pattern
+        :param context: the number of lines to include before and after each match
+        :param limit: the maximum number of snippets, defaults to snippet_limit
+        :return: returns a tuple of the list of (start, end) character offsets into the plain
+        text and the list of Snippet of the first matches
+        """
+        if limit is None:
+            limit = self.snippet_limit
+
+        if self._canMapFile(path, pattern):
+            try:
+                with open(path, 'rb') as file:
+                    if os.fstat(file.fileno()).st_size == 0:
+                        return [], []
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        spans = [m.span() for m in pattern.bytes_pattern.finditer(data)]
+                        snippets = makeSnippets(data, spans[:limit], context, decodeText)
+                        return self._toCharOffsets(data, spans), snippets
+            except (OSError, ValueError) as e:
+                logging.warning("Could not map file - %s", e)
+                return [], []
+
+        text = self.readText(path)
+        if text is None:
+            return [], []
+        spans = list(pattern.finditer(text))
+        return spans, makeSnippets(text, spans[:limit], context)
+
+    @staticmethod
+    def _toCharOffsets(data, spans: list) -> list:
+        """
+        Converts byte offsets of matches in utf-8 data into character offsets
+        :param data: the utf-8 encoded data
+        :param spans: sorted list of (start, end) byte offsets
+        :return: returns the list of (start, end) character offsets
+        """
+        offsets = []
+        last_byte = 0
+        last_char = 0
+        for start, end in spans:
+            start_char = last_char + len(data[last_byte:start].decode(errors='replace'))
+            end_char = start_char + len(data[start:end].decode(errors='replace'))
+            offsets.append((start_char, end_char))
+            last_byte, last_char = end, end_char
+        return offsets
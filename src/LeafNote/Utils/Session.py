@@ -0,0 +1,79 @@
+"""
+This module remembers the open tabs between runs of the application
+"""
+import logging
+import os
+
+from PyQt5.QtCore import QSettings
+
+
+class Session:
+    """
+    Stores the open tabs, the current tab and the cursor and scroll position of every tab in
+    the settings. Restored tabs are placeholders, only the current document is read at startup
+    and the others are read when they are first shown.
+    """
+
+    def __init__(self, app, settings: QSettings):
+        """
+        Sets up the session store
+        :param app: reference to the application
+        :param settings: the settings the session is stored in
+        """
+        logging.debug("Creating Session")
+        self.app = app
+        self.settings = settings
+
+    def save(self):
+        """
+        Stores the open tabs in the settings
+        :return: returns nothing
+        """
+        file_manager = self.app.file_manager
+        tabs = self.app.bar_open_tabs
+        paths = [tabs.tabData(index) for index in range(tabs.count())]
+        paths = [path for path in paths if path in file_manager.open_documents]
+
+        current = ""
+        if file_manager.current_document is not None:
+            current = file_manager.current_document.absoluteFilePath()
+
+        view_states = {}
+        for path in paths:
+            view_state = file_manager.getViewState(self.app.document, path)
+            if view_state is not None:
+                view_states[path] = list(view_state)
+
+        logging.info("Saving session of %d tabs", len(paths))
+        self.settings.setValue("sessionTabs", paths)
+        self.settings.setValue("sessionCurrent", current)
+        self.settings.setValue("sessionViewStates", view_states)
+
+    def restore(self):
+        """
+        Opens the tabs stored in the settings, files that no longer exist are left out
+        :return: returns whether or not a document was shown
+        """
+        paths = self.settings.value("sessionTabs", [], list)
+        current = self.settings.value("sessionCurrent", "")
+        view_states = self.settings.value("sessionViewStates", {})
+        if not isinstance(view_states, dict):
+            view_states = {}
+
+        file_manager = self.app.file_manager
+        restored = []
+        for path in paths:
+            if not os.path.isfile(path) or path in file_manager.open_documents:
+                continue
+            view_state = view_states.get(path)
+            if view_state is not None:
+                view_state = tuple(int(value) for value in view_state)
+            file_manager.restoreDocument(path, view_state)
+            restored.append(path)
+        logging.info("Restored session of %d tabs", len(restored))
+
+        if not restored:
+            return False
+        if current not in restored:
+            current = restored[-1]
+        return file_manager.openDocument(self.app.document, current)
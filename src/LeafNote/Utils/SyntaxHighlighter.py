@@ -11,8 +11,13 @@ class SyntaxHighlighter(QSyntaxHighlighter):
     SyntaxHighlighter is an instance of QSyntaxHighlighter that allows us the modify the document
     """
 
-    def __init__(self, document):
-        super().__init__(document)
+    def __init__(self, document, text_document=None):
+        """
+        Sets up the highlighter
+        :param document: reference to the editor
+        :param text_document: the QTextDocument to highlight, defaults to the one of the editor
+        """
+        super().__init__(document if text_document is None else text_document)
         self.document = document
         self.highlighting_rules = []
         self.err_format = QTextCharFormat()
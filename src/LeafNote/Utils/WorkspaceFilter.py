@@ -0,0 +1,171 @@
+"""
+This module decides which files of a workspace are scanned. It reads the ignore rules of the
+workspace and sniffs files so binary and oversized files are skipped.
+"""
+import codecs
+import fnmatch
+import logging
+import os
+
+from LeafNote.Utils.ChunkedCipher import isContainer
+
+# name of the file in the root of the workspace that holds its ignore rules
+IGNORE_FILE = ".leafignore"
+# rules applied to every workspace, hidden files and directories are never scanned
+DEFAULT_IGNORE_RULES = [".*"]
+# the number of bytes looked at to tell whether or not a file holds text
+SNIFF_SIZE = 8192
+
+
+def isBinaryData(data: bytes) -> bool:
+    """
+    Checks whether or not the start of a file holds binary data rather than utf-8 text
+    :param data: the first bytes of the file
+    :return: returns true if the data is not text
+    """
+    if b"\0" in data:
+        return True
+    try:
+        # the sample may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(data, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def isBinaryFile(path: str) -> bool:
+    """
+    Checks whether or not the file at the given path holds binary data rather than utf-8 text,
+    the files of an encrypted workspace are checked once they are decrypted
+    :param path: path to the file
+    :return: returns true if the file is not text or could not be read
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(SNIFF_SIZE)
+            return not isContainer(data) and isBinaryData(data)
+    except OSError as e:
+        logging.warning("Could not read file - %s", e)
+        return True
+
+
+class IgnoreRule:
+    """
+    A single gitignore style glob
+    """
+
+    def __init__(self, rule: str):
+        """
+        Parses the rule
+        :param rule: a line of an ignore file
+        """
+        # a leading ! includes files that an earlier rule ignored
+        self.negated = rule.startswith("!")
+        if self.negated:
+            rule = rule[1:]
+        # a trailing / only matches directories
+        self.directory_only = rule.endswith("/")
+        rule = rule.rstrip("/")
+        # a rule containing a / matches paths relative to the root, otherwise any name
+        self.anchored = "/" in rule
+        self.pattern = rule.lstrip("/")
+
+    def matches(self, relative_path: str, is_dir: bool) -> bool:
+        """
+        :return: returns whether or not the rule matches the path relative to the root
+        """
+        if self.directory_only and not is_dir:
+            return False
+        if self.anchored:
+            return fnmatch.fnmatchcase(relative_path, self.pattern)
+        return fnmatch.fnmatchcase(os.path.basename(relative_path), self.pattern)
+
+
+class WorkspaceFilter:
+    """
+    Decides which files of a workspace are scanned by workspace search, the search index and
+    encryption. Files are skipped when they match the ignore rules in the .leafignore file of
+    the root, and search and indexing also skip files that are too large or not text.
+    """
+
+    def __init__(self, root: str, max_size: int = None):
+        """
+        Loads the ignore rules of the workspace
+        :param root: path to the root of the workspace
+        :param max_size: the size in bytes above which files are not searched, or None
+        """
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.rules = [IgnoreRule(rule) for rule in DEFAULT_IGNORE_RULES]
+
+        path = os.path.join(self.root, IGNORE_FILE)
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                    lines = [line.strip() for line in file]
+            except OSError as e:
+                logging.warning("Could not read ignore file - %s", e)
+                lines = []
+            # blank lines and lines starting with # are comments
+            self.rules.extend(IgnoreRule(line) for line in lines
+                              if line and not line.startswith("#"))
+
+    def isIgnored(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Checks whether or not the ignore rules exclude the given path
+        :param path: path to the file or directory
+        :param is_dir: whether or not the path is a directory
+        :return: returns true if the path is ignored
+        """
+        relative_path = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+        ignored = False
+        # the last rule that matches decides
+        for rule in self.rules:
+            if rule.negated == ignored and rule.matches(relative_path, is_dir):
+                ignored = not rule.negated
+        return ignored
+
+    def excludes(self, path: str) -> bool:
+        """
+        Checks whether or not the given file or any directory above it is ignored
+        :param path: path to the file
+        :return: returns true if the file is not part of the scanned workspace
+        """
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        while len(directory) > len(self.root):
+            if self.isIgnored(directory, True):
+                return True
+            directory = os.path.dirname(directory)
+        return self.isIgnored(path)
+
+    def walk(self):
+        """
+        Walks the workspace without descending into ignored directories
+        :return: returns a generator of the paths of the files that are not ignored
+        """
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames
+                           if not self.isIgnored(os.path.join(dirpath, d), True)]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not self.isIgnored(path):
+                    yield path
+
+    def isSearchable(self, path: str, size: int = None) -> bool:
+        """
+        Checks whether or not the file at the given path is small enough and holds text
+        :param path: path to the file
+        :param size: the size of the file if it is already known
+        :return: returns true if the file should be searched
+        """
+        if self.max_size is not None:
+            if size is None:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return False
+            if size > self.max_size:
+                logging.debug("File too large to search - %s", path)
+                return False
+        return not isBinaryFile(path)
@@ -0,0 +1,395 @@
+"""
+This module holds a persistent token index of all the files in a workspace.
+It is used to answer workspace searches without re-reading every file.
+"""
+import json
+import logging
+import os
+import re
+import zlib
+
+from cryptography.fernet import InvalidToken
+
+from LeafNote.Utils.AtomicFile import atomicWrite
+from LeafNote.Utils.Encryptor import isEncryptedData
+from LeafNote.Utils.SearchEngine import readFileText
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# name of the directory in the workspace that holds the index
+INDEX_DIR = ".leafIndex"
+INDEX_FILE = "tokens"
+INDEX_VERSION = 2
+
+# tokens are runs of letters and digits, matching how whole words are found in a document
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+# regex operations that must match their contents at least once
+REGEX_REPEATS = ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+
+
+def removeIndex(root: str):
+    """
+    Deletes the index stored in a workspace
+    :param root: path to the root of the workspace
+    :return: returns nothing
+    """
+    path = os.path.join(root, INDEX_DIR, INDEX_FILE)
+    try:
+        os.remove(path)
+        logging.info("Removed workspace index - %s", path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning("Could not remove workspace index - %s", e)
+
+
+def trigrams(token: str) -> set:
+    """
+    Splits the given token into the set of three character sequences it contains
+    :param token: the token to split
+    :return: returns the set of trigrams
+    """
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def regexLiterals(parsed):
+    """
+    Finds the literal strings a parsed regular expression requires in any text it matches.
+    The requirements are returned as a tree of ("and", [...]) and ("or", [...]) nodes
+    with the literal strings as leaves.
+    :param parsed: a regular expression parsed by sre_parse
+    :return: returns the tree of requirements or None if nothing is required
+    """
+    required = []
+    literal = ""
+    for op, value in parsed:
+        name = str(op)
+        if name == "LITERAL":
+            literal += chr(value)
+            continue
+
+        # any other operation ends the current run of literal characters
+        if literal:
+            required.append(literal)
+            literal = ""
+
+        if name == "SUBPATTERN":
+            required.append(regexLiterals(value[-1]))
+        elif name in REGEX_REPEATS and value[0] >= 1:
+            required.append(regexLiterals(value[2]))
+        elif name == "BRANCH":
+            branches = [regexLiterals(branch) for branch in value[1]]
+            if None not in branches:
+                required.append(("or", branches))
+
+    if literal:
+        required.append(literal)
+
+    required = [r for r in required if r is not None]
+    if not required:
+        return None
+    return ("and", required)
+
+
+def tokenize(text: str) -> set:
+    """
+    Splits the given text into the set of lower case tokens it contains
+    :param text: the text to split
+    :return: returns the set of tokens
+    """
+    return set(TOKEN_PATTERN.findall(text.lower()))
+
+
+class WorkspaceIndex:
+    """
+    Inverted index that maps every token in the workspace to the files that contain it.
+    The index is stored on disk in the workspace and is updated incrementally by comparing
+    the modification time and size of each file with the ones recorded when it was indexed.
+    """
+
+    def __init__(self, root: str, file_manager):
+        """
+        Initializes the index of the given workspace and loads it from disk if it exists
+        :param root: path to the root of the workspace
+        :param file_manager: reference to the file manager, used for the encryptor
+        """
+        logging.debug("Creating Workspace Index - %s", root)
+        self.root = os.path.abspath(root)
+        self.file_manager = file_manager
+
+        # files - dict of (absolute path : (mtime_ns, size)) at the time the file was indexed
+        self.files = {}
+        # tokens - dict of (absolute path : set of tokens in the file)
+        self.tokens = {}
+        # postings - dict of (token : set of absolute paths containing the token)
+        self.postings = {}
+        # trigrams - dict of (trigram : set of tokens containing the trigram)
+        self.trigrams = {}
+        self.modified = False
+        # workspace_filter - decides which files of the workspace are indexed
+        self.workspace_filter = file_manager.getWorkspaceFilter(self.root)
+
+        self.load()
+
+    def getIndexPath(self) -> str:
+        """
+        :return: returns the path of the file the index is stored in
+        """
+        return os.path.join(self.root, INDEX_DIR, INDEX_FILE)
+
+    def contains(self, path: str) -> bool:
+        """
+        :return: returns whether or not the given path belongs to this workspace and is not
+        ignored by it
+        """
+        path = os.path.abspath(path)
+        return os.path.commonpath([self.root, path]) == self.root and \
+            not self.workspace_filter.excludes(path)
+
+    def getAllFiles(self) -> list:
+        """
+        :return: returns a sorted list of every indexed file in the workspace
+        """
+        return sorted(self.files)
+
+    def load(self):
+        """
+        Loads the index from disk. A missing or unreadable index leaves the index empty,
+        the next refresh will then rebuild it.
+        :return: returns nothing
+        """
+        path = self.getIndexPath()
+        if not os.path.exists(path):
+            logging.info("No index found for workspace - %s", self.root)
+            return
+
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            encryptor = self.file_manager.encryptor
+            if encryptor is not None:
+                if not isEncryptedData(data):
+                    # the tokens of every file must not stay on disk in plain text
+                    logging.warning("Workspace index is not encrypted. Rebuilding")
+                    removeIndex(self.root)
+                    return
+                data = encryptor.decryptData(data)
+            data = json.loads(zlib.decompress(data).decode())
+        except (OSError, ValueError, zlib.error, InvalidToken) as e:
+            logging.warning("Could not load workspace index - %s", e)
+            return
+
+        if data.get("version") != INDEX_VERSION:
+            logging.info("Workspace index is outdated. Rebuilding")
+            return
+
+        for rel_path, (mtime, size, tokens) in data["files"].items():
+            self._addFile(os.path.join(self.root, rel_path), (mtime, size), set(tokens))
+        logging.info("Loaded index of %d files", len(self.files))
+
+    def save(self):
+        """
+        Writes the index to disk if it was modified since it was loaded
+        :return: returns nothing
+        """
+        if not self.modified:
+            return
+
+        files = {}
+        for path, (mtime, size) in self.files.items():
+            files[os.path.relpath(path, self.root)] = (mtime, size, sorted(self.tokens[path]))
+        data = zlib.compress(json.dumps({"version": INDEX_VERSION, "files": files}).encode())
+        encryptor = self.file_manager.encryptor
+        if encryptor is not None:
+            data = encryptor.encryptData(data)
+
+        path = self.getIndexPath()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomicWrite(path, data)
+        except OSError as e:
+            logging.exception(e)
+            logging.error("Could not save workspace index")
+            return
+
+        self.modified = False
+        logging.info("Saved index of %d files", len(self.files))
+
+    def rewrite(self):
+        """
+        Writes the whole index again, so it is stored encrypted or in plain text like the files
+        of the workspace once the workspace was encrypted or decrypted
+        :return: returns nothing
+        """
+        self.modified = True
+        self.save()
+
+    def refresh(self):
+        """
+        Walks the workspace and re-indexes every file that was added, removed or
+        changed since it was last indexed
+        :return: returns nothing
+        """
+        # the ignore rules may have changed since the last refresh
+        self.workspace_filter = self.file_manager.getWorkspaceFilter(self.root)
+        found = set()
+        for path in self.workspace_filter.walk():
+            found.add(path)
+            self.update(path)
+
+        for path in set(self.files) - found:
+            self.remove(path)
+
+        self.save()
+
+    def update(self, path: str):
+        """
+        Re-indexes the given file if its modification time or size changed
+        :param path: path to the file
+        :return: returns nothing
+        """
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self.files.get(path) == signature:
+            return
+
+        # binary and oversized files are never searched
+        if not self.workspace_filter.isSearchable(path, stat.st_size):
+            self.remove(path)
+            return
+
+        text = readFileText(path, self.file_manager.encryptor)
+        if text is None:
+            self.remove(path)
+            return
+
+        self.remove(path)
+        self._addFile(path, signature, tokenize(text))
+        self.modified = True
+
+    def remove(self, path: str):
+        """
+        Removes the given file from the index
+        :param path: path to the file
+        :return: returns nothing
+        """
+        path = os.path.abspath(path)
+        if path not in self.files:
+            return
+
+        self.files.pop(path)
+        for token in self.tokens.pop(path):
+            paths = self.postings[token]
+            paths.discard(path)
+            if not paths:
+                self.postings.pop(token)
+                for trigram in trigrams(token):
+                    tokens = self.trigrams[trigram]
+                    tokens.discard(token)
+                    if not tokens:
+                        self.trigrams.pop(trigram)
+        self.modified = True
+
+    def _addFile(self, path: str, signature: tuple, tokens: set):
+        """
+        Adds the given file and its tokens to the index
+        """
+        self.files[path] = tuple(signature)
+        self.tokens[path] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                for trigram in trigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            self.postings[token].add(path)
+
+    def candidates(self, search: str, whole_word: bool = False, regex: bool = False):
+        """
+        Finds the files that may contain the given search phrase.
+        Every file that contains the phrase is guaranteed to be returned.
+        :param search: the phrase or regular expression to search for
+        :param whole_word: whether or not the phrase has to match whole words
+        :param regex: whether or not the search is a regular expression
+        :return: returns a set of paths or None if the index cannot narrow down the search
+        """
+        if not regex:
+            return self._literalCandidates(search, whole_word)
+
+        try:
+            required = regexLiterals(sre_parse.parse(search))
+        except (re.error, OverflowError, RecursionError):
+            return None
+        return self._requiredCandidates(required)
+
+    def _requiredCandidates(self, required):
+        """
+        Finds the files that satisfy a tree of literal requirements built by regexLiterals
+        :return: returns a set of paths or None if every file may satisfy the requirements
+        """
+        if required is None:
+            return None
+        if isinstance(required, str):
+            return self._literalCandidates(required)
+
+        kind, children = required
+        result = None
+        for child in children:
+            paths = self._requiredCandidates(child)
+            if kind == "or":
+                # a branch that cannot be narrowed down can match any file
+                if paths is None:
+                    return None
+                result = paths if result is None else result | paths
+            elif paths is not None:
+                result = paths if result is None else result & paths
+        return result
+
+    def _literalCandidates(self, search: str, whole_word: bool = False):
+        """
+        Finds the files that may contain the given literal phrase
+        :return: returns a set of paths or None if the index cannot narrow down the search
+        """
+        tokens = TOKEN_PATTERN.findall(search.lower())
+        if not tokens:
+            return None
+
+        result = None
+        for i, token in enumerate(tokens):
+            # the first and last tokens of a phrase may only be part of a word
+            is_partial = not whole_word and (i == 0 or i == len(tokens) - 1)
+            paths = set()
+            for indexed_token in self._matchingTokens(token) if is_partial else [token]:
+                paths |= self.postings.get(indexed_token, set())
+
+            result = paths if result is None else result & paths
+            if not result:
+                break
+
+        return result
+
+    def _matchingTokens(self, token: str):
+        """
+        Finds every indexed token that contains the given token
+        :param token: the part of a word to look for
+        :return: returns a list of indexed tokens
+        """
+        # tokens too short to hold a trigram have to be compared with the whole vocabulary
+        if len(token) < 3:
+            return [t for t in self.postings if token in t]
+
+        tokens = None
+        for trigram in trigrams(token):
+            found = self.trigrams.get(trigram, set())
+            tokens = found if tokens is None else tokens & found
+            if not tokens:
+                return []
+        return [t for t in tokens if token in t]
@@ -2,8 +2,10 @@
 Module file for Utils
 """
 from .DialogBuilder import DialogBuilder
+from .Autosave import Autosave
 from .FileManager import FileManager
 from .Reminders import Reminders
+from .Session import Session
 from .SyntaxHighlighter import SyntaxHighlighter
 from . import Encryptor
 from . import Summarizer
@@ -43,6 +43,7 @@ class App(QMainWindow):
         self.settings = QSettings(self.app_props.domain, self.app_props.title)
         self.file_manager = Utils.FileManager(self)
         self.reminders = Utils.Reminders(self, self.settings)
+        self.session = Utils.Session(self, self.settings)
         self.btn_mode_switch = None
         self.thread_placeholder = None
 
@@ -53,6 +54,8 @@ class App(QMainWindow):
 
         # Create Document
         self.document = Elements.Document(self, self.doc_props)
+        self.file_manager.autosave = Utils.Autosave(self.file_manager, self.document,
+                                                    self.app_props)
 
         # Create TopBar, depends on Document
         self.top_bar = Elements.BarTop(self.app_props.path_res, self.document)
@@ -69,10 +72,12 @@ class App(QMainWindow):
 
         self.search_and_replace = Elements.SearchReplace(self.app_props.path_res, self.document)
         self.right_menu = Elements.MenuRight(self, self.layout_props, self.document)
+        self.viewer = Elements.MappedViewer()
         self.documents_view = self.layout.makeHSplitterLayout(self.left_menu, self.bar_open_tabs,
                                                               self.document,
                                                               self.right_menu,
-                                                              self.search_and_replace)
+                                                              self.search_and_replace,
+                                                              self.viewer)
         layout_main.addWidget(self.documents_view)
 
         # Create BottomBar, depends on document
@@ -240,23 +245,13 @@ class App(QMainWindow):
 
         path_workspace = self.left_menu.model.rootPath()
         self.settings.setValue("workspacePath", path_workspace)
+        self.session.save()
 
-        # check if the document is out of date
-        will_save = False
-        if self.file_manager.current_document is not None:
-            path = self.file_manager.current_document.absoluteFilePath()
-            saved_data = self.file_manager.getFileData(path)
-            if self.file_manager.current_document.suffix() == "lef":
-                curr_data = self.document.toHtml()
-            else:
-                curr_data = self.document.toPlainText()
-
-            if saved_data != curr_data:
-                will_save = True
-        elif self.document.toPlainText() != "":
-            will_save = True
+        if self.file_manager.workspace_index is not None:
+            self.file_manager.workspace_index.save()
 
-        if will_save:
+        # check if the shown document has changes that are not saved
+        if self.file_manager.isModified(self.document):
             save_dialog = Utils.DialogBuilder(self, "File Not Saved",
                                               "Would you like to save "
                                               "your changes?")
@@ -265,6 +260,21 @@ class App(QMainWindow):
             if save_dialog.exec():
                 self.file_manager.saveDocument(self.document)
 
+        # the documents of the other tabs may hold changes as well
+        for path in self.file_manager.getModifiedDocuments(self.document):
+            save_dialog = Utils.DialogBuilder(self, "File Not Saved",
+                                              "Would you like to save "
+                                              "your changes to " + os.path.basename(path) + "?")
+            buttons = QDialogButtonBox(QDialogButtonBox.No | QDialogButtonBox.Yes)
+            save_dialog.addButtonBox(buttons)
+            if save_dialog.exec():
+                self.file_manager.saveOpenDocument(self.document, path)
+
+        # wait for the queued saves to be written before the application quits, the journals
+        # of the documents that are still not saved are kept
+        self.file_manager.save_queue.flush()
+        self.file_manager.autosave.discardSaved()
+
         path_key = os.path.join(path_workspace, '.leafCryptoKey')
         if self.file_manager.encryptor is not None and not os.path.exists(path_key):
             dialog_encryptor = Utils.DialogBuilder(self, "Crypto - WARNING",
@@ -279,12 +289,12 @@ class App(QMainWindow):
             dialog_encryptor.addButtonBox(buttons)
             if dialog_encryptor.exec():
                 logging.info("START DECRYPT WORKSPACE: %s", path_workspace)
-                for dirpath, dirnames, filenames in os.walk(path_workspace):
-                    for filename in [f for f in filenames if not f.startswith(".")]:
-                        path = os.path.join(dirpath, filename)
-                        self.file_manager.encryptor.decryptFile(path)
-                        logging.info(" - Decrypted: %s", path)
-                        logging.debug(dirnames)
+                job = Utils.Encryptor.CryptoJob(self.file_manager.encryptor.key,
+                                                Utils.Encryptor.getWorkspaceFiles(path_workspace),
+                                                False,
+                                                Utils.Encryptor.CryptoManifest(path_workspace))
+                # without the key the files can not be read once the application quit
+                Utils.Encryptor.runCryptoJob(self, job, "Decrypting Workspace", False)
                 logging.info("END DECRYPT WORKSPACE: %s", path_workspace)
 
         return super().closeEvent(event)
@@ -297,4 +307,7 @@ def run():
     ctx = QApplication([])
     app = App(ctx)
     app.show()
+    Utils.Encryptor.resumeCryptoJob(app, app.file_manager)
+    app.session.restore()
+    app.file_manager.autosave.recover(app)
     return ctx.exec_()
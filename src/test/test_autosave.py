@@ -0,0 +1,285 @@
+"""
+test Autosave behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PyQt5.QtGui import QFont, QTextCursor
+from cryptography.fernet import Fernet
+
+import test
+
+from LeafNote.Utils.Autosave import RecoveryJournal
+
+
+class TestAutosave(unittest.TestCase):
+    """
+    Unit test for the recovery journal of unsaved edits
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.document = test.app.document
+        self.file_manager = test.app.file_manager
+        self.autosave = self.file_manager.autosave
+        self.document.setPlainText("")
+        self.root = tempfile.mkdtemp()
+        self.journal = self.autosave.journal
+        self.autosave.journal = RecoveryJournal(os.path.join(self.root, "journal"))
+        self.path = os.path.join(self.root, "notes.txt")
+        with open(self.path, 'w') as file:
+            file.write("first line\nsecond line\n")
+
+    def tearDown(self):
+        """
+        Close the documents and remove the temporary workspace
+        """
+        for path in list(self.file_manager.open_documents):
+            test.app.bar_open_tabs.forceCloseTab(path)
+        self.file_manager.save_queue.flush()
+        self.autosave.journal = self.journal
+        shutil.rmtree(self.root)
+
+    def edit(self):
+        """
+        Makes a few edits to the shown document
+        """
+        cursor = self.document.textCursor()
+        cursor.setPosition(6)
+        cursor.insertText("new\nlines ")
+        cursor.setPosition(0)
+        cursor.deleteChar()
+        cursor.insertText("F")
+
+    def testJournal(self):
+        """
+        Tests that edits are appended to the journal and restored after a crash
+        """
+        self.file_manager.openDocument(self.document, self.path)
+        self.edit()
+        self.autosave.journal_debouncer.flush()
+        journal_path = self.autosave.journal.getJournalPath(self.path)
+        size = os.path.getsize(journal_path)
+
+        # later edits are appended to the journal
+        self.document.textCursor().insertText("!")
+        self.autosave.journal_debouncer.flush()
+        with open(journal_path, 'rb') as file:
+            data = file.read()
+        self.assertTrue(data.startswith(data[:size]))
+        self.assertEqual(data.count(b"\n"), 5)
+        expected = self.document.toPlainText()
+
+        # closing without saving removes the journal, put it back to act as a crash
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        self.assertFalse(os.path.exists(journal_path))
+        with open(journal_path, 'wb') as file:
+            file.write(data)
+        self.autosave.journal.bases.clear()
+
+        with mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec', return_value=1):
+            self.autosave.recover(test.app)
+        self.assertEqual(self.document.toPlainText(), expected)
+        self.assertTrue(self.file_manager.isModified(self.document))
+
+    def testSaveRemovesJournal(self):
+        """
+        Tests that saving the document removes its journal
+        """
+        self.file_manager.openDocument(self.document, self.path)
+        self.edit()
+        self.autosave.journal_debouncer.flush()
+        journal_path = self.autosave.journal.getJournalPath(self.path)
+        self.assertTrue(os.path.exists(journal_path))
+
+        self.autosave.save_debouncer.flush()
+        self.file_manager.save_queue.flush()
+        test.ctx.processEvents()
+        self.assertFalse(os.path.exists(journal_path))
+        self.assertEqual(self.autosave.edits, {})
+
+    def testChangedFile(self):
+        """
+        Tests that journals of files that changed since are not restored
+        """
+        self.file_manager.openDocument(self.document, self.path)
+        self.edit()
+        self.autosave.journal_debouncer.flush()
+        self.autosave.journal.bases.clear()
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        self.autosave.journal.append(self.path, "0" * 32, [[0, 0, "x"]])
+        self.autosave.journal.bases.clear()
+
+        with mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec') as dialog:
+            self.autosave.recover(test.app)
+        dialog.assert_not_called()
+        self.assertEqual(os.listdir(os.path.join(self.root, "journal")), [])
+
+    def testFormattedJournal(self):
+        """
+        Tests that the formatting of .lef documents is journaled and restored after a crash
+        """
+        lef = os.path.join(self.root, "notes.lef")
+        with open(lef, 'w') as file:
+            file.write("<p>plain words</p>")
+        self.file_manager.openDocument(self.document, lef)
+        cursor = self.document.textCursor()
+        cursor.setPosition(0)
+        cursor.setPosition(5, QTextCursor.KeepAnchor)
+        self.document.setTextCursor(cursor)
+        self.document.onFontBoldChanged(True)
+        self.assertTrue(self.autosave.save_debouncer.isPending())
+        self.autosave.journal_debouncer.flush()
+        journal_path = self.autosave.journal.getJournalPath(lef)
+        with open(journal_path, 'rb') as file:
+            data = file.read()
+
+        test.app.bar_open_tabs.forceCloseTab(lef)
+        with open(journal_path, 'wb') as file:
+            file.write(data)
+        self.autosave.journal.bases.clear()
+        with mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec', return_value=1):
+            self.autosave.recover(test.app)
+        self.assertEqual(self.document.toPlainText(), "plain words")
+        cursor = QTextCursor(self.document.document())
+        cursor.setPosition(3)
+        self.assertEqual(cursor.charFormat().fontWeight(), QFont.Bold)
+        cursor.setPosition(8)
+        self.assertNotEqual(cursor.charFormat().fontWeight(), QFont.Bold)
+        self.assertTrue(self.file_manager.isModified(self.document))
+
+    def testFailedSave(self):
+        """
+        Tests that a document that could not be saved keeps being journaled against the data
+        its file still holds
+        """
+        self.file_manager.openDocument(self.document, self.path)
+        stored = self.file_manager.getStoredHash(self.path)
+        self.edit()
+        with mock.patch('LeafNote.Utils.SaveQueue.atomicWrite', side_effect=OSError("full")), \
+                mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec'):
+            self.file_manager.saveDocument(self.document)
+            self.file_manager.save_queue.flush()
+            test.ctx.processEvents()
+        self.assertEqual(self.file_manager.saved_hashes[self.path], stored)
+        self.assertTrue(self.file_manager.isModified(self.document))
+
+        # later edits are appended to the journal of the unsaved text
+        self.document.textCursor().insertText("!")
+        self.autosave.journal_debouncer.flush()
+        expected = self.document.toPlainText()
+        journal_path = self.autosave.journal.getJournalPath(self.path)
+        with open(journal_path, 'rb') as file:
+            data = file.read()
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        with open(journal_path, 'wb') as file:
+            file.write(data)
+        self.autosave.journal.bases.clear()
+        with mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec', return_value=1):
+            self.autosave.recover(test.app)
+        self.assertEqual(self.document.toPlainText(), expected)
+
+    def testFailedSaveHibernated(self):
+        """
+        Tests that a hibernated document that could not be saved is modified again
+        """
+        other = os.path.join(self.root, "other.txt")
+        with open(other, 'w') as file:
+            file.write("other\n")
+        self.file_manager.openDocument(self.document, self.path)
+        self.edit()
+        self.file_manager.openDocument(self.document, other, False)
+        self.file_manager.hibernateDocument(self.document, self.path)
+        with mock.patch('LeafNote.Utils.SaveQueue.atomicWrite', side_effect=OSError("full")), \
+                mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec'):
+            self.file_manager.saveOpenDocument(self.document, self.path)
+            self.file_manager.save_queue.flush()
+            test.ctx.processEvents()
+        self.assertTrue(self.file_manager.hibernated_documents[self.path].modified)
+        self.assertEqual(self.file_manager.getModifiedDocuments(self.document), [self.path])
+        self.assertTrue(os.path.exists(self.autosave.journal.getJournalPath(self.path)))
+
+    def testDiscardSaved(self):
+        """
+        Tests that quitting keeps the journals of the documents whose last save failed and
+        removes the others
+        """
+        other = os.path.join(self.root, "other.txt")
+        with open(other, 'w') as file:
+            file.write("other\n")
+        self.file_manager.openDocument(self.document, other)
+        self.document.textCursor().insertText("saved ")
+        self.autosave.journal_debouncer.flush()
+        self.file_manager.openDocument(self.document, self.path)
+        self.file_manager.save_queue.flush()
+        self.edit()
+        expected = self.document.toPlainText()
+        with mock.patch('LeafNote.Utils.SaveQueue.atomicWrite', side_effect=OSError("full")):
+            self.file_manager.saveDocument(self.document)
+            self.file_manager.save_queue.flush()
+        # the failed signal is not handled before the application quits
+        self.autosave.discardSaved()
+        self.assertFalse(os.path.exists(self.autosave.journal.getJournalPath(other)))
+        journal_path = self.autosave.journal.getJournalPath(self.path)
+        self.assertTrue(os.path.exists(journal_path))
+
+        with open(journal_path, 'rb') as file:
+            data = file.read()
+        with mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec'):
+            test.ctx.processEvents()
+        test.app.bar_open_tabs.forceCloseTab(other)
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        # switching tabs saved the file, put back what it held when the application quit
+        with open(self.path, 'w') as file:
+            file.write("first line\nsecond line\n")
+        with open(journal_path, 'wb') as file:
+            file.write(data)
+        self.autosave.journal.bases.clear()
+        with mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec', return_value=1):
+            self.autosave.recover(test.app)
+        self.assertEqual(self.document.toPlainText(), expected)
+
+    def testRecoverLargeFile(self):
+        """
+        Tests that edits are restored to the whole text of a file that is loaded progressively
+        """
+        data = "".join("line %d\n" % i for i in range(20))
+        with open(self.path, 'w') as file:
+            file.write(data)
+        self.file_manager.openDocument(self.document, self.path)
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        position = len(data) - 3
+        self.autosave.journal.append(self.path, self.file_manager.saved_hashes[self.path].hex(),
+                                     [[position, 0, "x"]])
+        self.autosave.journal.bases.clear()
+
+        doc_props = test.app.doc_props
+        with mock.patch.object(doc_props, 'progressive_load_size', 10), \
+                mock.patch.object(doc_props, 'load_chunk_size', 16), \
+                mock.patch('LeafNote.Utils.Autosave.DialogBuilder.exec', return_value=1):
+            self.autosave.recover(test.app)
+        self.assertFalse(self.document.isLoading())
+        self.assertEqual(self.document.toPlainText(), data[:position] + "x" + data[position:])
+
+    def testEncryptedHeader(self):
+        """
+        Tests that the header of an encrypted journal does not show the path or the hash
+        """
+        fernet = Fernet(Fernet.generate_key())
+        journal = self.autosave.journal
+        journal.append(self.path, "ab" * 16, [[0, 0, "x"]], fernet.encrypt)
+        with open(journal.getJournalPath(self.path), 'rb') as file:
+            data = file.read()
+        self.assertNotIn(os.path.basename(self.path).encode('utf-8'), data)
+        self.assertNotIn(b"ab" * 16, data)
+
+        self.assertEqual(journal.getLeftovers(), [])
+        (_, header, edits), = journal.getLeftovers(fernet.decrypt)
+        self.assertEqual(header["path"], self.path)
+        self.assertEqual(header["base"], "ab" * 16)
+        self.assertEqual(edits, [[0, 0, "x"]])
@@ -0,0 +1,245 @@
+"""
+test Encryptor behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cryptography.fernet import Fernet, InvalidToken
+
+import test
+
+from LeafNote.Utils.ChunkedCipher import ChunkedCipher, ChunkedReader, MAGIC
+from LeafNote.Utils.CryptoManifest import CryptoManifest, STATE_ENCRYPTED, STATE_PLAIN, \
+    OPERATION_ENCRYPT
+from LeafNote.Utils.DecryptedCache import DecryptedCache
+from LeafNote.Utils.Encryptor import Encryptor, CryptoJob, encryptPath, decryptWorkspace
+
+
+class TestEncryptor(unittest.TestCase):
+    """
+    Unit test for encrypting and decrypting the files of a workspace
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.root = tempfile.mkdtemp()
+        self.key = Fernet.generate_key()
+        self.encryptor = Encryptor(self.key)
+        self.files = {}
+        for i in range(20):
+            path = os.path.join(self.root, "note%d.txt" % i)
+            data = ("note %d\n" % i).encode() * (i + 1)
+            with open(path, 'wb') as file:
+                file.write(data)
+            self.files[path] = data
+
+    def tearDown(self):
+        """
+        Remove the temporary workspace
+        """
+        shutil.rmtree(self.root)
+
+    def read(self, path):
+        """
+        Reads the bytes of a file
+        """
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def testEncryptDecrypt(self):
+        """
+        Tests that the files are encrypted and decrypted by the worker processes and that
+        running a job again leaves the files that are done as they are
+        """
+        progress = []
+        paths = sorted(self.files)
+        job = CryptoJob(self.key, paths, True)
+        job.progress.connect(lambda done, total, path: progress.append((done, total)))
+        job.run()
+        self.assertEqual(job.failed, [])
+        self.assertEqual(progress[-1], (20, 20))
+        for path, data in self.files.items():
+            self.assertTrue(self.read(path).startswith(MAGIC))
+            self.assertEqual(self.encryptor.decryptData(self.read(path)), data)
+
+        encrypted = self.read(paths[0])
+        CryptoJob(self.key, paths[:1], True).run()
+        self.assertEqual(self.read(paths[0]), encrypted)
+
+        job = CryptoJob(self.key, paths, False)
+        job.run()
+        self.assertEqual(job.failed, [])
+        for path, data in self.files.items():
+            self.assertEqual(self.read(path), data)
+
+    def testCancel(self):
+        """
+        Tests that a cancelled job writes no more files
+        """
+        job = CryptoJob(self.key, sorted(self.files), True)
+        job.cancel()
+        job.run()
+        for path, data in self.files.items():
+            self.assertEqual(self.read(path), data)
+
+    def testLegacyFiles(self):
+        """
+        Tests that files encrypted as a single token are still read and decrypted
+        """
+        path = sorted(self.files)[0]
+        with open(path, 'wb') as file:
+            file.write(self.encryptor.encrypt(self.files[path]))
+        self.assertTrue(self.encryptor.isEncryptedFile(path))
+        self.assertEqual(self.encryptor.decryptData(self.read(path)), self.files[path])
+
+        CryptoJob(self.key, [path], False).run()
+        self.assertEqual(self.read(path), self.files[path])
+
+    def testChunkedReader(self):
+        """
+        Tests that ranges of encrypted data are read across segments and that changed data
+        is rejected
+        """
+        cipher = ChunkedCipher(self.key, 10)
+        data = b"".join(b"line %d\n" % i for i in range(50))
+        encrypted = cipher.encrypt(data)
+        self.assertEqual(cipher.decrypt(encrypted), data)
+
+        reader = ChunkedReader(encrypted, cipher)
+        self.assertEqual(len(reader), len(data))
+        self.assertEqual(reader[5:37], data[5:37])
+        self.assertEqual(reader[len(data) - 3:], data[-3:])
+        for pattern in (b"line 12", b"\n", b"9\nline 3"):
+            self.assertEqual(reader.find(pattern, 7), data.find(pattern, 7))
+            self.assertEqual(reader.rfind(pattern, 0, 200), data.rfind(pattern, 0, 200))
+
+        with self.assertRaises(InvalidToken):
+            cipher.decrypt(encrypted[:-30])
+        with self.assertRaises(InvalidToken):
+            ChunkedReader(encrypted[:-1], cipher)
+
+    def testResume(self):
+        """
+        Tests that an interrupted job resumes without encrypting the files that are done again
+        and that the manifest skips files without reading them
+        """
+        paths = sorted(self.files)
+        manifest = CryptoManifest(self.root)
+        manifest.begin(OPERATION_ENCRYPT)
+        for path in paths[:5]:
+            _, error, digest = encryptPath(self.key, path)
+            self.assertIsNone(error)
+            manifest.record(path, STATE_ENCRYPTED, digest)
+        # the application quit before the job finished
+        manifest.close()
+
+        manifest = CryptoManifest(self.root)
+        self.assertEqual(manifest.operation, OPERATION_ENCRYPT)
+        self.assertEqual(manifest.getState(paths[0]), STATE_ENCRYPTED)
+        self.assertIsNone(manifest.getState(paths[5]))
+        job = CryptoJob(self.key, paths, True, manifest)
+        job.run()
+        self.assertEqual(job.skipped, 5)
+        self.assertEqual(job.failed, [])
+        for path, data in self.files.items():
+            self.assertEqual(self.encryptor.decryptData(self.read(path)), data)
+
+        manifest = CryptoManifest(self.root)
+        self.assertIsNone(manifest.operation)
+        self.assertTrue(all(manifest.getState(path) == STATE_ENCRYPTED for path in paths))
+
+        job = CryptoJob(self.key, paths, False, manifest)
+        job.run()
+        self.assertEqual(job.failed, [])
+        self.assertEqual(CryptoManifest(self.root).getState(paths[0]), STATE_PLAIN)
+        for path, data in self.files.items():
+            self.assertEqual(self.read(path), data)
+
+    def testDigest(self):
+        """
+        Tests that a file not decrypting to the contents the manifest recorded is left encrypted
+        """
+        paths = sorted(self.files)
+        manifest = CryptoManifest(self.root)
+        CryptoJob(self.key, paths, True, manifest).run()
+        state, _, stamp = manifest.entries["note0.txt"]
+        manifest.entries["note0.txt"] = (state, "0" * 64, stamp)
+
+        job = CryptoJob(self.key, paths, False, manifest)
+        job.run()
+        self.assertEqual([path for path, _ in job.failed], [os.path.join(self.root, "note0.txt")])
+        self.assertEqual(manifest.operation, "decrypt")
+        self.assertTrue(self.read(os.path.join(self.root, "note0.txt")).startswith(MAGIC))
+
+    def testDecryptedCache(self):
+        """
+        Tests that files that did not change are not decrypted again and that dropped entries
+        are overwritten
+        """
+        path = sorted(self.files)[0]
+        CryptoJob(self.key, [path], True).run()
+        with mock.patch.object(self.encryptor.cipher, 'decrypt',
+                               wraps=self.encryptor.cipher.decrypt) as decrypt:
+            for _ in range(3):
+                with open(path, 'rb') as file:
+                    self.assertEqual(self.encryptor.readFile(path, file), self.files[path])
+            self.assertEqual(decrypt.call_count, 1)
+
+            with open(path, 'wb') as file:
+                file.write(self.encryptor.encryptData(b"changed\n"))
+            with open(path, 'rb') as file:
+                self.assertEqual(self.encryptor.readFile(path, file), b"changed\n")
+            self.assertEqual(decrypt.call_count, 2)
+
+        cache = DecryptedCache(10)
+        cache.put("first", (1, 1), b"123456")
+        first = cache.entries["first"][1]
+        cache.put("second", (1, 1), b"7890")
+        self.assertEqual(cache.get("first", (1, 1)), b"123456")
+        cache.put("third", (1, 1), b"abc")
+        self.assertIsNone(cache.get("second", (1, 1)))
+        self.assertIsNone(cache.get("first", (2, 1)))
+        self.assertEqual(first, bytes(6))
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def testDecryptIgnoredFiles(self):
+        """
+        Tests that decrypting the workspace decrypts files that were hidden or ignored after
+        they were encrypted and that the key and the cached plain text are dropped once no
+        encrypted file is left
+        """
+        with open(os.path.join(self.root, ".leafignore"), 'w') as file:
+            file.write("ignored/\n")
+        hidden = {}
+        for directory in ("ignored", ".hidden"):
+            os.mkdir(os.path.join(self.root, directory))
+            path = os.path.join(self.root, directory, "note.txt")
+            with open(path, 'wb') as file:
+                file.write(self.encryptor.encryptData(b"hidden note\n"))
+            hidden[path] = b"hidden note\n"
+        lef = os.path.join(self.root, "notes.lef")
+        with open(lef, 'wb') as file:
+            file.write(self.encryptor.encryptData(b"<p>secret</p>"))
+        hidden[lef] = b"<p>secret</p>"
+        path_key = os.path.join(self.root, ".leafCryptoKey")
+        with open(path_key, 'wb') as file:
+            file.write(self.key)
+        CryptoJob(self.key, sorted(self.files), True).run()
+
+        file_manager = test.app.file_manager
+        with mock.patch.object(file_manager, 'encryptor', self.encryptor), \
+                mock.patch('LeafNote.Utils.Encryptor.runCryptoJob',
+                           lambda app, job, text_title: job.run()):
+            self.assertIn("secret", file_manager.search_engine.readText(lef))
+            self.assertTrue(decryptWorkspace(test.app, file_manager, self.root))
+        # the search engine does not keep the plain text read with the removed key
+        self.assertNotIn(lef, file_manager.search_engine.text_cache)
+        for path, data in list(self.files.items()) + list(hidden.items()):
+            self.assertEqual(self.read(path), data)
+        self.assertFalse(os.path.exists(path_key))
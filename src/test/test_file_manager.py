@@ -0,0 +1,424 @@
+"""
+test FileManager behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import test
+
+from cryptography.fernet import Fernet
+
+from LeafNote.Utils.AtomicFile import atomicWrite, NEW_FILE_MODE
+from LeafNote.Utils.Encryptor import Encryptor
+
+
+class TestFileManager(unittest.TestCase):
+    """
+    Unit test for opening, switching and closing documents
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.document = test.app.document
+        self.file_manager = test.app.file_manager
+        self.document.setPlainText("")
+        self.root = tempfile.mkdtemp()
+        self.first = self.writeFile("first.txt", "first line\nsecond line\n")
+        self.second = self.writeFile("second.txt", "another file\n")
+
+    def tearDown(self):
+        """
+        Close the documents and remove the temporary workspace
+        """
+        for path in list(self.file_manager.open_documents):
+            test.app.bar_open_tabs.forceCloseTab(path)
+        self.file_manager.save_queue.flush()
+        shutil.rmtree(self.root)
+
+    def writeFile(self, name, data):
+        """
+        Writes a file into the temporary workspace
+        """
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as file:
+            file.write(data)
+        return path
+
+    def testSwitchDocuments(self):
+        """
+        Tests that switching tabs keeps the text, cursor and undo history of each document
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        cursor = self.document.textCursor()
+        cursor.setPosition(0)
+        cursor.insertText("edited ")
+        cursor.setPosition(3)
+        cursor.setPosition(8, cursor.KeepAnchor)
+        self.document.setTextCursor(cursor)
+
+        text_document = self.document.document()
+
+        self.file_manager.openDocument(self.document, self.second)
+        self.assertEqual(self.document.toPlainText(), "another file\n")
+
+        # the document kept in memory is shown again instead of reading the file
+        self.file_manager.openDocument(self.document, self.first)
+        self.assertIs(self.document.document(), text_document)
+        self.assertEqual(self.document.toPlainText(), "edited first line\nsecond line\n")
+        cursor = self.document.textCursor()
+        self.assertEqual((cursor.anchor(), cursor.position()), (3, 8))
+        self.document.undo()
+        self.assertEqual(self.document.toPlainText(), "first line\nsecond line\n")
+
+    def testCloseDocument(self):
+        """
+        Tests that closing the shown document shows the document of the remaining tab
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.file_manager.openDocument(self.document, self.second)
+        shown = self.document.document()
+
+        test.app.bar_open_tabs.forceCloseTab(self.second)
+        self.assertEqual(self.document.toPlainText(), "first line\nsecond line\n")
+        self.assertNotIn(shown, self.document.highlighters)
+        self.assertEqual(list(self.file_manager.text_documents), [self.first])
+
+    def testHibernation(self):
+        """
+        Tests that documents over the memory budget are hibernated and restored when shown
+        """
+        budget = self.file_manager.residency.budget
+        self.file_manager.residency.budget = 0
+        try:
+            self.file_manager.openDocument(self.document, self.first)
+            cursor = self.document.textCursor()
+            cursor.setPosition(4)
+            self.document.setTextCursor(cursor)
+
+            # the least recently used document is hibernated, the shown one is kept
+            self.file_manager.openDocument(self.document, self.second)
+            self.assertFalse(self.file_manager.isResident(self.first))
+            self.assertTrue(self.file_manager.isResident(self.second))
+            self.assertIn(self.first, test.app.bar_open_tabs.hibernated_tabs)
+            self.assertEqual([r for _, r, _ in self.file_manager.getMemoryUsage()],
+                             [False, True])
+
+            self.file_manager.openDocument(self.document, self.first)
+            self.assertEqual(self.document.toPlainText(), "first line\nsecond line\n")
+            self.assertEqual(self.document.textCursor().position(), 4)
+            self.assertFalse(self.document.document().isModified())
+            self.assertEqual(test.app.bar_open_tabs.hibernated_tabs, {self.second})
+        finally:
+            self.file_manager.residency.budget = budget
+
+    def testDiscardDocument(self):
+        """
+        Tests that a discarded document is read from its file the next time it is shown
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.file_manager.openDocument(self.document, self.second)
+        self.file_manager.discardDocument(self.document, self.first)
+        self.writeFile("first.txt", "replaced\n")
+
+        self.file_manager.openDocument(self.document, self.first)
+        self.assertEqual(self.document.toPlainText(), "replaced\n")
+
+    def testDirtyTracking(self):
+        """
+        Tests that saving checks the modified flag and the hash of the saved data instead of
+        reading the file
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.assertFalse(self.file_manager.isModified(self.document))
+
+        with mock.patch.object(self.file_manager, 'getFileData') as get_file_data, \
+                mock.patch.object(self.file_manager, 'queueFileData',
+                                  wraps=self.file_manager.queueFileData) as queue_file_data:
+            # unchanged documents are not saved
+            self.assertFalse(self.file_manager.saveDocument(self.document))
+
+            # edits that leave the text as it was saved are not written
+            cursor = self.document.textCursor()
+            cursor.insertText("x")
+            cursor.deletePreviousChar()
+            self.assertTrue(self.document.document().isModified())
+            self.assertFalse(self.file_manager.isModified(self.document))
+            self.assertFalse(self.file_manager.saveDocument(self.document))
+            self.assertFalse(self.document.document().isModified())
+
+            cursor.insertText("new ")
+            self.assertTrue(self.file_manager.isModified(self.document))
+            self.assertTrue(self.file_manager.saveDocument(self.document))
+            self.assertFalse(self.file_manager.isModified(self.document))
+            get_file_data.assert_not_called()
+            self.assertEqual(queue_file_data.call_count, 1)
+
+    def testSaveQueue(self):
+        """
+        Tests that saves are written in the background and that repeated saves of a file
+        write its latest data
+        """
+        queue = self.file_manager.save_queue
+        with mock.patch('LeafNote.Utils.SaveQueue.atomicWrite',
+                        wraps=atomicWrite) as atomic_write:
+            with queue.condition:
+                # keep the worker from writing until every save is queued
+                for text in ("one", "two", "three"):
+                    queue.enqueue(self.first, text)
+                self.assertEqual(list(queue.pending), [self.first])
+            queue.waitFor(self.first)
+        self.assertEqual(atomic_write.call_count, 1)
+        self.assertFalse(queue.isPending(self.first))
+        self.assertIsNotNone(queue.lastWriteStamp(self.first))
+        with open(self.first, 'r') as file:
+            self.assertEqual(file.read(), "three")
+        self.assertEqual(sorted(os.listdir(self.root)), ["first.txt", "second.txt"])
+
+    def testProgressiveLoading(self):
+        """
+        Tests that large files are shown before they are loaded completely and that the
+        appended chunks are neither edits nor undoable
+        """
+        data = "".join("line %d\n" % i for i in range(20))
+        path = self.writeFile("large.txt", data)
+        doc_props = test.app.doc_props
+        with mock.patch.object(doc_props, 'progressive_load_size', 10), \
+                mock.patch.object(doc_props, 'load_chunk_size', 16):
+            self.file_manager.openDocument(self.document, path)
+            self.assertTrue(self.document.isLoading())
+            self.assertTrue(self.document.isReadOnly())
+            self.assertEqual(self.document.toPlainText(), data[:16])
+
+            while self.document.isLoading():
+                self.document.loadNextChunk()
+        self.assertEqual(self.document.toPlainText(), data)
+        self.assertFalse(self.document.isReadOnly())
+        self.assertFalse(self.document.document().isModified())
+        self.assertFalse(self.document.document().isUndoAvailable())
+        self.assertEqual(test.app.bottom_bar.label_cc.text(), "%d Characters" % len(data))
+
+    def testCancelLoading(self):
+        """
+        Tests that a cancelled load keeps the loaded part, which can not be saved
+        """
+        data = "".join("line %d\n" % i for i in range(20))
+        path = self.writeFile("large.txt", data)
+        doc_props = test.app.doc_props
+        with mock.patch.object(doc_props, 'progressive_load_size', 10), \
+                mock.patch.object(doc_props, 'load_chunk_size', 16):
+            self.file_manager.openDocument(self.document, path)
+            self.document.loadNextChunk()
+            self.document.cancelLoading()
+        self.assertFalse(self.document.isLoading())
+        self.assertTrue(self.document.isPartial())
+        self.assertTrue(self.document.isReadOnly())
+        self.assertEqual(self.document.toPlainText(), data[:32])
+
+        self.document.textCursor().insertText("x")
+        self.assertFalse(self.file_manager.saveDocument(self.document))
+        with open(path, 'r') as file:
+            self.assertEqual(file.read(), data)
+
+    def testModifiedBackgroundDocuments(self):
+        """
+        Tests that the changes of tabs that are not shown, in memory or hibernated, are found
+        and saved
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.document.textCursor().insertText("first ")
+        # switching without saving, as after a failed save
+        self.file_manager.openDocument(self.document, self.second, False)
+        self.assertEqual(self.file_manager.getModifiedDocuments(self.document), [self.first])
+
+        self.document.textCursor().insertText("second ")
+        self.file_manager.hibernateDocument(self.document, self.first)
+        self.assertEqual(self.file_manager.getModifiedDocuments(self.document), [self.first])
+
+        self.assertTrue(self.file_manager.saveOpenDocument(self.document, self.first))
+        self.file_manager.save_queue.flush()
+        with open(self.first, 'r') as file:
+            self.assertEqual(file.read(), "first first line\nsecond line\n")
+        self.assertEqual(self.file_manager.getModifiedDocuments(self.document), [])
+        self.assertTrue(self.file_manager.isModified(self.document))
+
+    def testOverlappingLoads(self):
+        """
+        Tests that a large file opened while another one loads does not stop either load
+        """
+        first = "".join("first %d\n" % i for i in range(20))
+        second = "".join("second %d\n" % i for i in range(20))
+        first_path = self.writeFile("first_large.txt", first)
+        second_path = self.writeFile("second_large.txt", second)
+        doc_props = test.app.doc_props
+        with mock.patch.object(doc_props, 'progressive_load_size', 10), \
+                mock.patch.object(doc_props, 'load_chunk_size', 16):
+            self.file_manager.openDocument(self.document, first_path)
+            self.document.loadNextChunk()
+            self.file_manager.openDocument(self.document, second_path)
+            first_document = self.file_manager.text_documents[first_path]
+            self.assertTrue(self.document.isLoading(first_document))
+            self.assertTrue(self.document.isLoading())
+
+            # the shown document is loaded first, then the one in the background
+            while self.document.isLoading():
+                self.document.loadNextChunk()
+            self.assertTrue(self.document.isLoading(first_document))
+            while self.document.isLoading(first_document):
+                self.document.loadNextChunk()
+        self.assertEqual(self.document.toPlainText(), second)
+        self.assertEqual(first_document.toPlainText(), first)
+        self.assertFalse(self.document.isPartial(first_document))
+        self.assertFalse(self.document.isReadOnly())
+
+        self.file_manager.openDocument(self.document, first_path)
+        self.assertFalse(self.document.isReadOnly())
+        self.assertEqual(self.document.toPlainText(), first)
+
+    def testPlainTextEditor(self):
+        """
+        Tests that plain text files are edited by the plain text editor and formatted files by
+        the rich text editor
+        """
+        lef = self.writeFile("notes.lef", "<p>formatted</p>")
+        self.file_manager.openDocument(self.document, self.first)
+        plain_editor = self.document.plain_editor
+        self.assertIs(self.document.getEditor(), plain_editor)
+        self.assertIs(self.document.document(), plain_editor.document())
+        self.assertTrue(self.document.isHidden())
+        self.assertFalse(plain_editor.isHidden())
+
+        self.document.textCursor().insertText("typed ")
+        self.assertEqual(plain_editor.toPlainText(), "typed first line\nsecond line\n")
+        self.assertEqual(test.app.bottom_bar.label_wc.text(), "5 Words")
+
+        self.file_manager.openDocument(self.document, lef)
+        self.assertIs(self.document.getEditor(), self.document)
+        self.assertEqual(self.document.toPlainText(), "formatted")
+        self.assertFalse(self.document.isHidden())
+        self.assertTrue(plain_editor.isHidden())
+
+        self.file_manager.openDocument(self.document, self.first)
+        self.document.undo()
+        self.assertEqual(self.document.toPlainText(), "first line\nsecond line\n")
+
+    def testExternalChange(self):
+        """
+        Tests that a document without unsaved changes follows its file when another program
+        changes it, while the writes of the file manager are ignored
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.assertTrue(self.file_manager.file_watcher.isWatched(self.first))
+        cursor = self.document.textCursor()
+        cursor.setPosition(12)
+        self.document.setTextCursor(cursor)
+
+        self.writeFile("first.txt", "new first line\nsecond line\n")
+        with mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec') as dialog:
+            self.file_manager.onExternalChange(self.first)
+            dialog.assert_not_called()
+        self.assertEqual(self.document.toPlainText(), "new first line\nsecond line\n")
+        self.assertFalse(self.document.document().isModified())
+        # only the changed line was replaced
+        self.assertEqual(self.document.textCursor().position(), 16)
+
+        self.document.textCursor().insertText("x")
+        self.file_manager.saveDocument(self.document)
+        self.file_manager.save_queue.flush()
+        self.file_manager.onExternalChange(self.first)
+        self.assertEqual(self.document.toPlainText(), "new first line\nsxecond line\n")
+
+        test.app.bar_open_tabs.forceCloseTab(self.first)
+        self.assertFalse(self.file_manager.file_watcher.isWatched(self.first))
+
+    def testOwnWriteIgnored(self):
+        """
+        Tests that the files written by the file manager are not read back when the watcher
+        reports them
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.document.textCursor().insertText("x")
+        self.file_manager.saveDocument(self.document)
+        self.file_manager.save_queue.flush()
+        with mock.patch.object(self.file_manager, 'readFileData',
+                               return_value=None) as read_file_data:
+            self.file_manager.onExternalChange(self.first)
+            self.file_manager.writeFileData(self.first, "written\n")
+            self.file_manager.onExternalChange(self.first)
+            read_file_data.assert_not_called()
+
+            self.writeFile("first.txt", "changed by another program\n")
+            self.file_manager.onExternalChange(self.first)
+            read_file_data.assert_called_once_with(self.first)
+
+    def testMergeExternalChange(self):
+        """
+        Tests that the changes of another program are merged with the unsaved changes of the
+        document or replaced as chosen by the user
+        """
+        self.file_manager.openDocument(self.document, self.first)
+        self.document.textCursor().insertText("my ")
+        self.writeFile("first.txt", "first line\nsecond line\nthird line\n")
+
+        with mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec', return_value=1):
+            self.file_manager.onExternalChange(self.first)
+        merged = "my first line\nsecond line\nthird line\n"
+        self.assertEqual(self.document.toPlainText(), merged)
+        self.assertTrue(self.file_manager.isModified(self.document))
+        self.document.undo()
+        self.assertEqual(self.document.toPlainText(), "my first line\nsecond line\n")
+        self.document.redo()
+
+        # the file on disk is the base of the next merge
+        self.writeFile("first.txt", "first line\nsecond line\nlast line\n")
+        with mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec', return_value=1):
+            self.file_manager.onExternalChange(self.first)
+        self.assertEqual(self.document.toPlainText(), "my first line\nsecond line\nlast line\n")
+
+        self.writeFile("first.txt", "theirs\n")
+        with mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec', return_value=2):
+            self.file_manager.onExternalChange(self.first)
+        self.assertEqual(self.document.toPlainText(), "theirs\n")
+        self.assertFalse(self.file_manager.isModified(self.document))
+
+    def testMixedEncryption(self):
+        """
+        Tests that the files of a partly encrypted workspace are told apart by their header,
+        plain files are read without running them through the cipher
+        """
+        encryptor = Encryptor(Fernet.generate_key())
+        encrypted = os.path.join(self.root, "encrypted.txt")
+        atomicWrite(encrypted, encryptor.encryptData(b"secret line\r\nnext line\n"))
+        damaged = os.path.join(self.root, "damaged.txt")
+        atomicWrite(damaged, encryptor.encryptData(b"damaged line\n")[:-1])
+
+        with mock.patch.object(self.file_manager, 'encryptor', encryptor), \
+                mock.patch.object(encryptor.cipher, 'decrypt',
+                                  wraps=encryptor.cipher.decrypt) as decrypt, \
+                mock.patch('LeafNote.Utils.FileManager.DialogBuilder.exec') as dialog:
+            self.assertEqual(self.file_manager.getFileData(self.first),
+                             "first line\nsecond line\n")
+            decrypt.assert_not_called()
+            self.assertEqual(self.file_manager.getFileData(encrypted),
+                             "secret line\nnext line\n")
+            self.assertTrue(self.file_manager.isSaved(encrypted, "secret line\nnext line\n"))
+            dialog.assert_not_called()
+            self.assertIsNone(self.file_manager.getFileData(damaged))
+            dialog.assert_called_once()
+
+    def testAtomicWritePermissions(self):
+        """
+        Tests that new files get the mode of files created with open and that replaced files
+        keep their mode
+        """
+        path = os.path.join(self.root, "new.txt")
+        atomicWrite(path, b"new\n")
+        self.assertEqual(os.stat(path).st_mode & 0o777, NEW_FILE_MODE)
+
+        os.chmod(self.first, 0o640)
+        atomicWrite(self.first, b"replaced\n")
+        self.assertEqual(os.stat(self.first).st_mode & 0o777, 0o640)
@@ -0,0 +1,56 @@
+"""
+test LineMerge behaviors.
+"""
+import unittest
+
+from LeafNote.Utils.LineMerge import getOpcodes, merge, splitLines, CONFLICT_MINE, \
+    CONFLICT_THEIRS
+
+
+class TestLineMerge(unittest.TestCase):
+    """
+    Unit test for comparing and merging the lines of texts
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.base = "one\ntwo\nthree\nfour\nfive\n"
+
+    def testOpcodes(self):
+        """
+        Tests that the opcodes turn the old lines into the new ones while keeping the most lines
+        """
+        old = splitLines("a\nb\nc\na\nb\nb\na\n")
+        new = splitLines("c\nb\na\nb\na\nc\n")
+        opcodes = getOpcodes(old, new)
+        result = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            result.extend(old[i1:i2] if tag == 'equal' else new[j1:j2])
+            if tag == 'equal':
+                self.assertEqual(old[i1:i2], new[j1:j2])
+        self.assertEqual(result, new)
+        # the longest common subsequence of the lines has four lines
+        self.assertEqual(sum(i2 - i1 for tag, i1, i2, _, _ in opcodes if tag == 'equal'), 4)
+        self.assertEqual(getOpcodes([], []), [])
+
+    def testMerge(self):
+        """
+        Tests that changes to different lines are combined
+        """
+        mine = self.base.replace("one", "ONE") + "six\n"
+        theirs = self.base.replace("four", "FOUR").replace("three\n", "")
+        self.assertEqual(merge(self.base, mine, theirs), ("ONE\ntwo\nFOUR\nfive\nsix\n", 0))
+        # the same change made by both is taken once
+        self.assertEqual(merge(self.base, mine, mine), (mine, 0))
+
+    def testConflict(self):
+        """
+        Tests that lines changed differently by both are kept between conflict markers
+        """
+        merged, conflicts = merge(self.base, self.base.replace("two", "mine"),
+                                  self.base.replace("two", "theirs") + "six")
+        self.assertEqual(conflicts, 1)
+        self.assertEqual(merged, "one\n" + CONFLICT_MINE + "mine\n=======\ntheirs\n" +
+                         CONFLICT_THEIRS + "three\nfour\nfive\nsix")
@@ -0,0 +1,108 @@
+"""
+test MappedFile and the mapped viewer behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import test
+
+from cryptography.fernet import Fernet
+
+from LeafNote.Utils.ChunkedCipher import ChunkedCipher
+from LeafNote.Utils.MappedFile import MappedFile, BLOCK_SIZE
+
+
+class TestMappedFile(unittest.TestCase):
+    """
+    Unit test for viewing files that are too large for the document
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.document = test.app.document
+        self.file_manager = test.app.file_manager
+        self.document.setPlainText("")
+        self.root = tempfile.mkdtemp()
+        self.lines = ["line %d é" % i for i in range(3 * BLOCK_SIZE // 10)]
+        self.path = os.path.join(self.root, "huge.txt")
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write("\n".join(self.lines) + "\n")
+
+    def tearDown(self):
+        """
+        Close the documents and remove the temporary workspace
+        """
+        for path in list(self.file_manager.open_documents):
+            test.app.bar_open_tabs.forceCloseTab(path)
+        shutil.rmtree(self.root)
+
+    def testLines(self):
+        """
+        Tests that lines are found through the sparse index across blocks
+        """
+        mapped_file = MappedFile(self.path)
+        try:
+            mapped_file.waitForIndex()
+            self.assertTrue(mapped_file.isIndexed())
+            self.assertGreater(len(mapped_file.block_lines), 3)
+            self.assertEqual(mapped_file.getLineCount(), len(self.lines) + 1)
+            lines = self.lines + [""]
+            for first in (0, 1, 6000, 6553, len(self.lines) - 2):
+                self.assertEqual(mapped_file.getLines(first, 3), lines[first:first + 3])
+
+            offset = mapped_file.find("line 12345 ".encode('utf-8'), 0)
+            self.assertEqual(mapped_file.getPosition(offset), (12345, 0))
+            offset = mapped_file.find("é".encode('utf-8'), offset, True)
+            self.assertEqual(mapped_file.getPosition(offset), (12344, 11))
+        finally:
+            mapped_file.close()
+
+    def testEncryptedFile(self):
+        """
+        Tests that lines of an encrypted file are read by decrypting the segments holding them
+        """
+        cipher = ChunkedCipher(Fernet.generate_key(), 4096)
+        with open(self.path, 'rb') as file:
+            data = cipher.encrypt(file.read())
+        with open(self.path, 'wb') as file:
+            file.write(data)
+
+        mapped_file = MappedFile(self.path, cipher)
+        try:
+            mapped_file.waitForIndex()
+            self.assertEqual(mapped_file.getLineCount(), len(self.lines) + 1)
+            lines = self.lines + [""]
+            for first in (0, 6553, len(self.lines) - 2):
+                self.assertEqual(mapped_file.getLines(first, 3), lines[first:first + 3])
+            offset = mapped_file.find("line 12345 ".encode('utf-8'), 0)
+            self.assertEqual(mapped_file.getPosition(offset), (12345, 0))
+        finally:
+            mapped_file.close()
+
+    def testOpenHugeFile(self):
+        """
+        Tests that files over the size threshold are shown read only by the mapped viewer
+        """
+        with mock.patch.object(test.app.app_props, 'mapped_file_size', 1024):
+            self.assertTrue(self.file_manager.openDocument(self.document, self.path))
+        self.assertTrue(self.file_manager.isMapped(self.path))
+        self.assertFalse(test.app.viewer.isHidden())
+        self.assertTrue(self.document.isHidden())
+        self.assertEqual(self.document.toPlainText(), "")
+
+        test.app.viewer.search_bar.setText("line 12345 ")
+        self.assertTrue(test.app.viewer.find(False))
+        self.assertEqual(test.app.viewer.view.match, (12345, 0, 11))
+
+        self.document.textCursor().insertText("x")
+        self.assertFalse(self.file_manager.saveDocument(self.document))
+
+        test.app.bar_open_tabs.forceCloseTab(self.path)
+        self.assertFalse(self.file_manager.isMapped(self.path))
+        self.assertTrue(test.app.viewer.isHidden())
+        self.assertFalse(self.document.isHidden())
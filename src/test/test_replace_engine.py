@@ -0,0 +1,95 @@
+"""
+test ReplaceEngine behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import test
+
+from LeafNote.Utils.ReplaceEngine import ReplaceEngine, replaceLef
+from LeafNote.Utils.SearchEngine import SearchPattern
+
+
+class TestReplaceEngine(unittest.TestCase):
+    """
+    Unit test for replacing across the workspace
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.engine = ReplaceEngine(test.app.file_manager)
+        self.root = tempfile.mkdtemp()
+        self.txt = self.writeFile("notes.txt", "cat\\dog cat\ncatalog\n")
+        self.lef = self.writeFile("notes.lef", "<html><head><style>cat</style></head>"
+                                               "<body><p class=\"cat\">a cat</p></body></html>")
+
+    def tearDown(self):
+        """
+        Remove the temporary workspace
+        """
+        shutil.rmtree(self.root)
+
+    def writeFile(self, name, data):
+        """
+        Writes a file into the temporary workspace
+        """
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as file:
+            file.write(data)
+        return path
+
+    def readFile(self, path):
+        """
+        Reads a file from the temporary workspace
+        """
+        with open(path, 'r') as file:
+            return file.read()
+
+    def testDryRun(self):
+        """
+        Tests that a dry run reports the changes without writing them
+        """
+        results = self.engine.replaceAll([self.txt, self.lef], SearchPattern("cat", False, True),
+                                         "a\\1", True)
+        self.assertEqual({(r.path, r.count) for r in results}, {(self.txt, 2), (self.lef, 1)})
+        diff = [r.diff for r in results if r.path == self.txt][0]
+        self.assertIn("+a\\1\\dog a\\1\n", diff)
+        self.assertEqual(self.readFile(self.txt), "cat\\dog cat\ncatalog\n")
+        self.assertEqual(sorted(os.listdir(self.root)), ["notes.lef", "notes.txt"])
+
+    def testReplaceAll(self):
+        """
+        Tests that matches are replaced in the text but not in the markup of .lef files
+        """
+        results = self.engine.replaceAll([self.txt, self.lef], SearchPattern("cat"), "<x>")
+        self.assertEqual(sum(r.count for r in results), 4)
+        self.assertEqual(self.readFile(self.txt), "<x>\\dog <x>\n<x>alog\n")
+        self.assertEqual(self.readFile(self.lef),
+                         "<html><head><style>cat</style></head>"
+                         "<body><p class=\"cat\">a &lt;x&gt;</p></body></html>")
+        # no temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.root)), ["notes.lef", "notes.txt"])
+
+    def testReplaceAcrossFormatting(self):
+        """
+        Tests that matches spanning formatting are replaced in .lef files and matches spanning
+        lines are reported as skipped
+        """
+        self.assertEqual(replaceLef("<p>hello <b>world</b></p>", SearchPattern("hello world"),
+                                    "X"), ("<p>X<b></b></p>", 1, 0))
+        self.assertEqual(replaceLef("<p>a &amp; <i>b</i> c</p>", SearchPattern("& b c"), "d"),
+                         ("<p>a d<i></i></p>", 1, 0))
+        data = "<p>one</p><p>two</p>"
+        self.assertEqual(replaceLef(data, SearchPattern(r"one\ntwo", regex=True), "X"),
+                         (data, 0, 1))
+
+        lef = self.writeFile("split.lef", "<p>a <b>cat</b>alog</p><p>ca</p><p>t</p>")
+        preview = self.engine.replaceAll([lef], SearchPattern("catalog"), "dog", True)
+        self.assertEqual([(r.count, r.skipped) for r in preview], [(1, 0)])
+        results = self.engine.replaceAll([lef], SearchPattern(r"ca\n?t", regex=True), "dog")
+        self.assertEqual([(r.count, r.skipped) for r in results], [(1, 1)])
+        self.assertEqual(self.readFile(lef), "<p>a <b>dog</b>alog</p><p>ca</p><p>t</p>")
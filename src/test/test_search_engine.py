@@ -0,0 +1,147 @@
+"""
+test SearchEngine behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import test
+
+from LeafNote.Layout.Utils.SearchWorkspace import SearchThread, SearchWorkspace
+from LeafNote.Utils.SearchEngine import SearchEngine, SearchPattern
+
+
+class TestSearchEngine(unittest.TestCase):
+    """
+    Unit test for the workspace search engine
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.engine = SearchEngine(test.app.file_manager)
+        self.root = tempfile.mkdtemp()
+        self.txt = os.path.join(self.root, "notes.txt")
+        with open(self.txt, 'w', encoding='utf-8') as file:
+            file.write("Café test, Test_case and testing")
+        self.lef = os.path.join(self.root, "notes.lef")
+        with open(self.lef, 'w', encoding='utf-8') as file:
+            file.write("<html><head><style>test</style></head>"
+                       "<body><p>a &lt;test&gt;</p></body></html>")
+
+    def tearDown(self):
+        """
+        Remove the temporary workspace
+        """
+        shutil.rmtree(self.root)
+
+    def testFindAll(self):
+        """
+        Tests the offsets returned for each of the search options
+        """
+        self.assertEqual(self.engine.findAll(self.txt, SearchPattern("test")),
+                         [(5, 9), (11, 15), (25, 29)])
+        self.assertEqual(self.engine.findAll(self.txt, SearchPattern("Test", True)),
+                         [(11, 15)])
+        self.assertEqual(self.engine.findAll(self.txt, SearchPattern("test", False, True)),
+                         [(5, 9), (11, 15)])
+        self.assertEqual(self.engine.findAll(self.txt, SearchPattern(r"t\w+g", regex=True)),
+                         [(25, 32)])
+        self.assertEqual(self.engine.findAll(self.txt, SearchPattern("café")), [(0, 4)])
+
+    def testLef(self):
+        """
+        Tests that .lef files are searched by the text the user sees
+        """
+        self.assertEqual(self.engine.findAll(self.lef, SearchPattern("<test>")), [(2, 8)])
+        self.assertFalse(self.engine.contains(self.lef, SearchPattern("style")))
+        self.assertIn(self.lef, self.engine.text_cache)
+
+    def testRefines(self):
+        """
+        Tests when the matches of a search can be narrowed down from the previous search
+        """
+        self.assertTrue(SearchPattern("Test").refines(SearchPattern("te")))
+        self.assertFalse(SearchPattern("Test", True).refines(SearchPattern("te", True)))
+        self.assertFalse(SearchPattern("test", False, True).refines(SearchPattern("te")))
+        self.assertFalse(SearchPattern("test", regex=True).refines(SearchPattern("te")))
+        self.assertFalse(SearchPattern("abab").refines(SearchPattern("aba")))
+        self.assertFalse(SearchPattern("test").refines(None))
+
+    def testSnippets(self):
+        """
+        Tests the lines kept around each match
+        """
+        with open(self.txt, 'w', encoding='utf-8') as file:
+            file.write("one\ntwo café\nthree test\nfour\nfive test")
+        for pattern in (SearchPattern("test"), SearchPattern("test", False, True)):
+            matches, snippets = self.engine.findSnippets(self.txt, pattern, 1, 5)
+            self.assertEqual(matches, [(19, 23), (34, 38)])
+            self.assertEqual(snippets[0].line, 2)
+            self.assertEqual(snippets[0].text, "two café\nthree test\nfour")
+            self.assertEqual(snippets[0].text[snippets[0].start:snippets[0].end], "test")
+            self.assertEqual(snippets[1][:2], (4, "four\nfive test"))
+
+        _, snippets = self.engine.findSnippets(self.txt, SearchPattern("test"), 0, 1)
+        self.assertEqual(snippets, [(3, "three test", 6, 10)])
+
+    def testSearchThread(self):
+        """
+        Tests that the search thread reports results while it runs and reports nothing after
+        it was cancelled
+        """
+        files = ["file%d" % i for i in range(100)]
+        batches = []
+        thread = SearchThread(files, lambda path: path if path != "file1" else None)
+        thread.batch_interval = 0
+        thread.results_found.connect(batches.append)
+        thread.run()
+        self.assertGreater(len(batches), 1)
+        self.assertEqual([path for batch in batches for path, _ in batch],
+                         [path for path in files if path != "file1"])
+
+        batches = []
+        thread = SearchThread(files, lambda path: path)
+        thread.batch_interval = 0
+
+        def onResults(batch):
+            """
+            Cancels the search once the first results arrived
+            """
+            batches.append(batch)
+            thread.cancel()
+
+        thread.results_found.connect(onResults)
+        thread.run()
+        self.assertEqual(len(batches), 1)
+        self.assertTrue(thread.isCancelled())
+
+    def testLineAnchors(self):
+        """
+        Tests that ^ and $ match at every line of a file and that the matches found by the
+        search are the ones selected in the shown file
+        """
+        path = os.path.join(self.root, "lines.txt")
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("bar foo\nfoo 😀 foo\nfoo\n")
+        search_workspace = SearchWorkspace(test.app.document, test.app.file_manager, self.root)
+        search_workspace.regex_search.setChecked(True)
+        search_workspace.onChanged("^foo")
+        search_workspace.search_thread.wait()
+        test.ctx.processEvents()
+        self.assertIn(path, search_workspace.files)
+
+        item = search_workspace.file_viewer.model.item(search_workspace.files.index(path))
+        self.assertEqual(item.matches, [(8, 11), (18, 21)])
+        search_workspace.showFile(item)
+        cursor = search_workspace.display.textCursor()
+        self.assertEqual((cursor.selectionStart(), cursor.selectionEnd()), (8, 11))
+        # the emoji before the second match takes two cursor positions
+        search_workspace.onNextOccurrenceSelect()
+        cursor = search_workspace.display.textCursor()
+        self.assertEqual((cursor.selectionStart(), cursor.selectionEnd()), (19, 22))
+        search_workspace.onPreviousOccurrenceSelect()
+        self.assertEqual(search_workspace.display.textCursor().selectionStart(), 8)
+        search_workspace.deleteLater()
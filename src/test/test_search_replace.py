@@ -0,0 +1,116 @@
+"""
+test SearchReplace behaviors.
+"""
+import unittest
+
+import test
+
+
+class TestSearchReplace(unittest.TestCase):
+    """
+    Unit test for searching and replacing in the current document
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.document = test.app.document
+        self.search = test.app.search_and_replace.search
+        self.replace = test.app.search_and_replace.replace
+        self.search.case_sensitive.setChecked(False)
+        self.search.whole_word.setChecked(False)
+        self.search.regex_search.setChecked(False)
+
+    def tearDown(self):
+        """
+        Clear the search bars
+        """
+        self.search.search_bar.setText("")
+        self.search.search_debouncer.flush()
+        self.replace.replace_bar.setText("")
+        self.document.setPlainText("")
+
+    def testReplaceAll(self):
+        """
+        Tests that every match is replaced and that a single undo restores the document
+        """
+        text = "foo bar Foo\nfood foo\n" * 50
+        self.document.setPlainText(text)
+        self.search.whole_word.setChecked(True)
+        self.search.search_bar.setText("foo")
+        self.search.search_debouncer.flush()
+        self.replace.replace_bar.setText("qux")
+
+        self.replace.onReplaceAll()
+        self.assertEqual(self.document.toPlainText(), "qux bar qux\nfood qux\n" * 50)
+
+        self.document.undo()
+        self.assertEqual(self.document.toPlainText(), text)
+
+    def testOccurrences(self):
+        """
+        Tests that whole words next to punctuation are counted
+        """
+        self.document.setPlainText("foo, (foo) foo.bar food")
+        self.search.whole_word.setChecked(True)
+        self.search.search_bar.setText("foo")
+        self.search.search_debouncer.flush()
+        self.assertEqual(self.search.total, 3)
+        self.assertEqual(self.search.occurances.text(), "1/3")
+
+        self.search.onNextOccurrenceSelect()
+        self.search.onNextOccurrenceSelect()
+        self.assertEqual(self.search.occurances.text(), "3/3")
+        self.assertEqual(self.document.textCursor().selectionStart(), 11)
+        self.search.onPreviousOccurrenceSelect()
+        self.assertEqual(self.search.occurances.text(), "2/3")
+        self.assertEqual(self.document.textCursor().selectionStart(), 6)
+
+    def testIncrementalUpdate(self):
+        """
+        Tests that edits to the document keep the match index in sync with a full scan
+        """
+        self.document.setPlainText("foo bar\nbaz foo\n" * 20)
+        self.search.search_bar.setText("foo")
+        self.search.search_debouncer.flush()
+        self.assertEqual(self.search.total, 40)
+
+        cursor = self.document.textCursor()
+        cursor.setPosition(4)
+        cursor.insertText("foo ")
+        cursor.setPosition(20)
+        cursor.setPosition(40, cursor.KeepAnchor)
+        cursor.insertText("x\nfoofoo")
+        cursor.setPosition(cursor.position() - 1)
+        cursor.deletePreviousChar()
+
+        index = self.search.match_index
+        expected = list(index.pattern.finditer(self.document.toPlainText()))
+        self.assertEqual(list(zip(index.starts, index.ends)), expected)
+        self.assertEqual(self.search.total, len(expected))
+
+    def testRefinedSearch(self):
+        """
+        Tests that typing runs the search once and that extending the search refines it
+        """
+        self.document.setPlainText("aaaaaa ab Abc\nabcd abc")
+        self.search.search_bar.setText("a")
+        self.search.search_bar.setText("ab")
+        self.assertTrue(self.search.search_debouncer.isPending())
+        self.assertEqual(self.search.total, 0)
+
+        self.search.onNextOccurrenceSelect()
+        self.assertFalse(self.search.search_debouncer.isPending())
+        self.assertEqual(self.search.total, 4)
+
+        self.search.search_bar.setText("abc")
+        self.search.search_debouncer.flush()
+        self.assertEqual(self.search.match_index.starts, [10, 14, 19])
+
+        # matches of a phrase that overlaps itself can not be refined
+        self.search.search_bar.setText("aa")
+        self.search.search_debouncer.flush()
+        self.search.search_bar.setText("aaa")
+        self.search.search_debouncer.flush()
+        self.assertEqual(self.search.match_index.starts, [0, 3])
@@ -0,0 +1,73 @@
+"""
+test Session behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from PyQt5.QtCore import QSettings
+
+import test
+
+from LeafNote.Utils import Session
+
+
+class TestSession(unittest.TestCase):
+    """
+    Unit test for restoring the open tabs of the last session
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.document = test.app.document
+        self.file_manager = test.app.file_manager
+        self.bar_open_tabs = test.app.bar_open_tabs
+        self.document.setPlainText("")
+        self.root = tempfile.mkdtemp()
+        self.settings = QSettings(os.path.join(self.root, "settings.ini"), QSettings.IniFormat)
+        self.session = Session(test.app, self.settings)
+        self.paths = []
+        for name in ("first.txt", "second.txt", "third.txt"):
+            path = os.path.join(self.root, name)
+            with open(path, 'w') as file:
+                file.write(name + "\nsecond line\n")
+            self.paths.append(path)
+
+    def tearDown(self):
+        """
+        Close the documents and remove the temporary workspace
+        """
+        for path in list(self.file_manager.open_documents):
+            self.bar_open_tabs.forceCloseTab(path)
+        shutil.rmtree(self.root)
+
+    def testRestore(self):
+        """
+        Tests that the tabs are restored with only the current document read
+        """
+        for path in self.paths:
+            self.file_manager.openDocument(self.document, path)
+        cursor = self.document.textCursor()
+        cursor.setPosition(3)
+        self.document.setTextCursor(cursor)
+        self.file_manager.openDocument(self.document, self.paths[1])
+        self.session.save()
+        for path in self.paths:
+            self.bar_open_tabs.forceCloseTab(path)
+
+        os.remove(self.paths[0])
+        self.assertTrue(self.session.restore())
+        self.assertEqual(self.bar_open_tabs.count(), 2)
+        self.assertEqual(self.file_manager.current_document.absoluteFilePath(), self.paths[1])
+        self.assertEqual(self.document.toPlainText(), "second.txt\nsecond line\n")
+        self.assertFalse(self.file_manager.isResident(self.paths[2]))
+        self.assertIn(self.paths[2], self.bar_open_tabs.hibernated_tabs)
+
+        # the other tabs are read when they are shown
+        self.bar_open_tabs.setCurrentIndex(self.bar_open_tabs.getTabIndex(self.paths[2]))
+        self.assertEqual(self.document.toPlainText(), "third.txt\nsecond line\n")
+        self.assertEqual(self.document.textCursor().position(), 3)
+        self.assertNotIn(self.paths[2], self.bar_open_tabs.hibernated_tabs)
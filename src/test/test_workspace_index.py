@@ -0,0 +1,147 @@
+"""
+test WorkspaceIndex behaviors.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cryptography.fernet import Fernet
+
+import test
+
+from LeafNote.Utils.ChunkedCipher import MAGIC
+from LeafNote.Utils.Encryptor import Encryptor
+from LeafNote.Utils.WorkspaceIndex import WorkspaceIndex
+
+
+class TestWorkspaceIndex(unittest.TestCase):
+    """
+    Unit test for the workspace search index
+    """
+
+    def setUp(self):
+        """
+        Set up environment
+        """
+        self.file_manager = test.app.file_manager
+        self.root = tempfile.mkdtemp()
+        self.writeFile("one.txt", "The quick brown fox")
+        self.writeFile("two.lef", "<html><head><style>p {}</style></head>"
+                                  "<body><p>Lazy dogs &amp; cats</p></body></html>")
+
+    def tearDown(self):
+        """
+        Remove the temporary workspace
+        """
+        shutil.rmtree(self.root)
+
+    def writeFile(self, name, data):
+        """
+        Writes a file into the temporary workspace
+        """
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as file:
+            file.write(data)
+        return path
+
+    def testCandidates(self):
+        """
+        Tests that the index narrows searches down to the right files
+        """
+        index = WorkspaceIndex(self.root, self.file_manager)
+        index.refresh()
+        one = os.path.join(self.root, "one.txt")
+        two = os.path.join(self.root, "two.lef")
+
+        self.assertEqual(index.candidates("quick"), {one})
+        self.assertEqual(index.candidates("uic"), {one})
+        self.assertEqual(index.candidates("uic", True), set())
+        self.assertEqual(index.candidates("dogs & ca"), {two})
+        # the html markup of .lef files is not indexed
+        self.assertEqual(index.candidates("style"), set())
+        self.assertIsNone(index.candidates("&"))
+
+    def testIncrementalUpdate(self):
+        """
+        Tests that the index is persisted and picks up changed files
+        """
+        index = WorkspaceIndex(self.root, self.file_manager)
+        index.refresh()
+
+        # a fresh index loads the saved tokens from disk
+        index = WorkspaceIndex(self.root, self.file_manager)
+        self.assertEqual(len(index.getAllFiles()), 2)
+
+        path = self.writeFile("one.txt", "A slow red fox jumps")
+        index.update(path)
+        self.assertEqual(index.candidates("slow"), {path})
+        self.assertEqual(index.candidates("quick"), set())
+
+        os.remove(path)
+        index.refresh()
+        self.assertEqual(index.getAllFiles(), [os.path.join(self.root, "two.lef")])
+
+    def testRegexCandidates(self):
+        """
+        Tests that regular expressions are narrowed down by the literals they require
+        """
+        index = WorkspaceIndex(self.root, self.file_manager)
+        index.refresh()
+        one = os.path.join(self.root, "one.txt")
+        two = os.path.join(self.root, "two.lef")
+
+        self.assertEqual(index.candidates(r"qu\w+k", regex=True), {one})
+        self.assertEqual(index.candidates(r"(fox|cats)$", regex=True), {one, two})
+        self.assertEqual(index.candidates(r"brown\s+(wolf|bear)", regex=True), set())
+        # optional or unparsable patterns cannot be narrowed down
+        self.assertIsNone(index.candidates(r"(brown)?\d", regex=True))
+        self.assertIsNone(index.candidates(r"(unclosed", regex=True))
+
+    def testIgnoredFiles(self):
+        """
+        Tests that ignored, binary and oversized files are not indexed
+        """
+        self.writeFile(".leafignore", "# build output\nbuild/\n*.log\n!keep.log\n")
+        os.mkdir(os.path.join(self.root, "build"))
+        self.writeFile(os.path.join("build", "out.txt"), "fox")
+        self.writeFile("debug.log", "fox")
+        keep = self.writeFile("keep.log", "fox")
+        with open(os.path.join(self.root, "image.png"), 'wb') as file:
+            file.write(b"\x89PNG\r\n\x1a\n\0\0fox")
+        large = self.writeFile("large.txt", "fox " * 100)
+
+        max_size = test.app.app_props.max_scan_size
+        test.app.app_props.max_scan_size = 200
+        try:
+            index = WorkspaceIndex(self.root, self.file_manager)
+            index.refresh()
+        finally:
+            test.app.app_props.max_scan_size = max_size
+
+        self.assertEqual(index.getAllFiles(), sorted([os.path.join(self.root, "one.txt"),
+                                                      os.path.join(self.root, "two.lef"),
+                                                      keep]))
+        self.assertFalse(index.contains(os.path.join(self.root, "build", "new.txt")))
+        self.assertTrue(index.contains(large))
+
+    def testEncryptedIndex(self):
+        """
+        Tests that a plain text index is not loaded in an encrypted workspace and that the
+        index is written again encrypted
+        """
+        index = WorkspaceIndex(self.root, self.file_manager)
+        index.refresh()
+        self.assertTrue(os.path.exists(index.getIndexPath()))
+
+        with mock.patch.object(self.file_manager, 'encryptor', Encryptor(Fernet.generate_key())):
+            loaded = WorkspaceIndex(self.root, self.file_manager)
+            self.assertEqual(loaded.getAllFiles(), [])
+            self.assertFalse(os.path.exists(index.getIndexPath()))
+
+            loaded.refresh()
+            with open(loaded.getIndexPath(), 'rb') as file:
+                self.assertTrue(file.read().startswith(MAGIC))
+            self.assertEqual(WorkspaceIndex(self.root, self.file_manager).getAllFiles(),
+                             index.getAllFiles())